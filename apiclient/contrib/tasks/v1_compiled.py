@@ -0,0 +1,512 @@
+# Generated by apiclient.ext.compiler from the discovery document of
+# tasks v1.  Do not edit.
+
+"""Precomputed Resource descriptors for tasks v1."""
+
+FINGERPRINT = '02189150285e88f2c09ca1f033ed6785'
+
+FUTURE_FINGERPRINT = None
+
+SERVICE = {'basePath': u'/tasks/v1/', 'features': []}
+
+AUTH_DISCOVERY = {}
+
+RESOURCE = {'methods': {},
+ 'nextMethods': {},
+ 'resources': {u'tasklists': {'methods': {u'delete': {'argmap': {'fields': 'fields',
+                                                                 'pp': 'pp',
+                                                                 'prettyPrint': 'prettyPrint',
+                                                                 'strict': 'strict',
+                                                                 u'tasklist': u'tasklist',
+                                                                 'trace': 'trace',
+                                                                 'userIp': 'userIp'},
+                                                      'doc': u"Deletes the authenticated user's specified task list.\n\nArgs:\n  tasklist: string, Task list identifier. (required)\n",
+                                                      'enum_params': {},
+                                                      'httpMethod': u'DELETE',
+                                                      'methodId': u'tasks.tasklists.delete',
+                                                      'param_type': {'fields': 'string',
+                                                                     'pp': 'string',
+                                                                     'prettyPrint': 'string',
+                                                                     'strict': 'string',
+                                                                     u'tasklist': u'string',
+                                                                     'trace': 'string',
+                                                                     'userIp': 'string'},
+                                                      'pathUrl': u'users/@me/lists/{tasklist}',
+                                                      'path_params': {u'tasklist': u'tasklist'},
+                                                      'pattern_params': {},
+                                                      'query_params': ['pp',
+                                                                       'trace',
+                                                                       'prettyPrint',
+                                                                       'fields',
+                                                                       'strict',
+                                                                       'userIp'],
+                                                      'repeated_params': [],
+                                                      'required_params': [u'tasklist']},
+                                          u'get': {'argmap': {'fields': 'fields',
+                                                              'pp': 'pp',
+                                                              'prettyPrint': 'prettyPrint',
+                                                              'strict': 'strict',
+                                                              u'tasklist': u'tasklist',
+                                                              'trace': 'trace',
+                                                              'userIp': 'userIp'},
+                                                   'doc': u"Returns the authenticated user's specified task list.\n\nArgs:\n  tasklist: string, Task list identifier. (required)\n",
+                                                   'enum_params': {},
+                                                   'httpMethod': u'GET',
+                                                   'methodId': u'tasks.tasklists.get',
+                                                   'param_type': {'fields': 'string',
+                                                                  'pp': 'string',
+                                                                  'prettyPrint': 'string',
+                                                                  'strict': 'string',
+                                                                  u'tasklist': u'string',
+                                                                  'trace': 'string',
+                                                                  'userIp': 'string'},
+                                                   'pathUrl': u'users/@me/lists/{tasklist}',
+                                                   'path_params': {u'tasklist': u'tasklist'},
+                                                   'pattern_params': {},
+                                                   'query_params': ['pp',
+                                                                    'trace',
+                                                                    'prettyPrint',
+                                                                    'fields',
+                                                                    'strict',
+                                                                    'userIp'],
+                                                   'repeated_params': [],
+                                                   'required_params': [u'tasklist']},
+                                          u'insert': {'argmap': {'body': 'body',
+                                                                 'fields': 'fields',
+                                                                 'pp': 'pp',
+                                                                 'prettyPrint': 'prettyPrint',
+                                                                 'strict': 'strict',
+                                                                 'trace': 'trace',
+                                                                 'userIp': 'userIp'},
+                                                      'doc': u"Creates a new task list and adds it to the authenticated user's task lists.\n\nArgs:\n  body: object, The request body. (required)\n",
+                                                      'enum_params': {},
+                                                      'httpMethod': u'POST',
+                                                      'methodId': u'tasks.tasklists.insert',
+                                                      'param_type': {'body': 'object',
+                                                                     'fields': 'string',
+                                                                     'pp': 'string',
+                                                                     'prettyPrint': 'string',
+                                                                     'strict': 'string',
+                                                                     'trace': 'string',
+                                                                     'userIp': 'string'},
+                                                      'pathUrl': u'users/@me/lists',
+                                                      'path_params': {},
+                                                      'pattern_params': {},
+                                                      'query_params': ['pp',
+                                                                       'trace',
+                                                                       'prettyPrint',
+                                                                       'fields',
+                                                                       'strict',
+                                                                       'userIp'],
+                                                      'repeated_params': [],
+                                                      'required_params': ['body']},
+                                          u'list': {'argmap': {'fields': 'fields',
+                                                               u'maxResults': u'maxResults',
+                                                               u'pageToken': u'pageToken',
+                                                               'pp': 'pp',
+                                                               'prettyPrint': 'prettyPrint',
+                                                               'strict': 'strict',
+                                                               'trace': 'trace',
+                                                               'userIp': 'userIp'},
+                                                    'doc': u"Returns all the authenticated user's task lists.\n\nArgs:\n  pageToken: string, Token specifying the result page to return. Optional.\n  maxResults: string, Maximum number of task lists returned on one page. Optional. The default is 100.\n",
+                                                    'enum_params': {},
+                                                    'httpMethod': u'GET',
+                                                    'methodId': u'tasks.tasklists.list',
+                                                    'param_type': {'fields': 'string',
+                                                                   u'maxResults': u'string',
+                                                                   u'pageToken': u'string',
+                                                                   'pp': 'string',
+                                                                   'prettyPrint': 'string',
+                                                                   'strict': 'string',
+                                                                   'trace': 'string',
+                                                                   'userIp': 'string'},
+                                                    'pathUrl': u'users/@me/lists',
+                                                    'path_params': {},
+                                                    'pattern_params': {},
+                                                    'query_params': ['pp',
+                                                                     'trace',
+                                                                     'prettyPrint',
+                                                                     'strict',
+                                                                     'fields',
+                                                                     u'maxResults',
+                                                                     u'pageToken',
+                                                                     'userIp'],
+                                                    'repeated_params': [],
+                                                    'required_params': []},
+                                          u'patch': {'argmap': {'body': 'body',
+                                                                'fields': 'fields',
+                                                                'pp': 'pp',
+                                                                'prettyPrint': 'prettyPrint',
+                                                                'strict': 'strict',
+                                                                u'tasklist': u'tasklist',
+                                                                'trace': 'trace',
+                                                                'userIp': 'userIp'},
+                                                     'doc': u"Updates the authenticated user's specified task list. This method supports patch semantics.\n\nArgs:\n  body: object, The request body. (required)\n  tasklist: string, Task list identifier. (required)\n",
+                                                     'enum_params': {},
+                                                     'httpMethod': u'PATCH',
+                                                     'methodId': u'tasks.tasklists.patch',
+                                                     'param_type': {'body': 'object',
+                                                                    'fields': 'string',
+                                                                    'pp': 'string',
+                                                                    'prettyPrint': 'string',
+                                                                    'strict': 'string',
+                                                                    u'tasklist': u'string',
+                                                                    'trace': 'string',
+                                                                    'userIp': 'string'},
+                                                     'pathUrl': u'users/@me/lists/{tasklist}',
+                                                     'path_params': {u'tasklist': u'tasklist'},
+                                                     'pattern_params': {},
+                                                     'query_params': ['pp',
+                                                                      'trace',
+                                                                      'prettyPrint',
+                                                                      'fields',
+                                                                      'strict',
+                                                                      'userIp'],
+                                                     'repeated_params': [],
+                                                     'required_params': ['body',
+                                                                         u'tasklist']},
+                                          u'update': {'argmap': {'body': 'body',
+                                                                 'fields': 'fields',
+                                                                 'pp': 'pp',
+                                                                 'prettyPrint': 'prettyPrint',
+                                                                 'strict': 'strict',
+                                                                 u'tasklist': u'tasklist',
+                                                                 'trace': 'trace',
+                                                                 'userIp': 'userIp'},
+                                                      'doc': u"Updates the authenticated user's specified task list.\n\nArgs:\n  body: object, The request body. (required)\n  tasklist: string, Task list identifier. (required)\n",
+                                                      'enum_params': {},
+                                                      'httpMethod': u'PUT',
+                                                      'methodId': u'tasks.tasklists.update',
+                                                      'param_type': {'body': 'object',
+                                                                     'fields': 'string',
+                                                                     'pp': 'string',
+                                                                     'prettyPrint': 'string',
+                                                                     'strict': 'string',
+                                                                     u'tasklist': u'string',
+                                                                     'trace': 'string',
+                                                                     'userIp': 'string'},
+                                                      'pathUrl': u'users/@me/lists/{tasklist}',
+                                                      'path_params': {u'tasklist': u'tasklist'},
+                                                      'pattern_params': {},
+                                                      'query_params': ['pp',
+                                                                       'trace',
+                                                                       'prettyPrint',
+                                                                       'fields',
+                                                                       'strict',
+                                                                       'userIp'],
+                                                      'repeated_params': [],
+                                                      'required_params': ['body',
+                                                                          u'tasklist']}},
+                              'nextMethods': {},
+                              'resources': {}},
+               u'tasks': {'methods': {u'clear': {'argmap': {'body': 'body',
+                                                            'fields': 'fields',
+                                                            'pp': 'pp',
+                                                            'prettyPrint': 'prettyPrint',
+                                                            'strict': 'strict',
+                                                            u'tasklist': u'tasklist',
+                                                            'trace': 'trace',
+                                                            'userIp': 'userIp'},
+                                                 'doc': u"Clears all completed tasks from the specified task list. The affected tasks will be marked as 'hidden' and no longer be returned by default when retrieving all tasks for a task list.\n\nArgs:\n  body: object, The request body. (required)\n  tasklist: string, Task list identifier. (required)\n",
+                                                 'enum_params': {},
+                                                 'httpMethod': u'POST',
+                                                 'methodId': u'tasks.tasks.clear',
+                                                 'param_type': {'body': 'object',
+                                                                'fields': 'string',
+                                                                'pp': 'string',
+                                                                'prettyPrint': 'string',
+                                                                'strict': 'string',
+                                                                u'tasklist': u'string',
+                                                                'trace': 'string',
+                                                                'userIp': 'string'},
+                                                 'pathUrl': u'lists/{tasklist}/clear',
+                                                 'path_params': {u'tasklist': u'tasklist'},
+                                                 'pattern_params': {},
+                                                 'query_params': ['pp',
+                                                                  'trace',
+                                                                  'prettyPrint',
+                                                                  'fields',
+                                                                  'strict',
+                                                                  'userIp'],
+                                                 'repeated_params': [],
+                                                 'required_params': ['body',
+                                                                     u'tasklist']},
+                                      u'delete': {'argmap': {'fields': 'fields',
+                                                             'pp': 'pp',
+                                                             'prettyPrint': 'prettyPrint',
+                                                             'strict': 'strict',
+                                                             u'task': u'task',
+                                                             u'tasklist': u'tasklist',
+                                                             'trace': 'trace',
+                                                             'userIp': 'userIp'},
+                                                  'doc': u'Deletes the specified task from the task list.\n\nArgs:\n  tasklist: string, Task list identifier. (required)\n  task: string, Task identifier. (required)\n',
+                                                  'enum_params': {},
+                                                  'httpMethod': u'DELETE',
+                                                  'methodId': u'tasks.tasks.delete',
+                                                  'param_type': {'fields': 'string',
+                                                                 'pp': 'string',
+                                                                 'prettyPrint': 'string',
+                                                                 'strict': 'string',
+                                                                 u'task': u'string',
+                                                                 u'tasklist': u'string',
+                                                                 'trace': 'string',
+                                                                 'userIp': 'string'},
+                                                  'pathUrl': u'lists/{tasklist}/tasks/{task}',
+                                                  'path_params': {u'task': u'task',
+                                                                  u'tasklist': u'tasklist'},
+                                                  'pattern_params': {},
+                                                  'query_params': ['pp',
+                                                                   'trace',
+                                                                   'prettyPrint',
+                                                                   'fields',
+                                                                   'strict',
+                                                                   'userIp'],
+                                                  'repeated_params': [],
+                                                  'required_params': [u'tasklist',
+                                                                      u'task']},
+                                      u'get': {'argmap': {'fields': 'fields',
+                                                          'pp': 'pp',
+                                                          'prettyPrint': 'prettyPrint',
+                                                          'strict': 'strict',
+                                                          u'task': u'task',
+                                                          u'tasklist': u'tasklist',
+                                                          'trace': 'trace',
+                                                          'userIp': 'userIp'},
+                                               'doc': u'Returns the specified task.\n\nArgs:\n  tasklist: string, Task list identifier. (required)\n  task: string, Task identifier. (required)\n',
+                                               'enum_params': {},
+                                               'httpMethod': u'GET',
+                                               'methodId': u'tasks.tasks.get',
+                                               'param_type': {'fields': 'string',
+                                                              'pp': 'string',
+                                                              'prettyPrint': 'string',
+                                                              'strict': 'string',
+                                                              u'task': u'string',
+                                                              u'tasklist': u'string',
+                                                              'trace': 'string',
+                                                              'userIp': 'string'},
+                                               'pathUrl': u'lists/{tasklist}/tasks/{task}',
+                                               'path_params': {u'task': u'task',
+                                                               u'tasklist': u'tasklist'},
+                                               'pattern_params': {},
+                                               'query_params': ['pp',
+                                                                'trace',
+                                                                'prettyPrint',
+                                                                'fields',
+                                                                'strict',
+                                                                'userIp'],
+                                               'repeated_params': [],
+                                               'required_params': [u'tasklist',
+                                                                   u'task']},
+                                      u'insert': {'argmap': {'body': 'body',
+                                                             'fields': 'fields',
+                                                             u'parent': u'parent',
+                                                             'pp': 'pp',
+                                                             'prettyPrint': 'prettyPrint',
+                                                             u'previous': u'previous',
+                                                             'strict': 'strict',
+                                                             u'tasklist': u'tasklist',
+                                                             'trace': 'trace',
+                                                             'userIp': 'userIp'},
+                                                  'doc': u'Creates a new task on the specified task list.\n\nArgs:\n  body: object, The request body. (required)\n  tasklist: string, Task list identifier. (required)\n  parent: string, Parent task identifier. If the task is created at the top level, this parameter is omitted. Optional.\n  previous: string, Previous sibling task identifier. If the task is created at the first position among its siblings, this parameter is omitted. Optional.\n',
+                                                  'enum_params': {},
+                                                  'httpMethod': u'POST',
+                                                  'methodId': u'tasks.tasks.insert',
+                                                  'param_type': {'body': 'object',
+                                                                 'fields': 'string',
+                                                                 u'parent': u'string',
+                                                                 'pp': 'string',
+                                                                 'prettyPrint': 'string',
+                                                                 u'previous': u'string',
+                                                                 'strict': 'string',
+                                                                 u'tasklist': u'string',
+                                                                 'trace': 'string',
+                                                                 'userIp': 'string'},
+                                                  'pathUrl': u'lists/{tasklist}/tasks',
+                                                  'path_params': {u'tasklist': u'tasklist'},
+                                                  'pattern_params': {},
+                                                  'query_params': ['pp',
+                                                                   u'parent',
+                                                                   'trace',
+                                                                   'strict',
+                                                                   'fields',
+                                                                   'userIp',
+                                                                   'prettyPrint',
+                                                                   u'previous'],
+                                                  'repeated_params': [],
+                                                  'required_params': ['body',
+                                                                      u'tasklist']},
+                                      u'list': {'argmap': {u'completedMax': u'completedMax',
+                                                           u'completedMin': u'completedMin',
+                                                           u'dueMax': u'dueMax',
+                                                           u'dueMin': u'dueMin',
+                                                           'fields': 'fields',
+                                                           u'maxResults': u'maxResults',
+                                                           u'pageToken': u'pageToken',
+                                                           'pp': 'pp',
+                                                           'prettyPrint': 'prettyPrint',
+                                                           u'showCompleted': u'showCompleted',
+                                                           u'showDeleted': u'showDeleted',
+                                                           u'showHidden': u'showHidden',
+                                                           'strict': 'strict',
+                                                           u'tasklist': u'tasklist',
+                                                           'trace': 'trace',
+                                                           u'updatedMin': u'updatedMin',
+                                                           'userIp': 'userIp'},
+                                                'doc': u"Returns all tasks in the specified task list.\n\nArgs:\n  dueMax: string, Upper bound for a task's due date (as a RFC 3339 timestamp) to filter by. Optional. The default is not to filter by due date.\n  tasklist: string, Task list identifier. (required)\n  showDeleted: boolean, Flag indicating whether deleted tasks are returned in the result. Optional. The default is False.\n  updatedMin: string, Lower bound for a task's last modification time (as a RFC 3339 timestamp) to filter by. Optional. The default is not to filter by last modification time.\n  maxResults: string, Maximum number of task lists returned on one page. Optional. The default is 100.\n  completedMin: string, Lower bound for a task's completion date (as a RFC 3339 timestamp) to filter by. Optional. The default is not to filter by completion date.\n  pageToken: string, Token specifying the result page to return. Optional.\n  completedMax: string, Upper bound for a task's completion date (as a RFC 3339 timestamp) to filter by. Optional. The default is not to filter by completion date.\n  showHidden: boolean, Flag indicating whether hidden tasks are returned in the result. Optional. The default is False.\n  showCompleted: boolean, Flag indicating whether completed tasks are returned in the result. Optional. The default is True.\n  dueMin: string, Lower bound for a task's due date (as a RFC 3339 timestamp) to filter by. Optional. The default is not to filter by due date.\n",
+                                                'enum_params': {},
+                                                'httpMethod': u'GET',
+                                                'methodId': u'tasks.tasks.list',
+                                                'param_type': {u'completedMax': u'string',
+                                                               u'completedMin': u'string',
+                                                               u'dueMax': u'string',
+                                                               u'dueMin': u'string',
+                                                               'fields': 'string',
+                                                               u'maxResults': u'string',
+                                                               u'pageToken': u'string',
+                                                               'pp': 'string',
+                                                               'prettyPrint': 'string',
+                                                               u'showCompleted': u'boolean',
+                                                               u'showDeleted': u'boolean',
+                                                               u'showHidden': u'boolean',
+                                                               'strict': 'string',
+                                                               u'tasklist': u'string',
+                                                               'trace': 'string',
+                                                               u'updatedMin': u'string',
+                                                               'userIp': 'string'},
+                                                'pathUrl': u'lists/{tasklist}/tasks',
+                                                'path_params': {u'tasklist': u'tasklist'},
+                                                'pattern_params': {},
+                                                'query_params': [u'dueMax',
+                                                                 'prettyPrint',
+                                                                 'trace',
+                                                                 u'pageToken',
+                                                                 u'updatedMin',
+                                                                 'pp',
+                                                                 u'completedMin',
+                                                                 u'maxResults',
+                                                                 u'showCompleted',
+                                                                 u'showDeleted',
+                                                                 u'completedMax',
+                                                                 u'showHidden',
+                                                                 'fields',
+                                                                 'userIp',
+                                                                 u'dueMin',
+                                                                 'strict'],
+                                                'repeated_params': [],
+                                                'required_params': [u'tasklist']},
+                                      u'move': {'argmap': {'body': 'body',
+                                                           'fields': 'fields',
+                                                           u'parent': u'parent',
+                                                           'pp': 'pp',
+                                                           'prettyPrint': 'prettyPrint',
+                                                           u'previous': u'previous',
+                                                           'strict': 'strict',
+                                                           u'task': u'task',
+                                                           u'tasklist': u'tasklist',
+                                                           'trace': 'trace',
+                                                           'userIp': 'userIp'},
+                                                'doc': u'Moves the specified task to another position in the task list. This can include putting it as a child task under a new parent and/or move it to a different position among its sibling tasks.\n\nArgs:\n  body: object, The request body. (required)\n  tasklist: string, Task list identifier. (required)\n  parent: string, New parent task identifier. If the task is moved to the top level, this parameter is omitted. Optional.\n  task: string, Task identifier. (required)\n  previous: string, New previous sibling task identifier. If the task is moved to the first position among its siblings, this parameter is omitted. Optional.\n',
+                                                'enum_params': {},
+                                                'httpMethod': u'POST',
+                                                'methodId': u'tasks.tasks.move',
+                                                'param_type': {'body': 'object',
+                                                               'fields': 'string',
+                                                               u'parent': u'string',
+                                                               'pp': 'string',
+                                                               'prettyPrint': 'string',
+                                                               u'previous': u'string',
+                                                               'strict': 'string',
+                                                               u'task': u'string',
+                                                               u'tasklist': u'string',
+                                                               'trace': 'string',
+                                                               'userIp': 'string'},
+                                                'pathUrl': u'lists/{tasklist}/tasks/{task}/move',
+                                                'path_params': {u'task': u'task',
+                                                                u'tasklist': u'tasklist'},
+                                                'pattern_params': {},
+                                                'query_params': ['pp',
+                                                                 u'parent',
+                                                                 'trace',
+                                                                 'strict',
+                                                                 'fields',
+                                                                 'userIp',
+                                                                 'prettyPrint',
+                                                                 u'previous'],
+                                                'repeated_params': [],
+                                                'required_params': ['body',
+                                                                    u'tasklist',
+                                                                    u'task']},
+                                      u'patch': {'argmap': {'body': 'body',
+                                                            'fields': 'fields',
+                                                            'pp': 'pp',
+                                                            'prettyPrint': 'prettyPrint',
+                                                            'strict': 'strict',
+                                                            u'task': u'task',
+                                                            u'tasklist': u'tasklist',
+                                                            'trace': 'trace',
+                                                            'userIp': 'userIp'},
+                                                 'doc': u'Updates the specified task. This method supports patch semantics.\n\nArgs:\n  body: object, The request body. (required)\n  tasklist: string, Task list identifier. (required)\n  task: string, Task identifier. (required)\n',
+                                                 'enum_params': {},
+                                                 'httpMethod': u'PATCH',
+                                                 'methodId': u'tasks.tasks.patch',
+                                                 'param_type': {'body': 'object',
+                                                                'fields': 'string',
+                                                                'pp': 'string',
+                                                                'prettyPrint': 'string',
+                                                                'strict': 'string',
+                                                                u'task': u'string',
+                                                                u'tasklist': u'string',
+                                                                'trace': 'string',
+                                                                'userIp': 'string'},
+                                                 'pathUrl': u'lists/{tasklist}/tasks/{task}',
+                                                 'path_params': {u'task': u'task',
+                                                                 u'tasklist': u'tasklist'},
+                                                 'pattern_params': {},
+                                                 'query_params': ['pp',
+                                                                  'trace',
+                                                                  'prettyPrint',
+                                                                  'fields',
+                                                                  'strict',
+                                                                  'userIp'],
+                                                 'repeated_params': [],
+                                                 'required_params': ['body',
+                                                                     u'tasklist',
+                                                                     u'task']},
+                                      u'update': {'argmap': {'body': 'body',
+                                                             'fields': 'fields',
+                                                             'pp': 'pp',
+                                                             'prettyPrint': 'prettyPrint',
+                                                             'strict': 'strict',
+                                                             u'task': u'task',
+                                                             u'tasklist': u'tasklist',
+                                                             'trace': 'trace',
+                                                             'userIp': 'userIp'},
+                                                  'doc': u'Updates the specified task.\n\nArgs:\n  body: object, The request body. (required)\n  tasklist: string, Task list identifier. (required)\n  task: string, Task identifier. (required)\n',
+                                                  'enum_params': {},
+                                                  'httpMethod': u'PUT',
+                                                  'methodId': u'tasks.tasks.update',
+                                                  'param_type': {'body': 'object',
+                                                                 'fields': 'string',
+                                                                 'pp': 'string',
+                                                                 'prettyPrint': 'string',
+                                                                 'strict': 'string',
+                                                                 u'task': u'string',
+                                                                 u'tasklist': u'string',
+                                                                 'trace': 'string',
+                                                                 'userIp': 'string'},
+                                                  'pathUrl': u'lists/{tasklist}/tasks/{task}',
+                                                  'path_params': {u'task': u'task',
+                                                                  u'tasklist': u'tasklist'},
+                                                  'pattern_params': {},
+                                                  'query_params': ['pp',
+                                                                   'trace',
+                                                                   'prettyPrint',
+                                                                   'fields',
+                                                                   'strict',
+                                                                   'userIp'],
+                                                  'repeated_params': [],
+                                                  'required_params': ['body',
+                                                                      u'tasklist',
+                                                                      u'task']}},
+                          'nextMethods': {},
+                          'resources': {}}}}
@@ -22,10 +22,12 @@ __all__ = [
     'build', 'build_from_document'
     ]
 
+import hashlib
 import httplib2
 import logging
 import os
 import re
+import time
 import uritemplate
 import urllib
 import urlparse
@@ -33,6 +35,10 @@ try:
     from urlparse import parse_qsl
 except ImportError:
     from cgi import parse_qsl
+try:
+  from google.appengine.api import memcache
+except ImportError:
+  memcache = None
 
 from http import HttpRequest
 from anyjson import simplejson
@@ -47,10 +53,35 @@ DISCOVERY_URI = ('https://www.googleapis.com/discovery/v1/apis/'
   '{api}/{apiVersion}/rest')
 DEFAULT_METHOD_DOC = 'A description of how to use this function'
 
+# Fields of a discovery document which fingerprint() identifies it by.
+_TOP_LEVEL_FIELD = re.compile(r'"(id|revision|etag)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
 # Query parameters that work, but don't appear in discovery
 STACK_QUERY_PARAMETERS = ['trace', 'fields', 'pp', 'prettyPrint', 'userIp',
   'strict']
 
+# Number of seconds a cached discovery document is used before it is
+# revalidated with the discovery service.
+DISCOVERY_CACHE_TTL = 3600
+
+# Namespace of the discovery documents cached in memcache.
+MEMCACHE_NAMESPACE = 'apiclient.discovery'
+
+# Discovery documents by URL, as dicts with the keys 'content', 'etag' and
+# 'fetched'.
+_documents = {}
+
+# Contents of the files bundled in contrib by (service name, file name).
+_contrib_files = {}
+
+# Parsed services by (discovery document, future document).  See
+# _parse_service.
+_services = {}
+
+# Modules generated by apiclient.ext.compiler by (service name, version), or
+# None for services without one.
+_compiled = {}
+
 
 def key2param(key):
   """Converts key names into parameter names.
@@ -75,13 +106,22 @@ def build(serviceName, version,
           discoveryServiceUrl=DISCOVERY_URI,
           developerKey=None,
           model=None,
-          requestBuilder=HttpRequest):
+          requestBuilder=HttpRequest,
+          offline=False):
   """Construct a Resource for interacting with an API.
 
   Construct a Resource object for interacting with
   an API. The serviceName and version are the
   names from the Discovery service.
 
+  Discovery documents are cached in memory and in memcache, when available,
+  and revalidated with their ETag after DISCOVERY_CACHE_TTL seconds.  The
+  Resource classes generated from a document are cached in memory, so that
+  building the same service again does no parsing.  If the service has a
+  module generated by apiclient.ext.compiler from a document with the same
+  fingerprint, the Resource classes are created from it without parsing the
+  document at all.
+
   Args:
     serviceName: string, name of the service
     version: string, the version of the service
@@ -95,6 +135,9 @@ def build(serviceName, version,
     model: apiclient.Model, converts to and from the wire format
     requestBuilder: apiclient.http.HttpRequest, encapsulator for
       an HTTP request
+    offline: boolean, if True the discovery document bundled as
+      contrib/<serviceName>/<version>.json is used and no HTTP request is
+      made.
 
   Returns:
     A Resource object with methods for interacting with
@@ -107,28 +150,176 @@ def build(serviceName, version,
 
   if http is None:
     http = httplib2.Http()
-  requested_url = uritemplate.expand(discoveryServiceUrl, params)
+  future = _read_contrib(serviceName, 'future.json')
+  compiled = _load_compiled(serviceName, version)
+
+  def parse(content):
+    return _parse_service(content, future, compiled)
+
+  if offline:
+    content = _read_contrib(serviceName, '%s.json' % version)
+    if content is None:
+      raise IOError('No bundled discovery document for %s %s' %
+                    (serviceName, version))
+  else:
+    requested_url = uritemplate.expand(discoveryServiceUrl, params)
+    content = _get_document(http, requested_url, parse)
+
+  # primes the cache used by build_from_document.
+  parse(content)
+  return build_from_document(content, discoveryServiceUrl, future,
+      http, developerKey, model, requestBuilder)
+
+
+def _get_document(http, requested_url, parse):
+  """Returns a discovery document, using the cached copy when possible.
+
+  Args:
+    http: httplib2.Http, used to fetch the document.
+    requested_url: string, the URL of the discovery document.
+    parse: function, called with a newly fetched document before it is cached
+      to check that it is valid.
+
+  Returns:
+    The discovery document as a string.
+  """
+  now = time.time()
+  cached = _documents.get(requested_url)
+  if cached is None and memcache is not None:
+    cached = memcache.get(requested_url, namespace=MEMCACHE_NAMESPACE)
+  if cached is not None and now - cached['fetched'] < DISCOVERY_CACHE_TTL:
+    _documents[requested_url] = cached
+    return cached['content']
+
+  headers = {}
+  if cached is not None and cached['etag']:
+    headers['if-none-match'] = cached['etag']
   logging.info('URL being requested: %s' % requested_url)
-  resp, content = http.request(requested_url)
-  if resp.status > 400:
+  resp, content = http.request(requested_url, headers=headers)
+  if resp.status == 304 and cached is not None:
+    content = cached['content']
+  elif resp.status > 400:
     raise HttpError(resp, content, requested_url)
-  try:
-    service = simplejson.loads(content)
-  except ValueError, e:
-    logging.error('Failed to parse as JSON: ' + content)
-    raise InvalidJsonError()
+  else:
+    parse(content)
+
+  cached = {'content': content, 'etag': resp.get('etag'), 'fetched': now}
+  _documents[requested_url] = cached
+  if memcache is not None:
+    memcache.set(requested_url, cached, namespace=MEMCACHE_NAMESPACE)
+  return content
+
 
-  fn = os.path.join(os.path.dirname(__file__), 'contrib',
-      serviceName, 'future.json')
+def _read_contrib(serviceName, filename):
+  """Returns the contents of a file bundled for a service, or None."""
+  key = (serviceName, filename)
+  try:
+    return _contrib_files[key]
+  except KeyError:
+    pass
+  fn = os.path.join(os.path.dirname(__file__), 'contrib', serviceName,
+                    filename)
   try:
     f = file(fn, 'r')
-    future = f.read()
-    f.close()
+    try:
+      content = f.read()
+    finally:
+      f.close()
   except IOError:
-    future = None
+    content = None
+  return _contrib_files.setdefault(key, content)
+
+
+def _load_compiled(serviceName, version):
+  """Returns the module generated by apiclient.ext.compiler, or None."""
+  key = (serviceName, version)
+  try:
+    return _compiled[key]
+  except KeyError:
+    pass
+  try:
+    module = __import__(compiledModuleName(serviceName, version), {}, {},
+                        ['RESOURCE'])
+  except ImportError:
+    module = None
+  return _compiled.setdefault(key, module)
+
+
+def compiledModuleName(serviceName, version):
+  """Returns the name of the module apiclient.ext.compiler generates."""
+  return 'apiclient.contrib.%s.%s_compiled' % (serviceName, key2param(version))
 
-  return build_from_document(content, discoveryServiceUrl, future,
-      http, developerKey, model, requestBuilder)
+
+def fingerprint(document):
+  """Returns the fingerprint of a document, or None if there is none.
+
+  Documents served by the discovery service are identified by their id and
+  their revision, or their etag if they have no revision, which unlike their
+  bytes do not change with the formatting of the document.  These fields are
+  only looked for among the top-level fields before the first nested object,
+  where the discovery service puts them, so that the document is not parsed.
+  Other documents are identified by the MD5 of their contents.
+
+  Args:
+    document: string, discovery document, or None
+
+  Returns:
+    The fingerprint as a string, or None if document is None.
+  """
+  if document is None:
+    return None
+  top = document[:document.find('{', document.find('{') + 1)]
+  fields = dict(_TOP_LEVEL_FIELD.findall(top))
+  revision = fields.get('revision') or fields.get('etag')
+  if 'id' in fields and revision:
+    return '%s@%s' % (fields['id'], revision)
+  return hashlib.md5(document).hexdigest()
+
+
+def _parse_service(service, future, compiled=None):
+  """Parses a discovery document and generates its Resource class.
+
+  Args:
+    service: string, discovery document
+    future: string, discovery document with future capabilities, or None
+    compiled: module, generated by apiclient.ext.compiler for the service,
+      used instead of the documents if it was generated from them
+
+  Returns:
+    A tuple of the parsed discovery document, the class of its root
+    Resource and the discovery information about its authentication.
+
+  Raises:
+    InvalidJsonError: if a document is not valid JSON.
+  """
+  key = (service, future)
+  try:
+    return _services[key]
+  except KeyError:
+    pass
+  if compiled is not None:
+    if (compiled.FINGERPRINT == fingerprint(service) and
+        compiled.FUTURE_FINGERPRINT == fingerprint(future)):
+      return _services.setdefault(key, (compiled.SERVICE,
+                                        bindResource(compiled.RESOURCE),
+                                        compiled.AUTH_DISCOVERY))
+    logging.info('%s was not generated from this revision of the discovery '
+                 'document; regenerate it with apiclient.ext.compiler.' %
+                 compiled.__name__)
+  try:
+    serviceDesc = simplejson.loads(service)
+  except ValueError, e:
+    logging.error('Failed to parse as JSON: ' + service)
+    raise InvalidJsonError()
+  if future:
+    futureDesc = simplejson.loads(future)
+    auth_discovery = futureDesc.get('auth', {})
+  else:
+    futureDesc = {}
+    auth_discovery = {}
+  resourceClass = createResourceClass(serviceDesc, futureDesc)
+  return _services.setdefault(key, (serviceDesc, resourceClass,
+                                    auth_discovery))
 
 
 def build_from_document(
@@ -163,20 +354,13 @@ def build_from_document(
     the service.
   """
 
-  service = simplejson.loads(service)
+  service, resourceClass, auth_discovery = _parse_service(service, future)
   base = urlparse.urljoin(base, service['basePath'])
-  if future:
-    future = simplejson.loads(future)
-    auth_discovery = future.get('auth', {})
-  else:
-    future = {}
-    auth_discovery = {}
 
   if model is None:
     features = service.get('features', [])
     model = JsonModel('dataWrapper' in features)
-  resource = createResource(http, base, model, requestBuilder, developerKey,
-                       service, future)
+  resource = resourceClass(http, base, model, requestBuilder, developerKey)
 
   def auth_method():
     """Discovery information about the authentication the API uses."""
@@ -220,72 +404,215 @@ def _cast(value, schema_type):
 
 def createResource(http, baseUrl, model, requestBuilder,
                    developerKey, resourceDesc, futureDesc):
+  resourceClass = createResourceClass(resourceDesc, futureDesc)
+  return resourceClass(http, baseUrl, model, requestBuilder, developerKey)
+
+
+def createResourceClass(resourceDesc, futureDesc):
+  """Generates the class of a Resource from its discovery description.
+
+  The class only depends on the descriptions, so that it can be reused for
+  any http, model and credentials.  Classes of nested resources are
+  generated along with it.
+
+  Args:
+    resourceDesc: object, the description of the resource from the discovery
+      document
+    futureDesc: object, the description of the resource from the future
+      document
+
+  Returns:
+    A Resource class whose constructor takes the http, base URL, model,
+    request builder and developer key to use.
+  """
+  return bindResource(compileResource(resourceDesc, futureDesc))
+
+
+def compileResource(resourceDesc, futureDesc):
+  """Precomputes everything the class of a Resource needs.
+
+  The result only holds dicts, lists and strings, so that it can be written
+  out as Python source by apiclient.ext.compiler and loaded without parsing
+  the discovery document.
+
+  Args:
+    resourceDesc: object, the description of the resource from the discovery
+      document
+    futureDesc: object, the description of the resource from the future
+      document
+
+  Returns:
+    A resource descriptor for bindResource.
+  """
+  methods = {}
+  resources = {}
+  nextMethods = {}
+
+  # Add basic methods to Resource
+  if 'methods' in resourceDesc:
+    for methodName, methodDesc in resourceDesc['methods'].iteritems():
+      methods[methodName] = compileMethod(methodDesc)
+
+  # Add in nested resources
+  if 'resources' in resourceDesc:
+    for methodName, methodDesc in resourceDesc['resources'].iteritems():
+      if futureDesc and 'resources' in futureDesc:
+        future = futureDesc['resources'].get(methodName, {})
+      else:
+        future = {}
+      resources[methodName] = compileResource(methodDesc, future)
+
+  # Add <m>_next() methods to Resource
+  if futureDesc and 'methods' in futureDesc:
+    for methodName, methodDesc in futureDesc['methods'].iteritems():
+      if 'next' in methodDesc and methodName in resourceDesc['methods']:
+        nextMethods[methodName + '_next'] = {
+            'methodId': resourceDesc['methods'][methodName]['id'] + '.next',
+            'future': methodDesc['next'],
+            }
+
+  return {
+      'methods': methods,
+      'resources': resources,
+      'nextMethods': nextMethods,
+      }
+
+
+def compileMethod(methodDesc):
+  """Precomputes the argument tables and docstring of a method.
+
+  Args:
+    methodDesc: object, the description of the method from the discovery
+      document
+
+  Returns:
+    A method descriptor for bindResource.
+  """
+  pathUrl = methodDesc['path']
+  httpMethod = methodDesc['httpMethod']
+  methodId = methodDesc['id']
+
+  parameters = dict(methodDesc.get('parameters', {}))
+  for name in STACK_QUERY_PARAMETERS:
+    parameters[name] = {
+        'type': 'string',
+        'location': 'query'
+        }
+
+  if httpMethod in ['PUT', 'POST', 'PATCH']:
+    parameters['body'] = {
+        'description': 'The request body.',
+        'type': 'object',
+        'required': True,
+        }
+
+  argmap = {} # Map from method parameter name to query parameter name
+  required_params = [] # Required parameters
+  repeated_params = [] # Repeated parameters
+  pattern_params = {}  # Parameters that must match a regex
+  query_params = [] # Parameters that will be used in the query string
+  path_params = {} # Parameters that will be used in the base URL
+  param_type = {} # The type of the parameter
+  enum_params = {} # Allowable enumeration values for each parameter
+
+  for arg, desc in parameters.iteritems():
+    param = key2param(arg)
+    argmap[param] = arg
+
+    if desc.get('pattern', ''):
+      pattern_params[param] = desc['pattern']
+    if desc.get('enum', ''):
+      enum_params[param] = desc['enum']
+    if desc.get('required', False):
+      required_params.append(param)
+    if desc.get('repeated', False):
+      repeated_params.append(param)
+    if desc.get('location') == 'query':
+      query_params.append(param)
+    if desc.get('location') == 'path':
+      path_params[param] = param
+    param_type[param] = desc.get('type', 'string')
+
+  for match in URITEMPLATE.finditer(pathUrl):
+    for namematch in VARNAME.finditer(match.group(0)):
+      name = key2param(namematch.group(0))
+      path_params[name] = name
+      if name in query_params:
+        query_params.remove(name)
+
+  docs = [methodDesc.get('description', DEFAULT_METHOD_DOC), '\n\n']
+  if len(argmap) > 0:
+    docs.append('Args:\n')
+  for arg in argmap.iterkeys():
+    if arg in STACK_QUERY_PARAMETERS:
+      continue
+    repeated = ''
+    if arg in repeated_params:
+      repeated = ' (repeated)'
+    required = ''
+    if arg in required_params:
+      required = ' (required)'
+    paramdesc = parameters[argmap[arg]]
+    paramdoc = paramdesc.get('description', 'A parameter')
+    paramtype = paramdesc.get('type', 'string')
+    docs.append('  %s: %s, %s%s%s\n' % (arg, paramtype, paramdoc, required,
+                                        repeated))
+    enum = paramdesc.get('enum', [])
+    enumDesc = paramdesc.get('enumDescriptions', [])
+    if enum and enumDesc:
+      docs.append('    Allowed values\n')
+      for (name, desc) in zip(enum, enumDesc):
+        docs.append('      %s - %s\n' % (name, desc))
+
+  return {
+      'pathUrl': pathUrl,
+      'httpMethod': httpMethod,
+      'methodId': methodId,
+      'argmap': argmap,
+      'required_params': required_params,
+      'repeated_params': repeated_params,
+      'pattern_params': pattern_params,
+      'query_params': query_params,
+      'path_params': path_params,
+      'param_type': param_type,
+      'enum_params': enum_params,
+      'doc': ''.join(docs),
+      }
+
+
+def bindResource(resourceDescriptor):
+  """Generates the class of a Resource from a resource descriptor.
+
+  Args:
+    resourceDescriptor: dict, as returned by compileResource
+
+  Returns:
+    A Resource class whose constructor takes the http, base URL, model,
+    request builder and developer key to use.
+  """
 
   class Resource(object):
     """A class for interacting with a resource."""
 
-    def __init__(self):
+    def __init__(self, http, baseUrl, model, requestBuilder, developerKey):
       self._http = http
       self._baseUrl = baseUrl
       self._model = model
       self._developerKey = developerKey
       self._requestBuilder = requestBuilder
 
-  def createMethod(theclass, methodName, methodDesc, futureDesc):
-    pathUrl = methodDesc['path']
-    httpMethod = methodDesc['httpMethod']
-    methodId = methodDesc['id']
-
-    if 'parameters' not in methodDesc:
-      methodDesc['parameters'] = {}
-    for name in STACK_QUERY_PARAMETERS:
-      methodDesc['parameters'][name] = {
-          'type': 'string',
-          'location': 'query'
-          }
-
-    if httpMethod in ['PUT', 'POST', 'PATCH']:
-      methodDesc['parameters']['body'] = {
-          'description': 'The request body.',
-          'type': 'object',
-          'required': True,
-          }
-
-    argmap = {} # Map from method parameter name to query parameter name
-    required_params = [] # Required parameters
-    repeated_params = [] # Repeated parameters
-    pattern_params = {}  # Parameters that must match a regex
-    query_params = [] # Parameters that will be used in the query string
-    path_params = {} # Parameters that will be used in the base URL
-    param_type = {} # The type of the parameter
-    enum_params = {} # Allowable enumeration values for each parameter
-
-
-    if 'parameters' in methodDesc:
-      for arg, desc in methodDesc['parameters'].iteritems():
-        param = key2param(arg)
-        argmap[param] = arg
-
-        if desc.get('pattern', ''):
-          pattern_params[param] = desc['pattern']
-        if desc.get('enum', ''):
-          enum_params[param] = desc['enum']
-        if desc.get('required', False):
-          required_params.append(param)
-        if desc.get('repeated', False):
-          repeated_params.append(param)
-        if desc.get('location') == 'query':
-          query_params.append(param)
-        if desc.get('location') == 'path':
-          path_params[param] = param
-        param_type[param] = desc.get('type', 'string')
-
-    for match in URITEMPLATE.finditer(pathUrl):
-      for namematch in VARNAME.finditer(match.group(0)):
-        name = key2param(namematch.group(0))
-        path_params[name] = name
-        if name in query_params:
-          query_params.remove(name)
+  def createMethod(theclass, methodName, methodDescriptor):
+    pathUrl = methodDescriptor['pathUrl']
+    httpMethod = methodDescriptor['httpMethod']
+    methodId = methodDescriptor['methodId']
+    argmap = methodDescriptor['argmap']
+    required_params = methodDescriptor['required_params']
+    repeated_params = methodDescriptor['repeated_params']
+    pattern_params = methodDescriptor['pattern_params']
+    query_params = methodDescriptor['query_params']
+    path_params = methodDescriptor['path_params']
+    param_type = methodDescriptor['param_type']
+    enum_params = methodDescriptor['enum_params']
 
     def method(self, **kwargs):
       for name in kwargs.iterkeys():
@@ -352,35 +679,12 @@ def createResource(http, baseUrl, model, requestBuilder,
                                   headers=headers,
                                   methodId=methodId)
 
-    docs = [methodDesc.get('description', DEFAULT_METHOD_DOC), '\n\n']
-    if len(argmap) > 0:
-      docs.append('Args:\n')
-    for arg in argmap.iterkeys():
-      if arg in STACK_QUERY_PARAMETERS:
-        continue
-      repeated = ''
-      if arg in repeated_params:
-        repeated = ' (repeated)'
-      required = ''
-      if arg in required_params:
-        required = ' (required)'
-      paramdesc = methodDesc['parameters'][argmap[arg]]
-      paramdoc = paramdesc.get('description', 'A parameter')
-      paramtype = paramdesc.get('type', 'string')
-      docs.append('  %s: %s, %s%s%s\n' % (arg, paramtype, paramdoc, required,
-                                          repeated))
-      enum = paramdesc.get('enum', [])
-      enumDesc = paramdesc.get('enumDescriptions', [])
-      if enum and enumDesc:
-        docs.append('    Allowed values\n')
-        for (name, desc) in zip(enum, enumDesc):
-          docs.append('      %s - %s\n' % (name, desc))
-
-    setattr(method, '__doc__', ''.join(docs))
+    setattr(method, '__doc__', methodDescriptor['doc'])
     setattr(theclass, methodName, method)
 
-  def createNextMethod(theclass, methodName, methodDesc, futureDesc):
-    methodId = methodDesc['id'] + '.next'
+  def createNextMethod(theclass, methodName, nextDescriptor):
+    methodId = nextDescriptor['methodId']
+    futureDesc = nextDescriptor['future']
 
     def methodNext(self, previous):
       """
@@ -424,42 +728,23 @@ def createResource(http, baseUrl, model, requestBuilder,
 
     setattr(theclass, methodName, methodNext)
 
-  # Add basic methods to Resource
-  if 'methods' in resourceDesc:
-    for methodName, methodDesc in resourceDesc['methods'].iteritems():
-      if futureDesc:
-        future = futureDesc['methods'].get(methodName, {})
-      else:
-        future = None
-      createMethod(Resource, methodName, methodDesc, future)
-
-  # Add in nested resources
-  if 'resources' in resourceDesc:
-
-    def createResourceMethod(theclass, methodName, methodDesc, futureDesc):
+  def createResourceMethod(theclass, methodName, resourceDescriptor):
+    resourceClass = bindResource(resourceDescriptor)
 
-      def methodResource(self):
-        return createResource(self._http, self._baseUrl, self._model,
-                              self._requestBuilder, self._developerKey,
-                              methodDesc, futureDesc)
+    def methodResource(self):
+      return resourceClass(self._http, self._baseUrl, self._model,
+                           self._requestBuilder, self._developerKey)
 
-      setattr(methodResource, '__doc__', 'A collection resource.')
-      setattr(methodResource, '__is_resource__', True)
-      setattr(theclass, methodName, methodResource)
-
-    for methodName, methodDesc in resourceDesc['resources'].iteritems():
-      if futureDesc and 'resources' in futureDesc:
-        future = futureDesc['resources'].get(methodName, {})
-      else:
-        future = {}
-      createResourceMethod(Resource, methodName, methodDesc, future)
+    setattr(methodResource, '__doc__', 'A collection resource.')
+    setattr(methodResource, '__is_resource__', True)
+    setattr(theclass, methodName, methodResource)
 
-  # Add <m>_next() methods to Resource
-  if futureDesc and 'methods' in futureDesc:
-    for methodName, methodDesc in futureDesc['methods'].iteritems():
-      if 'next' in methodDesc and methodName in resourceDesc['methods']:
-        createNextMethod(Resource, methodName + '_next',
-                         resourceDesc['methods'][methodName],
-                         methodDesc['next'])
+  for methodName, methodDescriptor in (
+      resourceDescriptor['methods'].iteritems()):
+    createMethod(Resource, methodName, methodDescriptor)
+  for methodName, descriptor in resourceDescriptor['resources'].iteritems():
+    createResourceMethod(Resource, methodName, descriptor)
+  for methodName, descriptor in resourceDescriptor['nextMethods'].iteritems():
+    createNextMethod(Resource, methodName, descriptor)
 
-  return Resource()
+  return Resource
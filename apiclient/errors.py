@@ -70,3 +70,8 @@ class InvalidJsonError(Error):
 class UnknownLinkType(Error):
   """Link type unknown or unexpected."""
   pass
+
+
+class BatchError(Error):
+  """The response to a batch request could not be demultiplexed."""
+  pass
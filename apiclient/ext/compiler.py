@@ -0,0 +1,133 @@
+# Copyright (C) 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compiles discovery documents into Python modules.
+
+The generated module holds the tables which apiclient.discovery otherwise
+computes from the discovery document on every process start, so that build()
+can create the Resource classes of the service without parsing the document.
+build() only uses the module for a document with the same fingerprint, which
+is the id and revision of documents served by the discovery service and the
+MD5 of other documents, such as the bundled one.  The module is compiled from
+the bundled document by default, or from a document saved from the discovery
+service so that online builds can use it:
+
+  python -m apiclient.ext.compiler tasks v1
+  python -m apiclient.ext.compiler --document=tasks-v1.json tasks v1
+"""
+
+__author__ = 'dwightguth@google.com (Dwight Guth)'
+__all__ = ['compile_document', 'main']
+
+import os
+import pprint
+import sys
+
+from optparse import OptionParser
+
+from apiclient import discovery
+from apiclient.anyjson import simplejson
+
+
+MODULE_TEMPLATE = '''\
+# Generated by apiclient.ext.compiler from the discovery document of
+# %(service)s %(version)s.  Do not edit.
+
+"""Precomputed Resource descriptors for %(service)s %(version)s."""
+
+FINGERPRINT = %(fingerprint)r
+
+FUTURE_FINGERPRINT = %(future_fingerprint)r
+
+SERVICE = %(service_desc)s
+
+AUTH_DISCOVERY = %(auth_discovery)s
+
+RESOURCE = %(resource)s
+'''
+
+
+def compile_document(service, future=None):
+  """Compiles a discovery document into the source of a Python module.
+
+  Args:
+    service: string, discovery document
+    future: string, discovery document with future capabilities, or None
+
+  Returns:
+    The source of the module as a string.
+  """
+  serviceDesc = simplejson.loads(service)
+  if future:
+    futureDesc = simplejson.loads(future)
+    auth_discovery = futureDesc.get('auth', {})
+  else:
+    futureDesc = {}
+    auth_discovery = {}
+  resource = discovery.compileResource(serviceDesc, futureDesc)
+  return MODULE_TEMPLATE % {
+      'service': serviceDesc.get('name', ''),
+      'version': serviceDesc.get('version', ''),
+      'fingerprint': discovery.fingerprint(service),
+      'future_fingerprint': discovery.fingerprint(future),
+      'service_desc': pprint.pformat({
+          'basePath': serviceDesc['basePath'],
+          'features': serviceDesc.get('features', []),
+          }),
+      'auth_discovery': pprint.pformat(auth_discovery),
+      'resource': pprint.pformat(resource),
+      }
+
+
+def main(argv):
+  """Compiles the bundled discovery document of a service.
+
+  Args:
+    argv: list of string, the command line arguments
+  """
+  parser = OptionParser(usage='%prog [options] serviceName version')
+  parser.add_option('--document', dest='document',
+                    help='discovery document to compile, by default '
+                    'apiclient/contrib/<serviceName>/<version>.json')
+  parser.add_option('--output', dest='output',
+                    help='module to write, by default the one build() loads')
+  options, args = parser.parse_args(argv[1:])
+  if len(args) != 2:
+    parser.error('expected a service name and a version')
+  serviceName, version = args
+
+  contrib = os.path.join(os.path.dirname(discovery.__file__), 'contrib',
+                         serviceName)
+  document = options.document or os.path.join(contrib, '%s.json' % version)
+  output = options.output or os.path.join(
+      contrib,
+      discovery.compiledModuleName(serviceName, version).split('.')[-1] +
+      '.py')
+
+  service = file(document, 'r').read()
+  try:
+    future = file(os.path.join(contrib, 'future.json'), 'r').read()
+  except IOError:
+    future = None
+
+  f = file(output, 'w')
+  try:
+    f.write(compile_document(service, future))
+  finally:
+    f.close()
+  print 'Wrote %s' % output
+
+
+if __name__ == '__main__':
+  main(sys.argv)
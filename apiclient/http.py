@@ -21,17 +21,223 @@ actuall HTTP request.
 
 __author__ = 'jcgregorio@google.com (Joe Gregorio)'
 __all__ = [
-    'HttpRequest', 'RequestMockBuilder', 'HttpMock'
-    'set_user_agent', 'tunnel_patch'
+    'HttpRequest', 'HttpFuture', 'BatchHttpRequest', 'RetryPolicy',
+    'RequestMockBuilder', 'HttpMock', 'set_user_agent', 'tunnel_patch',
+    'wait_all', 'as_completed', 'request_builder'
     ]
 
+import email.parser
+import email.Utils
+import httplib
 import httplib2
+import logging
 import os
+import random
+import socket
+import sys
+import time
+import urlparse
+import uuid
 
 from model import JsonModel
+from errors import BatchError
 from errors import HttpError
 from anyjson import simplejson
 
+try:
+  from google.appengine.api import apiproxy_stub_map
+  from google.appengine.api import urlfetch
+  from google.appengine.api import urlfetch_errors
+  TRANSIENT_ERRORS = (socket.error, httplib.HTTPException,
+                      urlfetch_errors.Error)
+except ImportError:
+  # not running on App Engine, so futures execute their request when their
+  # result is asked for.
+  apiproxy_stub_map = None
+  urlfetch = None
+  TRANSIENT_ERRORS = (socket.error, httplib.HTTPException)
+
+
+# HTTP methods of the requests which are sent again after a server error or a
+# transport error, since sending them twice has no further effect.
+RETRY_METHODS = ('GET', 'HEAD')
+
+
+class RetryPolicy(object):
+  """Decides when and after how long a failed request is sent again.
+
+  Requests are retried on the statuses in retry_statuses, on 403 responses
+  whose error reason is in retry_reasons, and on the transport errors in
+  retry_errors.  Only requests whose method is in retry_methods are retried
+  this way, since a 5xx response or a transport error does not tell whether
+  the server has carried out the request, and sending an insert again could
+  create the same resource twice.  Requests with other methods are only
+  retried on responses which say that the request was refused because of a
+  rate limit: the statuses in rate_limit_statuses and 403 responses whose
+  error reason is in rate_limit_reasons.
+
+  The n-th retry waits initial_delay * multiplier ** (n - 1) seconds, at most
+  max_delay, scaled by a random factor between 1 - jitter and 1 + jitter,
+  unless the response has a Retry-After header.
+
+  A policy may be shared by all requests of a job, in which case budget
+  bounds the retries of the whole job.  counters holds the number of
+  attempts, retries and retried responses by status or error, and the
+  seconds spent waiting, for monitoring.
+  """
+
+  def __init__(self, max_retries=5, initial_delay=0.5, max_delay=30,
+               multiplier=2, jitter=0.5, budget=None,
+               retry_statuses=(429, 500, 502, 503, 504),
+               retry_reasons=('rateLimitExceeded', 'userRateLimitExceeded',
+                              'backendError'),
+               retry_errors=TRANSIENT_ERRORS, retry_methods=RETRY_METHODS,
+               rate_limit_statuses=(429,),
+               rate_limit_reasons=('rateLimitExceeded',
+                                   'userRateLimitExceeded'),
+               sleep=time.sleep):
+    """Constructor for a RetryPolicy.
+
+    Args:
+      max_retries: int, the number of times a single request is retried.
+      initial_delay: float, the seconds waited before the first retry.
+      max_delay: float, the maximum seconds waited before any retry,
+                 including those asked for with Retry-After.
+      multiplier: float, the factor by which the delay grows per retry.
+      jitter: float, the maximum relative random change of each delay.
+      budget: int, the number of retries left for all requests sharing the
+              policy, or None for no limit.
+      retry_statuses: list of int, the HTTP statuses which are retried.
+      retry_reasons: list of string, the reasons of 403 errors which are
+                     retried.
+      retry_errors: tuple of exception classes which are retried.
+      retry_methods: list of string, the HTTP methods of the requests which
+                     are retried on retry_statuses, retry_reasons and
+                     retry_errors.
+      rate_limit_statuses: list of int, the HTTP statuses on which requests
+                           with other methods are retried.
+      rate_limit_reasons: list of string, the reasons of 403 errors on which
+                          requests with other methods are retried.
+      sleep: callable, waits for the number of seconds passed to it.
+    """
+    self.max_retries = max_retries
+    self.initial_delay = initial_delay
+    self.max_delay = max_delay
+    self.multiplier = multiplier
+    self.jitter = jitter
+    self.budget = budget
+    self.retry_statuses = retry_statuses
+    self.retry_reasons = retry_reasons
+    self.retry_errors = retry_errors
+    self.retry_methods = retry_methods
+    self.rate_limit_statuses = rate_limit_statuses
+    self.rate_limit_reasons = rate_limit_reasons
+    self.sleep = sleep
+    self.counters = {'attempts': 0, 'retries': 0, 'budget_exhausted': 0,
+                     'sleep_seconds': 0.0}
+
+  def is_retryable(self, resp, content, method='GET'):
+    """Whether a response has a status or error reason which is retried."""
+    if method in self.retry_methods:
+      statuses, reasons = self.retry_statuses, self.retry_reasons
+    else:
+      statuses, reasons = self.rate_limit_statuses, self.rate_limit_reasons
+    if resp.status in statuses:
+      return True
+    if resp.status != 403 or not reasons:
+      return False
+    try:
+      errors = simplejson.loads(content)['error']['errors']
+    except (ValueError, KeyError, TypeError):
+      return False
+    for error in errors:
+      if error.get('reason') in reasons:
+        return True
+    return False
+
+  def should_retry(self, retries, resp=None, content=None, exception=None,
+                   method='GET'):
+    """Decides whether a failed attempt of a request is retried.
+
+    Waits before returning True, and updates the counters.
+
+    Args:
+      retries: int, the number of times the request has been retried.
+      resp: httplib2.Response, the response of the attempt, if any.
+      content: string, the body of the response.
+      exception: Exception, the error raised by the attempt, if any.
+      method: string, the HTTP method of the request.
+
+    Returns:
+      True if the request should be sent again.
+    """
+    delay = self.retry_delay(retries, resp, content, exception, method)
+    if delay is None:
+      return False
+    self.wait(delay)
+    return True
+
+  def retry_delay(self, retries, resp=None, content=None, exception=None,
+                  method='GET'):
+    """Decides whether a failed attempt of a request is retried, and when.
+
+    Updates the counters and the budget as should_retry does, but leaves the
+    waiting to the caller, which may retry several requests after one wait.
+
+    Args:
+      As for should_retry.
+
+    Returns:
+      The seconds to wait before sending the request again, or None if it
+      should not be sent again.
+    """
+    if exception is not None:
+      if (method not in self.retry_methods or
+          not isinstance(exception, self.retry_errors)):
+        return None
+      cause = '%s.%s' % (exception.__class__.__module__,
+                         exception.__class__.__name__)
+    else:
+      if not self.is_retryable(resp, content, method):
+        return None
+      cause = 'status_%d' % resp.status
+    if retries >= self.max_retries:
+      return None
+    if self.budget is not None:
+      if self.budget <= 0:
+        self.counters['budget_exhausted'] += 1
+        return None
+      self.budget -= 1
+
+    delay = self.initial_delay * self.multiplier ** retries
+    delay *= 1 + self.jitter * (2 * random.random() - 1)
+    retry_after = _retry_after(resp)
+    if retry_after is not None:
+      delay = retry_after
+    delay = max(0, min(delay, self.max_delay))
+    self.counters['retries'] += 1
+    self.counters[cause] = self.counters.get(cause, 0) + 1
+    logging.info('Retrying in %.1f seconds after %s' % (delay, cause))
+    return delay
+
+  def wait(self, delay):
+    """Waits for delay seconds before a retry, and counts the time."""
+    self.counters['sleep_seconds'] += delay
+    self.sleep(delay)
+
+
+def _retry_after(resp):
+  """Returns the seconds a response asks to wait with Retry-After, or None."""
+  if resp is None or 'retry-after' not in resp:
+    return None
+  value = resp['retry-after'].strip()
+  if value.isdigit():
+    return int(value)
+  date = email.Utils.parsedate_tz(value)
+  if date is None:
+    return None
+  return email.Utils.mktime_tz(date) - time.time()
+
 
 class HttpRequest(object):
   """Encapsulates a single HTTP request.
@@ -41,7 +247,9 @@ class HttpRequest(object):
                method='GET',
                body=None,
                headers=None,
-               methodId=None):
+               methodId=None,
+               retry_policy=None,
+               rate_limiter=None):
     """Constructor for an HttpRequest.
 
     Args:
@@ -54,6 +262,10 @@ class HttpRequest(object):
       body: string, the request body of the HTTP request
       headers: dict, the HTTP request headers
       methodId: string, a unique identifier for the API method being called.
+      retry_policy: RetryPolicy, decides which failed attempts are retried,
+                    or None to never retry.
+      rate_limiter: apiclient.ratelimit.RateLimiter, paces every attempt, or
+                    None to send attempts right away.
     """
     self.uri = uri
     self.method = method
@@ -61,6 +273,8 @@ class HttpRequest(object):
     self.headers = headers or {}
     self.http = http
     self.postproc = postproc
+    self.retry_policy = retry_policy
+    self.rate_limiter = rate_limiter
 
   def execute(self, http=None):
     """Execute the request.
@@ -79,14 +293,431 @@ class HttpRequest(object):
     """
     if http is None:
       http = self.http
-    resp, content = http.request(self.uri, self.method,
-                                      body=self.body,
-                                      headers=self.headers)
+    policy = self.retry_policy
+    retries = 0
+    while True:
+      if policy is not None:
+        policy.counters['attempts'] += 1
+      if self.rate_limiter is not None:
+        self.rate_limiter.acquire()
+      try:
+        resp, content = http.request(self.uri, self.method,
+                                          body=self.body,
+                                          headers=self.headers)
+      except Exception, e:
+        if policy is None or not policy.should_retry(retries, exception=e,
+                                                      method=self.method):
+          raise
+      else:
+        if self.rate_limiter is not None:
+          self.rate_limiter.observe(resp, content)
+        if resp.status < 300:
+          break
+        if policy is None or not policy.should_retry(retries, resp, content,
+                                                      method=self.method):
+          raise HttpError(resp, content, self.uri)
+      retries += 1
 
-    if resp.status >= 300:
-      raise HttpError(resp, content, self.uri)
     return self.postproc(resp, content)
 
+  def execute_async(self, http=None, deadline=None):
+    """Start executing the request without waiting for the response.
+
+    On App Engine, a request whose http object was authorized by
+    OAuth2Credentials is sent with an asynchronous urlfetch call.  Otherwise,
+    and when the access token is about to expire, the request is executed
+    synchronously when the result of the future is first asked for, so that
+    the authorized http object can refresh the credentials.
+
+    Args:
+      http: httplib2.Http, an http object to be used in place of the
+            one the HttpRequest request object was constructed with.
+      deadline: float, the urlfetch deadline in seconds, or None for the
+                default deadline.
+
+    Returns:
+      An HttpFuture whose result() returns what execute() would have.
+    """
+    if http is None:
+      http = self.http
+    credentials = getattr(http.request, 'credentials', None)
+    if (urlfetch is None or credentials is None or
+        credentials.access_token_expired):
+      return HttpFuture(self, http)
+
+    headers = dict(self.headers)
+    # urlfetch takes care of compression on its own.
+    headers.pop('accept-encoding', None)
+    headers['authorization'] = 'OAuth ' + credentials.access_token
+    if 'user-agent' in headers:
+      headers['user-agent'] = (credentials.user_agent + ' ' +
+                               headers['user-agent'])
+    else:
+      headers['user-agent'] = credentials.user_agent
+    if self.rate_limiter is not None:
+      self.rate_limiter.acquire()
+    rpc = urlfetch.create_rpc(deadline=deadline)
+    urlfetch.make_fetch_call(rpc, self.uri, payload=self.body,
+                             method=self.method, headers=headers)
+    return HttpFuture(self, http, rpc)
+
+
+class HttpFuture(object):
+  """The eventual result of HttpRequest.execute_async().
+
+  Do not construct directly, instead use HttpRequest.execute_async().
+  """
+
+  def __init__(self, request, http, rpc=None):
+    """Constructor for an HttpFuture.
+
+    Args:
+      request: HttpRequest, the request being executed.
+      http: httplib2.Http, the http object executing the request.
+      rpc: the urlfetch RPC fetching the request, or None if the request is
+           executed when the result is asked for.
+    """
+    self.request = request
+    self.http = http
+    self.rpc = rpc
+    self._outcome = None
+
+  def result(self):
+    """Wait for the request to complete.
+
+    Returns:
+      A deserialized object model of the response body as determined
+      by the postproc.
+
+    Raises:
+      apiclient.errors.HttpError if the response was not a 2xx.
+      httplib2.Error if a transport error has occured.
+    """
+    if self._outcome is None:
+      try:
+        self._outcome = (self._compute(), None)
+      except Exception:
+        self._outcome = (None, sys.exc_info())
+    value, exc_info = self._outcome
+    if exc_info is not None:
+      raise exc_info[0], exc_info[1], exc_info[2]
+    return value
+
+  def _compute(self):
+    """Computes the result of the request."""
+    if self.rpc is None:
+      return self.request.execute(self.http)
+    result = self.rpc.get_result()
+    if result.status_code == 401:
+      # the access token has expired.  The authorized http object refreshes
+      # the credentials on a 401.
+      logging.info('Refreshing because we got a 401')
+      return self.request.execute(self.http)
+    info = dict(result.headers)
+    info['status'] = str(result.status_code)
+    resp = httplib2.Response(info)
+    content = httplib2._decompressContent(resp, result.content)
+    if self.request.rate_limiter is not None:
+      self.request.rate_limiter.observe(resp, content)
+    if resp.status >= 300:
+      policy = self.request.retry_policy
+      if (policy is not None and
+          policy.is_retryable(resp, content, self.request.method)):
+        # the retries are made synchronously by execute.
+        return self.request.execute(self.http)
+      raise HttpError(resp, content, self.request.uri)
+    return self.request.postproc(resp, content)
+
+
+def request_builder(retry_policy=None, rate_limiter=None):
+  """Creates a requestBuilder for apiclient.discovery.build().
+
+  Args:
+    retry_policy: RetryPolicy, shared by all requests the service builds.
+    rate_limiter: apiclient.ratelimit.RateLimiter, paces all requests the
+                  service builds.
+
+  Returns:
+    A callable with the signature of the HttpRequest constructor.
+  """
+  def build_request(http, postproc, uri, method='GET', body=None,
+                    headers=None, methodId=None):
+    return HttpRequest(http, postproc, uri, method=method, body=body,
+                       headers=headers, methodId=methodId,
+                       retry_policy=retry_policy, rate_limiter=rate_limiter)
+  return build_request
+
+
+def as_completed(futures):
+  """Iterate over futures in the order in which they complete.
+
+  Futures without an urlfetch RPC are considered complete once all futures
+  before them have been handed out, since they execute when their result is
+  asked for.
+
+  Args:
+    futures: list of HttpFuture, the futures to wait for.
+
+  Yields:
+    Each of the futures.
+  """
+  pending = list(futures)
+  while pending:
+    rpcs = [future.rpc for future in pending if future.rpc is not None]
+    done = None
+    if (apiproxy_stub_map is not None and len(rpcs) == len(pending) and
+        hasattr(apiproxy_stub_map.UserRPC, 'wait_any')):
+      done = apiproxy_stub_map.UserRPC.wait_any(rpcs)
+    for i, future in enumerate(pending):
+      if done is None or future.rpc is done:
+        yield pending.pop(i)
+        break
+
+
+def wait_all(futures):
+  """Wait for all futures to complete.
+
+  Args:
+    futures: list of HttpFuture, the futures to wait for.
+
+  Returns:
+    The list of their results, in the order of futures.
+
+  Raises:
+    The exception of the first future, in the order of futures, whose
+    request failed.
+  """
+  for future in as_completed(futures):
+    try:
+      future.result()
+    except Exception:
+      pass
+  return [future.result() for future in futures]
+
+
+class BatchHttpRequest(object):
+  """Sends many HttpRequests as one multipart/mixed batch request.
+
+  Each request added to the batch becomes one application/http part of the
+  batch request, and each part of the response is handed to the callback of
+  its request after going through the postproc of the request.  Parts which
+  failed in a way the RetryPolicy of the batch retries are sent again in a
+  new batch request, after waiting for the longest delay the policy gives
+  any of them.
+
+  Example:
+    def insert_done(request_id, response, exception):
+      if exception is not None:
+        raise exception
+      ids[request_id] = response['id']
+
+    batch = BatchHttpRequest(callback=insert_done)
+    for task in tasks:
+      batch.add(service.tasks().insert(tasklist=tasklist, body=task))
+    batch.execute()
+  """
+
+  def __init__(self, callback=None, batch_uri=None, max_retries=3,
+               retry_policy=None):
+    """Constructor for a BatchHttpRequest.
+
+    Args:
+      callback: callable, called with (request_id, response, exception) for
+                each request which has no callback of its own.  response is
+                the deserialized response of the request and exception is None,
+                or response is None and exception is the HttpError or other
+                exception raised by the postproc of the request.
+      batch_uri: string, the URI the batch request is sent to, by default
+                 /batch on the host of the first request.
+      max_retries: int, how many times a failed part is sent again, if
+                   neither retry_policy nor the first request of the batch
+                   has a RetryPolicy.
+      retry_policy: RetryPolicy, decides which failed parts are sent again
+                    and when, by default the retry_policy of the first
+                    request of the batch, so that the parts share the budget
+                    of the requests of the job.
+    """
+    self._callback = callback
+    self._batch_uri = batch_uri
+    self._max_retries = max_retries
+    self._retry_policy = retry_policy
+    self._base_id = str(uuid.uuid4())
+    self._order = []
+    self._requests = {}
+    self._callbacks = {}
+
+  def add(self, request, callback=None, request_id=None):
+    """Adds a request to the batch.
+
+    Args:
+      request: HttpRequest, the request to send as part of the batch.
+      callback: callable, called as described in the constructor with the
+                result of this request instead of the callback of the batch.
+      request_id: string, identifies the request in the callback, by default
+                  its position in the batch starting at "1".
+
+    Raises:
+      KeyError: if request_id is already used in the batch.
+    """
+    if request_id is None:
+      request_id = str(len(self._order) + 1)
+    if request_id in self._requests:
+      raise KeyError('A request with the id %s is already in the batch.' %
+                     request_id)
+    self._order.append(request_id)
+    self._requests[request_id] = request
+    self._callbacks[request_id] = callback
+
+  def execute(self, http=None):
+    """Sends the batch and calls the callbacks in the order of the requests.
+
+    Args:
+      http: httplib2.Http, an http object to be used in place of the one the
+            first request of the batch was constructed with.
+
+    Raises:
+      apiclient.errors.HttpError if the batch request itself was not a 2xx.
+      apiclient.errors.BatchError if the response could not be
+        demultiplexed.
+      httplib2.Error if a transport error has occured.
+    """
+    if not self._order:
+      return
+    first = self._requests[self._order[0]]
+    if http is None:
+      http = first.http
+    policy = (self._retry_policy or getattr(first, 'retry_policy', None) or
+              RetryPolicy(max_retries=self._max_retries))
+
+    responses = {}
+    pending = list(self._order)
+    retries = 0
+    while pending:
+      policy.counters['attempts'] += len(pending)
+      responses.update(self._send(http, pending))
+      retried = []
+      delay = 0
+      for request_id in pending:
+        resp, content = responses[request_id]
+        if resp.status < 300:
+          continue
+        part_delay = policy.retry_delay(
+            retries, resp, content, method=self._requests[request_id].method)
+        if part_delay is not None:
+          retried.append(request_id)
+          delay = max(delay, part_delay)
+      if retried:
+        policy.wait(delay)
+      pending = retried
+      retries += 1
+
+    for request_id in self._order:
+      resp, content = responses[request_id]
+      request = self._requests[request_id]
+      response = None
+      exception = None
+      try:
+        if resp.status >= 300:
+          raise HttpError(resp, content, request.uri)
+        response = request.postproc(resp, content)
+      except Exception, e:
+        exception = e
+      callback = self._callbacks[request_id] or self._callback
+      if callback is not None:
+        callback(request_id, response, exception)
+
+  def _send(self, http, request_ids):
+    """Sends one batch request for some of the requests of the batch.
+
+    Args:
+      http: httplib2.Http, the http object to send the batch request with.
+      request_ids: list of string, the ids of the requests to send.
+
+    Returns:
+      A dict from request id to the (httplib2.Response, content) of its part.
+    """
+    boundary = '===============%s==' % uuid.uuid4().hex
+    parts = []
+    for request_id in request_ids:
+      parts.append('--%s\r\n'
+                   'Content-Type: application/http\r\n'
+                   'Content-Transfer-Encoding: binary\r\n'
+                   'Content-ID: <%s+%s>\r\n'
+                   '\r\n%s\r\n' % (
+                       boundary, self._base_id, request_id,
+                       self._serialize(self._requests[request_id])))
+    parts.append('--%s--\r\n' % boundary)
+    body = ''.join(parts)
+
+    uri = self._batch_uri
+    if uri is None:
+      first = urlparse.urlparse(self._requests[request_ids[0]].uri)
+      uri = '%s://%s/batch' % (first[0], first[1])
+    headers = {'content-type': 'multipart/mixed; boundary="%s"' % boundary}
+    # every part counts against the rate limits of the API.
+    rate_limiter = getattr(self._requests[request_ids[0]], 'rate_limiter',
+                           None)
+    if rate_limiter is not None:
+      rate_limiter.acquire(len(request_ids))
+    resp, content = http.request(uri, 'POST', body=body, headers=headers)
+    if resp.status >= 300:
+      raise HttpError(resp, content, uri)
+
+    parser = email.parser.FeedParser()
+    parser.feed('content-type: %s\r\n\r\n' % resp['content-type'])
+    parser.feed(content)
+    message = parser.close()
+    if not message.is_multipart():
+      raise BatchError('Response to the batch request is not multipart.')
+
+    responses = {}
+    prefix = '<response-%s+' % self._base_id
+    for part in message.get_payload():
+      content_id = part.get('Content-ID', '')
+      if not content_id.startswith(prefix) or not content_id.endswith('>'):
+        raise BatchError('Unexpected Content-ID in batch response: %s' %
+                         content_id)
+      responses[content_id[len(prefix):-1]] = self._deserialize(
+          part.get_payload())
+    if rate_limiter is not None:
+      for part_resp, part_content in responses.itervalues():
+        rate_limiter.observe(part_resp, part_content)
+    for request_id in request_ids:
+      if request_id not in responses:
+        raise BatchError('No response to request %s of the batch.' %
+                         request_id)
+    return responses
+
+  def _serialize(self, request):
+    """Converts an HttpRequest into the application/http body of a part."""
+    parsed = urlparse.urlparse(request.uri)
+    path = urlparse.urlunparse(('', '', parsed[2], parsed[3], parsed[4], ''))
+    lines = ['%s %s HTTP/1.1' % (request.method, path)]
+    for key, value in request.headers.iteritems():
+      lines.append('%s: %s' % (key, value))
+    body = request.body or ''
+    if body:
+      lines.append('content-length: %d' % len(body))
+    return '\r\n'.join(lines) + '\r\n\r\n' + body
+
+  def _deserialize(self, payload):
+    """Converts the application/http body of a part into a response.
+
+    Returns:
+      A (httplib2.Response, content) tuple.
+    """
+    status_line, payload = payload.split('\n', 1)
+    status_line = status_line.strip().split(' ', 2)
+    message = email.parser.Parser().parsestr(payload)
+    info = {}
+    for key, value in message.items():
+      info[key.lower()] = value
+    info['status'] = status_line[1]
+    resp = httplib2.Response(info)
+    if len(status_line) > 2:
+      resp.reason = status_line[2]
+    return resp, message.get_payload()
+
 
 class HttpRequestMock(object):
   """Mock of HttpRequest.
@@ -119,6 +750,14 @@ class HttpRequestMock(object):
     """
     return self.postproc(self.resp, self.content)
 
+  def execute_async(self, http=None, deadline=None):
+    """Start executing the request.
+
+    Same behavior as HttpRequest.execute_async(), but the result is computed
+    by execute() when it is asked for.
+    """
+    return HttpFuture(self, http)
+
 
 class RequestMockBuilder(object):
   """A simple mock of HttpRequest
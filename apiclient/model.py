@@ -24,18 +24,54 @@ object representation.
 
 __author__ = 'jcgregorio@google.com (Joe Gregorio)'
 
-import gflags
 import logging
+import re
+import sys
 import urllib
 
 from anyjson import simplejson
 from errors import HttpError
 
-FLAGS = gflags.FLAGS
 
-gflags.DEFINE_boolean('dump_request_response', False,
-                      'Dump all http server requests and responses. '
-                     )
+class _Flag(object):
+  """Holds the value of a flag when gflags is not loaded."""
+
+  def __init__(self, value):
+    self.value = value
+
+
+# Value of dump_request_response until define_flags is called.
+_DUMP_FLAG = _Flag(False)
+
+
+def define_flags():
+  """Defines the command line flags of this module with gflags.
+
+  gflags is a large module which only programs parsing command line flags
+  need, so this module does not import it, and on App Engine it is never
+  loaded.  The flags are defined when this module is imported after gflags;
+  programs which import gflags afterwards must call this function before
+  they parse their command line.  apiclient.oauth2client.tools calls it.
+  Until then, dump_request_response is False.
+  """
+  global FLAGS, _DUMP_FLAG
+  import gflags
+  FLAGS = gflags.FLAGS
+  if 'dump_request_response' not in FLAGS.FlagDict():
+    gflags.DEFINE_boolean('dump_request_response', False,
+                          'Dump all http server requests and responses. '
+                         )
+  # The flag itself, whose value is cheaper to read than FLAGS' attribute.
+  _DUMP_FLAG = FLAGS.FlagDict()['dump_request_response']
+
+
+if 'gflags' in sys.modules:
+  define_flags()
+
+# JSON modules tried after anyjson's if it lacks C speedups, as (codec name,
+# module name) in order of preference.
+JSON_MODULES = [('simplejson', 'simplejson'), ('json', 'json'),
+                ('django', 'django.utils.simplejson')]
 
 
 def _abstract():
@@ -106,7 +142,7 @@ class BaseModel(Model):
 
   def _log_request(self, headers, path_params, query, body):
     """Logs debugging information about the request if requested."""
-    if FLAGS.dump_request_response:
+    if _DUMP_FLAG.value:
       logging.info('--request-start--')
       logging.info('-headers-start-')
       for h, v in headers.iteritems():
@@ -176,7 +212,7 @@ class BaseModel(Model):
 
   def _log_response(self, resp, content):
     """Logs debugging information about the response if requested."""
-    if FLAGS.dump_request_response:
+    if _DUMP_FLAG.value:
       logging.info('--response-start--')
       for h, v in resp.iteritems():
         logging.info('%s: %s', h, v)
@@ -243,22 +279,52 @@ class JsonModel(BaseModel):
   content_type = 'application/json'
   alt_param = 'json'
 
-  def __init__(self, data_wrapper=False):
+  def __init__(self, data_wrapper=False, lazy_items=False, codec=None):
     """Construct a JsonModel.
 
     Args:
       data_wrapper: boolean, wrap requests and responses in a data wrapper
+      lazy_items: boolean, deserialize the "items" list of a response into a
+        LazyItems object instead of a list, so that the items are decoded
+        one at a time as they are iterated over
+      codec: string, the name of the registered JsonCodec to use, or None
+        for the fastest one available
     """
     self._data_wrapper = data_wrapper
+    self._lazy_items = lazy_items
+    self._codec = codec
 
-  def serialize(self, body_value):
+  def serialize(self, body_value, codec=None):
+    """Serializes body_value as JSON.
+
+    Args:
+      body_value: object, the request body as a Python object.
+      codec: string, the name of the JsonCodec to use for this call only.
+
+    Returns:
+      string, the body in serialized form.
+    """
     if (isinstance(body_value, dict) and 'data' not in body_value and
         self._data_wrapper):
       body_value = {'data': body_value}
-    return simplejson.dumps(body_value)
+    return get_codec(codec or self._codec).dumps(body_value)
 
-  def deserialize(self, content):
-    body = simplejson.loads(content)
+  def deserialize(self, content, codec=None):
+    """Deserializes a JSON response body.
+
+    Args:
+      content: string, the body of the HTTP response
+      codec: string, the name of the JsonCodec to use for this call only.
+
+    Returns:
+      The body de-serialized as a Python object.
+    """
+    codec = get_codec(codec or self._codec)
+    body = None
+    if self._lazy_items and codec.decoder is not None:
+      body = _lazy_loads(content, codec.decoder)
+    if body is None:
+      body = codec.loads(content)
     if isinstance(body, dict) and 'data' in body:
       body = body['data']
     return body
@@ -268,6 +334,246 @@ class JsonModel(BaseModel):
     return {}
 
 
+# Matches JSON whitespace.
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Matches JSON text up to the next bracket which is not inside a string.
+_NO_BRACKETS = re.compile(
+    r'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*', re.DOTALL)
+
+# Matches JSON text up to the next bracket or comma which is not inside a
+# string.
+_NO_STRUCTURE = re.compile(
+    r'[^"\[\]{},]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{},]*)*', re.DOTALL)
+
+
+def _scan_array(content, pos):
+  """Finds the end of the JSON array starting at pos and counts its elements.
+
+  Args:
+    content: string, the JSON document holding the array.
+    pos: int, the index of the opening bracket of the array.
+
+  Returns:
+    A tuple of the index just after the closing bracket of the array and
+    the number of elements of the array.
+
+  Raises:
+    ValueError: if the array is not terminated.
+  """
+  pos = _WHITESPACE.match(content, pos + 1).end()
+  if content[pos:pos + 1] == ']':
+    return pos + 1, 0
+  count = 1
+  depth = 1
+  while True:
+    # only commas between the elements are of interest, so nested values are
+    # skipped from bracket to bracket.
+    if depth == 1:
+      pos = _NO_STRUCTURE.match(content, pos).end()
+    else:
+      pos = _NO_BRACKETS.match(content, pos).end()
+    char = content[pos:pos + 1]
+    pos += 1
+    if char == ',':
+      count += 1
+    elif char == '[' or char == '{':
+      depth += 1
+    elif char == ']' or char == '}':
+      depth -= 1
+      if depth == 0:
+        return pos, count
+    else:
+      raise ValueError('Unterminated JSON array')
+
+
+def _lazy_loads(content, decoder):
+  """Decodes a JSON object, leaving its "items" array undecoded.
+
+  Args:
+    content: string, the body of the HTTP response
+    decoder: the JSONDecoder decoding everything but the items.
+
+  Returns:
+    A dict whose "items" value, if any, is a LazyItems object, or None if
+    content is not an object.
+  """
+  pos = _WHITESPACE.match(content).end()
+  if content[pos:pos + 1] != '{':
+    return None
+  body = {}
+  pos = _WHITESPACE.match(content, pos + 1).end()
+  if content[pos:pos + 1] == '}':
+    return body
+  while True:
+    key, pos = decoder.raw_decode(content, idx=pos)
+    pos = _WHITESPACE.match(content, pos).end()
+    if content[pos:pos + 1] != ':':
+      raise ValueError('Expecting : at %d' % pos)
+    pos = _WHITESPACE.match(content, pos + 1).end()
+    if key == 'items' and content[pos:pos + 1] == '[':
+      end, length = _scan_array(content, pos)
+      body[key] = LazyItems(content, pos, end, decoder, length)
+      pos = end
+    else:
+      body[key], pos = decoder.raw_decode(content, idx=pos)
+    pos = _WHITESPACE.match(content, pos).end()
+    char = content[pos:pos + 1]
+    pos += 1
+    if char == '}':
+      return body
+    if char != ',':
+      raise ValueError('Expecting , or } at %d' % (pos - 1))
+    pos = _WHITESPACE.match(content, pos).end()
+
+
+class LazyItems(object):
+  """A JSON array decoded one element at a time as it is iterated over.
+
+  Only the response body is kept, so that a page of results never has to
+  exist as a list of dicts all at once.  Every iteration decodes the elements
+  again.
+  """
+
+  def __init__(self, content, start, end, decoder, length=None):
+    """Constructs a LazyItems.
+
+    Args:
+      content: string, the JSON document holding the array.
+      start: int, the index of the opening bracket of the array.
+      end: int, the index just after the closing bracket of the array.
+      decoder: the JSONDecoder decoding the elements.
+      length: int, the number of elements of the array, or None to count
+        them when the length is first asked for.
+    """
+    self._content = content
+    self._start = start
+    self._end = end
+    self._decoder = decoder
+    self._len = length
+
+  def __iter__(self):
+    content = self._content
+    pos = _WHITESPACE.match(content, self._start + 1).end()
+    if content[pos:pos + 1] == ']':
+      return
+    while True:
+      item, pos = self._decoder.raw_decode(content, idx=pos)
+      yield item
+      pos = _WHITESPACE.match(content, pos).end()
+      if content[pos:pos + 1] != ',':
+        return
+      pos = _WHITESPACE.match(content, pos + 1).end()
+
+  def __len__(self):
+    # list() asks for the length before iterating, so the elements are
+    # counted without decoding them.
+    if self._len is None:
+      self._len = _scan_array(self._content, self._start)[1]
+    return self._len
+
+  def __nonzero__(self):
+    content = self._content
+    pos = _WHITESPACE.match(content, self._start + 1).end()
+    return content[pos:pos + 1] != ']'
+
+
+class JsonCodec(object):
+  """The functions of a JSON module which JsonModel uses.
+
+  Attributes:
+    name: string, the name the codec is registered under.
+    dumps: function, serializes a Python object as JSON.
+    loads: function, deserializes a JSON document.
+    decoder: the JSONDecoder used for lazy items, or None if the module's
+      decoder has no raw_decode.
+    speedups: boolean, whether the module decodes strings in C.
+  """
+
+  def __init__(self, name, module):
+    """Constructs a JsonCodec.
+
+    Args:
+      name: string, the name the codec is registered under.
+      module: the JSON module, such as simplejson or json.
+    """
+    self.name = name
+    self.dumps = module.dumps
+    self.loads = module.loads
+    self.decoder = module.JSONDecoder()
+    if not hasattr(self.decoder, 'raw_decode'):
+      self.decoder = None
+    decoder_module = getattr(module, 'decoder', None)
+    self.speedups = getattr(decoder_module, 'c_scanstring', None) is not None
+
+
+_codecs = {}
+_default_codec = None
+
+
+def register_codec(name, module, default=False):
+  """Registers a JSON module for use by JsonModel.
+
+  Args:
+    name: string, the name JsonModel selects the codec by.
+    module: the JSON module, which must provide dumps, loads and JSONDecoder.
+    default: boolean, use the codec whenever JsonModel is not given one.
+
+  Returns:
+    The registered JsonCodec.
+  """
+  global _default_codec
+  codec = JsonCodec(name, module)
+  _codecs[name] = codec
+  if default:
+    _default_codec = codec
+  return codec
+
+
+def get_codec(name=None):
+  """Returns the registered JsonCodec called name.
+
+  Args:
+    name: string, the name of the codec, or None for the default codec.
+
+  Returns:
+    A JsonCodec.
+
+  Raises:
+    ValueError: if no codec is registered under name.
+  """
+  if name is None:
+    return _default_codec
+  try:
+    return _codecs[name]
+  except KeyError:
+    raise ValueError('Unknown JSON codec: %s' % name)
+
+
+def _register_codecs():
+  """Registers the available JSON modules and picks the fastest as default.
+
+  anyjson's module is used unless it decodes in pure Python and one of
+  JSON_MODULES has C speedups.  Modules are only imported until one with
+  speedups is found, so django is not imported when it is not needed.
+  """
+  global _default_codec
+  _default_codec = register_codec('anyjson', simplejson)
+  if _default_codec.speedups:
+    return
+  for name, module_name in JSON_MODULES:
+    try:
+      module = __import__(module_name, {}, {}, ['loads'])
+    except ImportError:
+      continue
+    codec = register_codec(name, module)
+    if codec.speedups:
+      _default_codec = codec
+      return
+
+_register_codecs()
+
+
 class ProtocolBufferModel(BaseModel):
   """Model class for protocol buffers.
 
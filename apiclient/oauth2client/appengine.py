@@ -20,12 +20,27 @@ Utilities for making it easier to use OAuth 2.0 on Google App Engine.
 __author__ = 'jcgregorio@google.com (Joe Gregorio)'
 
 import pickle
+import time
 
+from google.appengine.api import memcache
 from google.appengine.ext import db
 from client import Credentials
 from client import Flow
 from client import Storage
 
+# Number of seconds CachedStorageByKeyName keeps credentials in memcache.
+MEMCACHE_TTL = 3600
+
+# Number of seconds CachedStorageByKeyName keeps credentials in instance
+# memory, which bounds how long other instances miss a change of them.
+LOCAL_TTL = 60
+
+# Maximum number of credentials CachedStorageByKeyName keeps in instance
+# memory.
+LOCAL_CACHE_SIZE = 500
+
+MEMCACHE_NAMESPACE = 'oauth2client'
+
 
 class FlowProperty(db.Property):
   """App Engine datastore Property for Flow.
@@ -135,3 +150,89 @@ class StorageByKeyName(Storage):
     entity = self._model.get_or_insert(self._key_name)
     setattr(entity, self._property_name, credentials)
     entity.put()
+
+
+class CachedStorageByKeyName(StorageByKeyName):
+  """StorageByKeyName which caches the credential in memory and memcache.
+
+  get() is served from a per-instance LRU cache, then from memcache, and only
+  then from the datastore, with get_by_key_name instead of the transaction of
+  get_or_insert.  put() writes through to all three, so credentials which
+  became invalid when refreshing them are seen as such at once by the
+  instance which refreshed them and within LOCAL_TTL seconds by the others.
+  Every model, key_name and property_name has to be written through this
+  class for the cache to stay consistent with the datastore.
+
+  The credential is cached pickled, so every get() returns a new object.
+  """
+
+  # Map from cache key to (last use, expiry time, pickled credential).
+  _local = {}
+
+  def _cache_key(self):
+    return '%s:%s:%s' % (self._model.kind(), self._key_name,
+                         self._property_name)
+
+  def get(self):
+    """Retrieve Credential from the caches or the datastore.
+
+    Returns:
+      apiclient.oauth2client.Credentials
+    """
+    key = self._cache_key()
+    now = time.time()
+    data = None
+    entry = self._local.get(key)
+    if entry is not None and entry[1] > now:
+      data = entry[2]
+      self._local[key] = (now, entry[1], data)
+    if data is None:
+      data = memcache.get(key, namespace=MEMCACHE_NAMESPACE)
+      if data is not None:
+        self._remember(key, data)
+    if data is not None:
+      credential = pickle.loads(data)
+    else:
+      entity = self._model.get_by_key_name(self._key_name)
+      if entity is None:
+        return None
+      credential = getattr(entity, self._property_name)
+      if credential is None:
+        return None
+      self._cache(key, credential)
+    if hasattr(credential, 'set_store'):
+      credential.set_store(self.put)
+    return credential
+
+  def put(self, credentials):
+    """Write a Credentials to the datastore and the caches.
+
+    Args:
+      credentials: Credentials, the credentials to store.
+    """
+    StorageByKeyName.put(self, credentials)
+    if credentials is None:
+      self.invalidate()
+    else:
+      self._cache(self._cache_key(), credentials)
+
+  def invalidate(self):
+    """Drops the credential from the caches, so it is read again."""
+    key = self._cache_key()
+    self._local.pop(key, None)
+    memcache.delete(key, namespace=MEMCACHE_NAMESPACE)
+
+  def _cache(self, key, credentials):
+    """Stores the credential in memcache and instance memory."""
+    data = pickle.dumps(credentials)
+    memcache.set(key, data, time=MEMCACHE_TTL, namespace=MEMCACHE_NAMESPACE)
+    self._remember(key, data)
+
+  def _remember(self, key, data):
+    """Stores the pickled credential in the per-instance LRU cache."""
+    now = time.time()
+    local = CachedStorageByKeyName._local
+    if key not in local and len(local) >= LOCAL_CACHE_SIZE:
+      oldest = min([(entry[0], k) for k, entry in local.iteritems()])[1]
+      del local[oldest]
+    local[key] = (now, now + LOCAL_TTL, data)
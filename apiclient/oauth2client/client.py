@@ -22,8 +22,11 @@ __author__ = 'jcgregorio@google.com (Joe Gregorio)'
 
 import copy
 import datetime
+import hashlib
 import httplib2
 import logging
+import threading
+import time
 import urllib
 import urlparse
 
@@ -42,6 +45,23 @@ try:
 except ImportError:
     from cgi import parse_qsl
 
+try:
+  from google.appengine.api import memcache
+except ImportError:
+  memcache = None
+
+# Access tokens are refreshed when they expire within this time, before they
+# are sent.
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Number of seconds other processes wait for the process refreshing an access
+# token before refreshing it themselves.
+REFRESH_LEASE_SECONDS = 30
+
+# Number of seconds between checks for the access token refreshed by another
+# process.
+REFRESH_POLL_INTERVAL = 0.25
+
 
 class Error(Exception):
   """Base error for this module."""
@@ -158,11 +178,21 @@ class OAuth2Credentials(Credentials):
     # refreshed.
     self._invalid = False
 
+    # Serializes the refreshes of threads sharing these credentials.
+    self._refresh_lock = threading.Lock()
+
   @property
   def invalid(self):
     """True if the credentials are invalid, such as being revoked."""
     return getattr(self, '_invalid', False)
 
+  @property
+  def access_token_expired(self):
+    """True if the access token expires within REFRESH_MARGIN."""
+    if self.token_expiry is None:
+      return False
+    return datetime.datetime.now() + REFRESH_MARGIN >= self.token_expiry
+
   def set_store(self, store):
     """Set the storage for the credential.
 
@@ -179,6 +209,7 @@ class OAuth2Credentials(Credentials):
     """
     d = copy.copy(self.__dict__)
     del d['store']
+    d.pop('_refresh_lock', None)
     return d
 
   def __setstate__(self, state):
@@ -186,8 +217,93 @@ class OAuth2Credentials(Credentials):
     """
     self.__dict__.update(state)
     self.store = None
+    self._refresh_lock = threading.Lock()
 
   def _refresh(self, http_request):
+    """Refresh the access_token, once for everyone using the refresh_token.
+
+    Threads sharing these credentials refresh one at a time, and a thread
+    which finds that the access_token changed while it waited uses the new
+    one.  Across processes a memcache lease lets a single process refresh
+    while the others wait for the access_token it publishes in memcache,
+    which they adopt without storing it again.
+
+    Args:
+       http: An instance of httplib2.Http.request
+           or something that acts like it.
+    """
+    stale_token = self.access_token
+    self._refresh_lock.acquire()
+    try:
+      if self.access_token != stale_token:
+        return
+      if memcache is None or not self.refresh_token:
+        self._do_refresh(http_request)
+        return
+
+      key = 'oauth2client-refresh-' + hashlib.sha1(
+          self.refresh_token).hexdigest()
+      if self._adopt(key, stale_token):
+        return
+      if memcache.add(key + '-lease', 1, time=REFRESH_LEASE_SECONDS):
+        try:
+          self._do_refresh(http_request)
+          self._publish(key)
+        finally:
+          memcache.delete(key + '-lease')
+        return
+
+      deadline = time.time() + REFRESH_LEASE_SECONDS
+      while time.time() < deadline:
+        time.sleep(REFRESH_POLL_INTERVAL)
+        if self._adopt(key, stale_token):
+          return
+        if memcache.get(key + '-lease') is None:
+          break
+      self._do_refresh(http_request)
+    finally:
+      self._refresh_lock.release()
+
+  def _adopt(self, key, stale_token):
+    """Takes over an access_token another process published in memcache.
+
+    Args:
+      key: string, the memcache key of the published access_token.
+      stale_token: string, the access_token which needs to be replaced.
+
+    Returns:
+      True if a fresh access_token was adopted.
+    """
+    published = memcache.get(key)
+    if published is None:
+      return False
+    access_token, refresh_token, token_expiry = published
+    if access_token == stale_token:
+      return False
+    if (token_expiry is not None and
+        datetime.datetime.now() + REFRESH_MARGIN >= token_expiry):
+      return False
+    self.access_token = access_token
+    self.refresh_token = refresh_token
+    self.token_expiry = token_expiry
+    return True
+
+  def _publish(self, key):
+    """Publishes the refreshed access_token in memcache for other processes.
+
+    Args:
+      key: string, the memcache key to publish the access_token under.
+    """
+    ttl = 0
+    if self.token_expiry is not None:
+      remaining = self.token_expiry - datetime.datetime.now()
+      ttl = remaining.days * 86400 + remaining.seconds
+      if ttl <= 0:
+        return
+    memcache.set(key, (self.access_token, self.refresh_token,
+                       self.token_expiry), time=ttl)
+
+  def _do_refresh(self, http_request):
     """Refresh the access_token using the refresh_token.
 
     Args:
@@ -270,6 +386,9 @@ class OAuth2Credentials(Credentials):
       Authorization header."""
       if headers == None:
         headers = {}
+      if self.access_token_expired:
+        logging.info("Refreshing because the access token expires soon")
+        self._refresh(request_orig)
       headers['authorization'] = 'OAuth ' + self.access_token
       if 'user-agent' in headers:
         headers['user-agent'] = self.user_agent + ' ' + headers['user-agent']
@@ -286,6 +405,9 @@ class OAuth2Credentials(Credentials):
       else:
         return (resp, content)
 
+    # lets apiclient.http send requests with the credentials on its own, such
+    # as with asynchronous urlfetch calls.
+    new_request.credentials = self
     http.request = new_request
     return http
 
@@ -30,6 +30,7 @@ import socket
 import sys
 
 from optparse import OptionParser
+from apiclient import model
 from client import FlowExchangeError
 
 try:
@@ -52,6 +53,10 @@ gflags.DEFINE_multi_int('auth_host_port', [8080, 8090],
                      ('Port to use when running a local web server to '
                        'handle redirects during OAuth authorization.'))
 
+# apiclient.model only defines its flags on its own if gflags was imported
+# before it.
+model.define_flags()
+
 
 class ClientRedirectServer(BaseHTTPServer.HTTPServer):
   """A server to handle OAuth 2.0 redirects back to localhost.
@@ -0,0 +1,249 @@
+# Copyright (C) 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client-side pacing of API requests.
+
+A RateLimiter holds one or more token buckets, typically one for the user on
+whose behalf requests are made and one for the whole project, and makes every
+request wait until each bucket has a token for it.  Buckets are shared by all
+threads of a process through bucket(), and on App Engine the requests of all
+instances are also counted per second in memcache, so that together they stay
+under the rate of the bucket.  A bucket halves its rate whenever the API
+reports that a rate limit was exceeded and grows back to its configured rate
+as requests succeed.
+"""
+
+__author__ = 'dwightguth@google.com (Dwight Guth)'
+__all__ = ['TokenBucket', 'RateLimiter', 'bucket']
+
+import logging
+import threading
+import time
+
+try:
+  from google.appengine.api import memcache
+except ImportError:
+  memcache = None
+
+from anyjson import simplejson
+
+MEMCACHE_NAMESPACE = 'apiclient.ratelimit'
+
+# Error reasons with which the API reports that a rate limit was exceeded.
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+# Lowest fraction of its configured rate a bucket slows down to.
+MIN_RATE_FRACTION = 0.125
+
+# Fraction of its configured rate a bucket regains per successful request.
+RECOVERY_FRACTION = 0.02
+
+# Maximum number of buckets kept by bucket() before they are all forgotten.
+MAX_BUCKETS = 1000
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+class TokenBucket(object):
+  """Allows rate requests per second on average, with bursts of burst."""
+
+  def __init__(self, name, rate, burst=None, clock=time.time):
+    """Constructor for a TokenBucket.
+
+    Args:
+      name: string, identifies the bucket in memcache.
+      rate: float, the number of requests allowed per second.
+      burst: int, the number of requests which may be made at once after a
+             quiet period, by default rate.
+      clock: callable, returns the current time in seconds.
+    """
+    self.name = name
+    self.configured_rate = float(rate)
+    self.rate = float(rate)
+    self.burst = max(1, burst or int(rate))
+    self._clock = clock
+    self._lock = threading.Lock()
+    self._tokens = float(self.burst)
+    self._updated = clock()
+
+  def reserve(self, tokens=1):
+    """Takes tokens from the bucket.
+
+    Args:
+      tokens: int, the number of requests about to be made.
+
+    Returns:
+      The number of seconds to wait before making them.
+    """
+    self._lock.acquire()
+    try:
+      now = self._clock()
+      self._tokens = min(self.burst,
+                         self._tokens + (now - self._updated) * self.rate)
+      self._updated = now
+      self._tokens -= tokens
+      if self._tokens >= 0:
+        return 0.0
+      return -self._tokens / self.rate
+    finally:
+      self._lock.release()
+
+  def shared_wait(self, tokens=1):
+    """Counts tokens against the rate of all instances in memcache.
+
+    Args:
+      tokens: int, the number of requests about to be made.
+
+    Returns:
+      The number of seconds to wait until the current second is over if the
+      instances together had already made rate requests in it, else 0.
+    """
+    if memcache is None:
+      return 0.0
+    now = self._clock()
+    second = int(now)
+    count = memcache.incr('%s:%d' % (self.name, second), delta=tokens,
+                          namespace=MEMCACHE_NAMESPACE, initial_value=0)
+    if count is None or count - tokens < self.rate:
+      # memcache being unavailable must not stop requests, and a batch larger
+      # than rate is let through at the start of a second.
+      return 0.0
+    return second + 1 - now
+
+  def slow_down(self):
+    """Halves the rate after the API reported that it was exceeded."""
+    self._lock.acquire()
+    try:
+      self.rate = max(self.configured_rate * MIN_RATE_FRACTION,
+                      self.rate / 2)
+    finally:
+      self._lock.release()
+
+  def speed_up(self):
+    """Moves the rate back towards the configured rate after a success."""
+    if self.rate < self.configured_rate:
+      self._lock.acquire()
+      try:
+        self.rate = min(self.configured_rate,
+                        self.rate + self.configured_rate * RECOVERY_FRACTION)
+      finally:
+        self._lock.release()
+
+
+def bucket(name, rate, burst=None):
+  """Returns the bucket of this process with the given name.
+
+  The bucket is created on first use; later calls return the same bucket
+  whatever their rate and burst.
+
+  Args:
+    name: string, identifies the bucket, for example 'user:<id>'.
+    rate: float, the number of requests allowed per second.
+    burst: int, the number of requests which may be made at once.
+
+  Returns:
+    A TokenBucket.
+  """
+  _buckets_lock.acquire()
+  try:
+    if name not in _buckets:
+      if len(_buckets) >= MAX_BUCKETS:
+        _buckets.clear()
+      _buckets[name] = TokenBucket(name, rate, burst)
+    return _buckets[name]
+  finally:
+    _buckets_lock.release()
+
+
+class RateLimiter(object):
+  """Makes requests wait for a token of each of its buckets.
+
+  counters holds the number of requests paced, how many of them had to wait,
+  the total and the longest wait in seconds and how often the API reported
+  that a rate limit was exceeded, for monitoring.
+  """
+
+  def __init__(self, buckets, sleep=time.sleep):
+    """Constructor for a RateLimiter.
+
+    Args:
+      buckets: list of TokenBucket, typically from bucket().
+      sleep: callable, waits for the number of seconds passed to it.
+    """
+    self.buckets = buckets
+    self.sleep = sleep
+    self.counters = {'requests': 0, 'waits': 0, 'wait_seconds': 0.0,
+                     'max_wait_seconds': 0.0, 'rate_limited': 0}
+
+  def acquire(self, tokens=1):
+    """Waits until tokens requests may be made.
+
+    Args:
+      tokens: int, the number of requests about to be made.
+
+    Returns:
+      The number of seconds waited.
+    """
+    wait = 0.0
+    for b in self.buckets:
+      wait = max(wait, b.reserve(tokens))
+    if wait > 0:
+      self.sleep(wait)
+    for b in self.buckets:
+      shared = b.shared_wait(tokens)
+      while shared > 0:
+        self.sleep(shared)
+        wait += shared
+        shared = b.shared_wait(tokens)
+
+    self.counters['requests'] += tokens
+    if wait > 0:
+      self.counters['waits'] += 1
+      self.counters['wait_seconds'] += wait
+      self.counters['max_wait_seconds'] = max(
+          self.counters['max_wait_seconds'], wait)
+    return wait
+
+  def observe(self, resp, content):
+    """Adapts the rates of the buckets to the response of a request.
+
+    Args:
+      resp: httplib2.Response, the response of a paced request.
+      content: string, the body of the response.
+    """
+    if _is_rate_limited(resp, content):
+      self.counters['rate_limited'] += 1
+      logging.info('Slowing down after %d response' % resp.status)
+      for b in self.buckets:
+        b.slow_down()
+    elif resp.status < 300:
+      for b in self.buckets:
+        b.speed_up()
+
+
+def _is_rate_limited(resp, content):
+  """Whether a response reports that a rate limit was exceeded."""
+  if resp.status == 429:
+    return True
+  if resp.status != 403:
+    return False
+  try:
+    errors = simplejson.loads(content)['error']['errors']
+  except (ValueError, KeyError, TypeError):
+    return False
+  for error in errors:
+    if error.get('reason') in RATE_LIMIT_REASONS:
+      return True
+  return False
@@ -0,0 +1,169 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stand-ins for the App Engine modules imported by the code benchmarked.
+
+The benchmarks measure the work of the app, not of the SDK, so they run
+against these modules instead: db only provides property classes, models
+whose entities are plain objects, and keys as tuples, and the other modules
+only provide what the handler scripts need to be imported.  Install() must be
+called before the app modules are imported.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import sys
+import types
+
+
+class Property(object):
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def __get__(self, model_instance, model_class):
+    # set values live in the __dict__ of the entity, which takes precedence.
+    if model_instance is None:
+      return self
+    return None
+
+  def get_value_for_datastore(self, model_instance):
+    return None
+
+  def validate(self, value):
+    return value
+
+
+class StringProperty(Property): pass
+class TextProperty(Property): pass
+class BooleanProperty(Property): pass
+class IntegerProperty(Property): pass
+class FloatProperty(Property): pass
+class LinkProperty(Property): pass
+class PhoneNumberProperty(Property): pass
+class BlobProperty(Property): pass
+class DateTimeProperty(Property): pass
+class DateProperty(DateTimeProperty): pass
+class UserProperty(Property): pass
+
+
+class ReferenceProperty(Property):
+
+  def __init__(self, reference_class=None, **kwargs):
+    self.reference_class = reference_class
+
+
+class SelfReferenceProperty(ReferenceProperty):
+  pass
+
+
+class ListProperty(Property):
+
+  def __init__(self, item_type, **kwargs):
+    self.item_type = item_type
+
+
+class StringListProperty(ListProperty):
+
+  def __init__(self, **kwargs):
+    ListProperty.__init__(self, str)
+
+
+class Key(tuple):
+
+  @staticmethod
+  def from_path(*path, **kwargs):
+    return Key(path)
+
+  def name(self):
+    return self[-1]
+
+  def id(self):
+    return self[-1]
+
+
+class Error(Exception):
+  pass
+
+
+class _Unused(object):
+  """Stands in for the classes of the SDK which are only used by requests."""
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+
+class Model(object):
+  """A model whose entities only hold their attributes."""
+
+  def __init__(self, parent=None, key_name=None, key=None, **kwargs):
+    self._key = key or Key((self.kind(), key_name))
+    self.__dict__.update(kwargs)
+
+  @classmethod
+  def properties(cls):
+    props = {}
+    for klass in reversed(cls.__mro__):
+      for name, value in vars(klass).items():
+        if isinstance(value, Property):
+          if (isinstance(value, SelfReferenceProperty) and
+              value.reference_class is None):
+            value.reference_class = cls
+          props[name] = value
+    return props
+
+  @classmethod
+  def kind(cls):
+    return cls.__name__
+
+  def key(self):
+    return self._key
+
+
+def _Install(name, **attributes):
+  module = types.ModuleType(name)
+  module.__dict__.update(attributes)
+  sys.modules[name] = module
+  parent, _, child = name.rpartition(".")
+  if parent:
+    setattr(sys.modules[parent], child, module)
+  return module
+
+
+def Install():
+  """Makes the google.appengine modules of the app import these stubs."""
+  _Install("google")
+  _Install("google.appengine")
+  _Install("google.appengine.api")
+  _Install("google.appengine.api.apiproxy_stub_map", apiproxy=None,
+           UserRPC=_Unused)
+  _Install("google.appengine.api.mail", EmailMessage=_Unused)
+  _Install("google.appengine.api.memcache", Client=_Unused)
+  _Install("google.appengine.api.taskqueue", Queue=_Unused, Task=_Unused)
+  _Install("google.appengine.api.urlfetch")
+  _Install("google.appengine.api.urlfetch_errors", Error=Error)
+  _Install("google.appengine.api.users", User=_Unused)
+  _Install("google.appengine.ext")
+  _Install("google.appengine.ext.webapp", RequestHandler=_Unused,
+           WSGIApplication=_Unused)
+  _Install("google.appengine.ext.webapp.template")
+  _Install("google.appengine.ext.webapp.util")
+  db = _Install("google.appengine.ext.db", Link=unicode, Blob=str,
+                PhoneNumber=unicode, Text=unicode, Key=Key, Model=Model,
+                Error=Error, Timeout=Error, InternalError=Error)
+  for name, value in globals().items():
+    if isinstance(value, type) and issubclass(value, Property):
+      setattr(db, name, value)
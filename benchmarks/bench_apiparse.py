@@ -0,0 +1,293 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures how many tasks per second apiparse and apiupload convert.
+
+The tasks are converted into entities of a stub model shaped like model.Task
+by apiparse.Parser, and the same entities back into API data by
+apiupload.Uploader.  Each direction runs once with the conversion plans and
+once with the conversion code the modules had before them, which looks up the
+conversion of every property of every entity again:
+
+  python benchmarks/bench_apiparse.py --tasks=50000
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import datetime
+import os
+import sys
+import time
+
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import appengine_stub
+appengine_stub.Install()
+
+from google.appengine.api import urlfetch
+from google.appengine.ext import db
+
+from common import apiparse
+from common import apiupload
+from common import properties
+
+
+class TaskList(db.Model):
+  id = db.StringProperty()
+  title = db.TextProperty()
+  selfLink = db.LinkProperty()
+
+
+class Task(db.Model):
+  parent_entity = db.ReferenceProperty(TaskList, collection_name="tasks")
+  id = db.StringProperty()
+  selfLink = db.LinkProperty()
+  title = db.TextProperty()
+  notes = db.TextProperty()
+  parent_ = db.SelfReferenceProperty(collection_name="children")
+  position = db.StringProperty()
+  updated = db.DateTimeProperty()
+  due = db.DateProperty()
+  hidden = db.BooleanProperty()
+  status = db.StringProperty()
+  deleted = db.BooleanProperty()
+  completed = db.DateTimeProperty()
+
+
+class StubModelModule(object):
+  """Stands in for the model module of the app."""
+  child_mapping = {}
+  many_many_mapping = {}
+
+
+class Snapshot(db.Model):
+  pass
+
+
+class _Parser(apiparse.Parser):
+  """Parser which keeps its entities in memory instead of writing them."""
+
+  def __init__(self):
+    snapshot = Snapshot(key=db.Key.from_path("Snapshot", 1))
+    apiparse.Parser.__init__(self, Task, TaskList(key_name="list"), snapshot,
+                             None, StubModelModule)
+    self.entities = []
+
+  def Store(self, entity):
+    self.entities.append(entity)
+
+
+class _BaselineParser(_Parser):
+  """Parser converting items as apiparse.Parser did before it had plans."""
+
+  def ParseItem(self, item, entity_to_parse, parent_entity):
+    model_obj = self.NewEntity(item, entity_to_parse)
+    if parent_entity:
+      model_obj.parent_entity = parent_entity
+    props = model_obj.properties()
+    for key, value in item.items():
+      if key not in apiparse.Parser._EXCLUDED_FIELDS:
+        prop_name = apiparse.Parser.ApiToModel(key)
+
+        if (entity_to_parse, key) in self.model.child_mapping:
+          for item in value:
+            self.ParseItem(item, self.model.child_mapping[entity_to_parse, key],
+                           model_obj)
+        elif (isinstance(props[prop_name], db.StringProperty) or
+              isinstance(props[prop_name], db.TextProperty) or
+              isinstance(props[prop_name], db.BooleanProperty) or
+              isinstance(props[prop_name], db.IntegerProperty)):
+          setattr(model_obj, prop_name, value)
+        elif isinstance(props[prop_name], db.FloatProperty):
+          setattr(model_obj, prop_name, float(value))
+        elif isinstance(props[prop_name], db.LinkProperty):
+          link = db.Link(value)
+          setattr(model_obj, prop_name, link)
+        elif isinstance(props[prop_name], db.PhoneNumberProperty):
+          pn = db.PhoneNumber(value)
+          setattr(model_obj, prop_name, pn)
+        elif isinstance(props[prop_name], db.BlobProperty):
+          blob = db.Blob(urlfetch.fetch(value).content)
+          setattr(model_obj, prop_name, blob)
+        elif isinstance(props[prop_name], db.DateProperty):
+          d = datetime.datetime.strptime(value, "%Y-%m-%dT00:00:00.000Z").date()
+          setattr(model_obj, prop_name, d)
+        elif isinstance(props[prop_name], db.DateTimeProperty):
+          if self.date_type == "friendly":
+            part1, part2 = value.split(".")
+            dt = datetime.datetime.strptime(part1, "%Y-%m-%dT%H:%M:%S")
+            dt = dt.replace(microsecond=int(part2[0:3])*1000)
+          elif self.date_type == "timestamp":
+            part1 = value[:-3]
+            part2 = value[-3:]
+            dt = datetime.datetime.fromtimestamp(long(part1))
+            dt = dt.replace(microsecond=int(part2)*1000)
+          else:
+            raise ValueError("Not a valid date_type: %s" % self.date_type)
+          setattr(model_obj, prop_name, dt)
+        elif isinstance(props[prop_name], db.ReferenceProperty):
+          key_obj = db.Key.from_path(
+              self.snapshot.kind(), self.snapshot.key().id(),
+              props[prop_name].reference_class.kind(), value)
+          setattr(model_obj, prop_name, key_obj)
+        elif isinstance(props[prop_name], db.ListProperty):
+          if props[prop_name].item_type == db.Key:
+            key_objs = []
+            for key_obj in value:
+              key_objs.append(
+                  db.Key.from_path(
+                      self.snapshot.kind(), self.snapshot.key().id(),
+                      self.model.many_many_mapping[entity_to_parse,
+                                                   key].__name__, key_obj))
+            setattr(model_obj, prop_name, key_objs)
+          else:
+            setattr(model_obj, prop_name, value)
+        elif isinstance(props[prop_name], properties.TimeDeltaProperty):
+          milliseconds = long(value)
+          dt = datetime.timedelta(seconds=milliseconds / 1000,
+                                  milliseconds=milliseconds % 1000)
+          setattr(model_obj, prop_name, dt)
+        elif isinstance(props[prop_name], properties.DictProperty):
+          setattr(model_obj, prop_name, value)
+        else:
+          raise ValueError("Could not parse property %s.\n"
+                           "Value: %s" % (key, value))
+
+    self.Store(model_obj)
+    return model_obj
+
+
+class _BaselineUploader(apiupload.Uploader):
+  """Uploader building bodies as apiupload.Uploader did before it had plans."""
+
+  def BuildBody(self, entity):
+    result = {}
+
+    for prop_name, prop in entity.properties().items():
+      data = getattr(entity, prop_name)
+      api_name = apiupload.Uploader.ModelToApi(prop_name)
+      if data is None:
+        continue
+      if (isinstance(prop, db.StringProperty) or
+          isinstance(prop, db.TextProperty) or
+          isinstance(prop, db.BooleanProperty) or
+          isinstance(prop, db.IntegerProperty) or
+          isinstance(prop, db.FloatProperty)):
+        result[api_name] = data
+      elif isinstance(prop, db.LinkProperty):
+        result[api_name] = str(data)
+      elif isinstance(prop, db.DateProperty):
+        result[api_name] = data.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+      elif isinstance(prop, db.DateTimeProperty):
+        result[api_name] = data.strftime("%Y-%m-%dT%H:%M:%S.")
+        result[api_name] += str(data.microsecond / 1000)
+        result[api_name] += "Z"
+      elif isinstance(prop, db.ReferenceProperty):
+        result[api_name] = data.id
+      elif isinstance(prop, db.ListProperty):
+        prop_value = getattr(entity, prop_name)
+        result[api_name] = [key.name() for key in prop_value]
+      else:
+        raise ValueError("Could not convert property %s to POST data.\n"
+                         "Value: %s" % (prop_name, data))
+    return result
+
+
+def Tasks(count):
+  """Returns count tasks as the Tasks API returns them."""
+  tasks = []
+  for i in range(count):
+    task = {"kind": "tasks#task", "id": "MTA3NjI5NDI0NDU5MDA3MTk2NDI6%d" % i,
+            "etag": "\"0Lw-2FUHLN2wKDq9awnz8qLBPos/%d\"" % i,
+            "title": "Task %d" % i,
+            "selfLink": "https://www.googleapis.com/tasks/v1/lists/x/"
+                        "tasks/%d" % i,
+            "position": "%020d" % i,
+            "updated": "2011-08-%02dT21:32:05.000Z" % (i % 28 + 1),
+            "status": "needsAction"}
+    if i % 3 == 0:
+      task["notes"] = "Remember the receipt"
+    if i % 4 == 0:
+      task["parent"] = "MTA3NjI5NDI0NDU5MDA3MTk2NDI6%d" % (i - 1)
+    if i % 5 == 0:
+      task["status"] = "completed"
+      task["completed"] = "2011-08-12T10:00:00.000Z"
+      task["due"] = "2011-08-12T00:00:00.000Z"
+    tasks.append(task)
+  return tasks
+
+
+def Entities(tasks):
+  """Returns the entities the tasks are parsed into, as a restore reads them.
+
+  The parents of the tasks refer to the entities of the parent tasks, as
+  ReferenceProperty values do once they are read.
+  """
+  parser = _Parser()
+  parser.parent_entity.id = "list"
+  for task in tasks:
+    parser.ParseItem(task, Task, parser.parent_entity)
+  by_id = dict((entity.id, entity) for entity in parser.entities)
+  for entity in parser.entities:
+    if entity.parent_ is not None:
+      entity.parent_ = by_id.get(entity.parent_.name())
+  return parser.entities
+
+
+def MeasureParse(parser_class, tasks):
+  """Returns the number of tasks per second parser_class converts."""
+  parser = parser_class()
+  start = time.time()
+  for task in tasks:
+    parser.ParseItem(task, Task, parser.parent_entity)
+  return len(tasks) / (time.time() - start)
+
+
+def MeasureUpload(uploader_class, entities):
+  """Returns the number of entities per second uploader_class converts."""
+  uploader = uploader_class(None)
+  start = time.time()
+  for entity in entities:
+    uploader.BuildBody(entity)
+  return len(entities) / (time.time() - start)
+
+
+def main(argv):
+  parser = OptionParser(usage="%prog [options]")
+  parser.add_option("--tasks", dest="tasks", type="int", default=50000,
+                    help="number of tasks converted per run")
+  parser.add_option("--runs", dest="runs", type="int", default=3,
+                    help="number of runs, of which the fastest is reported")
+  options, args = parser.parse_args(argv[1:])
+
+  tasks = Tasks(options.tasks)
+  entities = Entities(tasks)
+  runs = (("parse", MeasureParse, tasks, _Parser, _BaselineParser),
+          ("upload", MeasureUpload, entities, apiupload.Uploader,
+           _BaselineUploader))
+  print "%-8s %16s %16s %8s" % ("", "plans", "baseline", "speedup")
+  for label, measure, data, planned, baseline in runs:
+    planned_rate = max([measure(planned, data) for i in range(options.runs)])
+    baseline_rate = max([measure(baseline, data)
+                         for i in range(options.runs)])
+    print "%-8s %9.0f tasks/s %9.0f tasks/s %7.1fx" % (
+        label, planned_rate, baseline_rate, planned_rate / baseline_rate)
+
+
+if __name__ == "__main__":
+  main(sys.argv)
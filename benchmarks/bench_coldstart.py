@@ -0,0 +1,117 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Checks the cold start of every handler script of app.yaml.
+
+Each handler is imported in fresh processes by import_profile, and fails the
+check if its fastest cold start exceeds its budget or if it loads a module
+which it is meant to import only when a request needs it.  The budgets leave
+room for slower machines, the deferred modules do not depend on the machine.
+The exit status is 1 if any handler fails:
+
+  python benchmarks/bench_coldstart.py --runs=5
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import re
+import sys
+
+from optparse import OptionParser
+
+import import_profile
+
+# Seconds a cold start of each handler may take, about three times what it
+# takes on a workstation.
+BUDGETS = {"tasks": 0.2, "worker": 0.25}
+
+# Budget of handlers missing from BUDGETS.
+DEFAULT_BUDGET = 0.25
+
+# Modules, with their submodules, which each handler must not load when it is
+# imported.  gflags is only for command line programs, and the others are
+# imported through common.lazyimport by the few requests using them.
+DEFERRED = {
+    "tasks": ("apiclient.discovery", "gflags"),
+    "worker": ("csvparse", "dateutil", "gflags", "icalparse", "vobject"),
+    }
+
+
+def Handlers():
+  """Returns the module names of the handler scripts of app.yaml."""
+  app_yaml = file(os.path.join(import_profile.APP_ROOT, "app.yaml")).read()
+  handlers = []
+  for script in re.findall(r"^\s*script:\s*(\S+)\.py\s*$", app_yaml, re.M):
+    if script not in handlers:
+      handlers.append(script)
+  return handlers
+
+
+def Check(handler, runs, scale):
+  """Measures the cold start of a handler and checks it.
+
+  Args:
+    handler: the module name of the handler script.
+    runs: the number of cold starts, of which the fastest is checked.
+    scale: the factor applied to the budget of the handler.
+
+  Returns:
+    A (seconds, budget, module count, problems) tuple, where problems is a
+    list of strings which is empty if the handler passes.
+  """
+  best = None
+  for run in range(max(1, runs)):
+    result = import_profile.ColdStart(handler)
+    if best is None or result[0] < best[0]:
+      best = result
+  total, timings = best
+  budget = BUDGETS.get(handler, DEFAULT_BUDGET) * scale
+  problems = []
+  if total > budget:
+    problems.append("exceeds the budget")
+  for deferred in DEFERRED.get(handler, ()):
+    for name in timings:
+      if name == deferred or name.startswith(deferred + "."):
+        problems.append("loads %s" % name)
+  return total, budget, len(timings), problems
+
+
+def main(argv):
+  parser = OptionParser(usage="%prog [options] [handler...]")
+  parser.add_option("--runs", dest="runs", type="int", default=5,
+                    help="number of cold starts, of which the fastest is "
+                    "checked")
+  parser.add_option("--budget_scale", dest="scale", type="float", default=1.0,
+                    help="factor applied to every budget, for slow machines")
+  options, handlers = parser.parse_args(argv[1:])
+
+  status = 0
+  print "%-10s %10s %10s %8s  %s" % ("handler", "cold start", "budget",
+                                     "modules", "result")
+  for handler in handlers or Handlers():
+    total, budget, modules, problems = Check(handler, options.runs,
+                                             options.scale)
+    print "%-10s %8.1fms %8.1fms %8d  %s" % (
+        handler, total * 1000, budget * 1000, modules,
+        ", ".join(problems) or "ok")
+    if problems:
+      status = 1
+  return status
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
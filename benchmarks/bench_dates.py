@@ -0,0 +1,110 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares common.dates with the strptime parsing it replaced.
+
+Every value is distinct in the "unique" runs, so that only the slicing fast
+paths are measured, and repeats a few hundred dates in the "repeated" runs,
+as the due and completed dates of real tasklists do, so that the memo is
+measured as well:
+
+  python benchmarks/bench_dates.py --values=100000
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import datetime
+import os
+import sys
+import time
+
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import dates
+
+
+def StrptimeDateTime(value):
+  """Parses an RFC 3339 timestamp as the parsers did before common.dates."""
+  part1, part2 = value.split(".")
+  dt = datetime.datetime.strptime(part1, "%Y-%m-%dT%H:%M:%S")
+  return dt.replace(microsecond=int(part2[0:3])*1000)
+
+
+def StrptimeDate(value):
+  """Parses an RFC 3339 date as the parsers did before common.dates."""
+  return datetime.datetime.strptime(value, "%Y-%m-%dT00:00:00.000Z").date()
+
+
+def StrptimeOutlookDate(value):
+  """Parses an Outlook date as csvparse did before common.dates."""
+  return datetime.datetime.strptime(value, "%m/%d/%Y")
+
+
+def Values(count, distinct):
+  """Returns count values of each format, cycling through distinct dates."""
+  start = datetime.datetime(2011, 1, 1)
+  datetimes, dates_, outlook = [], [], []
+  for i in range(count):
+    moment = start + datetime.timedelta(seconds=(i % distinct) * 7919,
+                                        milliseconds=i % distinct % 1000)
+    datetimes.append(moment.strftime("%Y-%m-%dT%H:%M:%S.") +
+                     "%03dZ" % (moment.microsecond / 1000))
+    day = start + datetime.timedelta(days=i % distinct)
+    dates_.append(day.strftime("%Y-%m-%dT00:00:00.000Z"))
+    outlook.append("%d/%d/%d" % (day.month, day.day, day.year))
+  return datetimes, dates_, outlook
+
+
+def Measure(parse, values):
+  """Returns the number of values per second parse converts."""
+  start = time.time()
+  for value in values:
+    parse(value)
+  return len(values) / (time.time() - start)
+
+
+def main(argv):
+  parser = OptionParser(usage="%prog [options]")
+  parser.add_option("--values", dest="values", type="int", default=100000,
+                    help="number of values of each format parsed per run")
+  parser.add_option("--runs", dest="runs", type="int", default=3,
+                    help="number of runs, of which the fastest is reported")
+  options, args = parser.parse_args(argv[1:])
+
+  cases = (("ParseDateTime", dates.ParseDateTime, StrptimeDateTime),
+           ("ParseDate", dates.ParseDate, StrptimeDate),
+           ("ParseOutlookDate", dates.ParseOutlookDate, StrptimeOutlookDate))
+  for label, distinct in (("unique", options.values), ("repeated", 300)):
+    values = Values(options.values, distinct)
+    for (name, parse, baseline), column in zip(cases, values):
+      rates = []
+      for function in (parse, baseline):
+        best = 0
+        for i in range(options.runs):
+          # every run starts with empty memos.
+          for memo in (dates._datetime_memo, dates._date_memo,
+                       dates._outlook_memo):
+            memo.clear()
+          best = max(best, Measure(function, column))
+        rates.append(best)
+      print "%-8s %-16s %10.0f/s  strptime %9.0f/s  x%.1f" % (
+          label, name, rates[0], rates[1], rates[0] / rates[1])
+
+
+if __name__ == "__main__":
+  main(sys.argv)
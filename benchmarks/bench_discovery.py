@@ -0,0 +1,70 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures how long building the Tasks API takes on a new instance.
+
+The service is built offline from the bundled discovery document, as the
+handlers build it with OFFLINE_DISCOVERY, once from the module generated by
+apiclient.ext.compiler and once parsing the document as if there were no such
+module.  The caches of apiclient.discovery are emptied before every build, so
+that each one costs as much as the first build of a new instance:
+
+  python benchmarks/bench_discovery.py --builds=200
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import sys
+import time
+
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2
+
+from apiclient import discovery
+
+
+def Build(compiled):
+  """Builds the Tasks API with empty caches and returns the seconds taken."""
+  discovery._services.clear()
+  discovery._compiled.clear()
+  if not compiled:
+    discovery._compiled[("tasks", "v1")] = None
+  http = httplib2.Http()
+  start = time.time()
+  service = discovery.build("tasks", "v1", http, offline=True)
+  service.tasklists().list()
+  return time.time() - start
+
+
+def main(argv):
+  parser = OptionParser(usage="%prog [options]")
+  parser.add_option("--builds", dest="builds", type="int", default=200,
+                    help="number of builds of each kind, of which the median "
+                    "is reported")
+  options, args = parser.parse_args(argv[1:])
+
+  for label, compiled in (("compiled module", True),
+                          ("parsed document", False)):
+    timings = sorted([Build(compiled) for i in range(options.builds)])
+    print "%-16s %7.2fms" % (label, timings[len(timings) / 2] * 1000)
+
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -0,0 +1,133 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures what the partial response mask of apiparse.Parser saves.
+
+Pages of tasks as the Tasks API returns them are compared with the same pages
+cut down to the fields of Parser.FieldsMask, which snapshots request with
+partial=True: their size as sent, pretty-printed as by default, and gzipped,
+and the time taken to deserialize them with lazy items and iterate over the
+items, as the snapshot workers do.  Deserializing is timed with the default
+codec and with the pure-Python stand-in for django.utils.simplejson of
+bench_json:
+
+  python benchmarks/bench_fields.py --pages=50
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import sys
+import time
+import zlib
+
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench_apiparse
+import bench_json
+
+from apiclient import model
+from apiclient.anyjson import simplejson
+from common import apiparse
+
+# Tasks per page, the default maxResults of tasks.list.
+PAGE_SIZE = 100
+
+
+def Page(number):
+  """Returns a full page of tasks as the Tasks API returns it."""
+  items = []
+  for i in range(number * PAGE_SIZE, (number + 1) * PAGE_SIZE):
+    task = {"kind": "tasks#task",
+            "id": "MTA3NjI5NDI0NDU5MDA3MTk2NDI6MDoxNjk%06d" % i,
+            "etag": "\"0Lw-2FUHLN2wKDq9awnz8qLBPos/LTk4NjQ%07d\"" % i,
+            "title": "Pick up dry cleaning %d" % i,
+            "updated": "2011-08-%02dT21:32:05.000Z" % (i % 28 + 1),
+            "selfLink": "https://www.googleapis.com/tasks/v1/lists/"
+                        "MTA3NjI5NDI0NDU5MDA3MTk2NDI6MDow/tasks/"
+                        "MTA3NjI5NDI0NDU5MDA3MTk2NDI6MDoxNjk%06d" % i,
+            "position": "%020d" % i,
+            "status": "needsAction"}
+    if i % 3 == 0:
+      task["notes"] = "Remember the receipt"
+    if i % 4 == 0:
+      task["parent"] = "MTA3NjI5NDI0NDU5MDA3MTk2NDI6MDoxNjk%06d" % (i - 1)
+    if i % 5 == 0:
+      task["status"] = "completed"
+      task["completed"] = "2011-08-12T10:00:00.000Z"
+      task["due"] = "2011-08-12T00:00:00.000Z"
+      task["hidden"] = True
+    items.append(task)
+  return {"kind": "tasks#tasks", "etag": "\"0Lw-2FUHLN2wKDq9awnz8qLBPos\"",
+          "nextPageToken": "CgwI3OzxmAUQ%d" % number, "items": items}
+
+
+def Masked(page, mask):
+  """Returns page with only the fields selected by a FieldsMask mask."""
+  fields = mask[len("items("):mask.index(")")].split(",")
+  items = []
+  for item in page["items"]:
+    items.append(dict([(field, item[field]) for field in fields
+                       if field in item]))
+  return {"nextPageToken": page["nextPageToken"], "items": items}
+
+
+def Deserialize(contents, codec):
+  """Returns the seconds taken to deserialize and iterate over contents."""
+  jsonmodel = model.JsonModel(lazy_items=True, codec=codec)
+  start = time.time()
+  for content in contents:
+    for item in jsonmodel.deserialize(content)["items"]:
+      pass
+  return time.time() - start
+
+
+def main(argv):
+  parser = OptionParser(usage="%prog [options]")
+  parser.add_option("--pages", dest="pages", type="int", default=50,
+                    help="number of pages of %d tasks" % PAGE_SIZE)
+  parser.add_option("--runs", dest="runs", type="int", default=5,
+                    help="number of runs, of which the fastest is reported")
+  options, args = parser.parse_args(argv[1:])
+
+  model.register_codec("pure", bench_json.PureModule())
+  mask = apiparse.Parser.FieldsMask(bench_apiparse.Task,
+                                    bench_apiparse.StubModelModule)
+  pages = [Page(number) for number in range(options.pages)]
+  variants = (("full", pages),
+              ("masked", [Masked(page, mask) for page in pages]))
+  columns = ("", "bytes", "gzipped", "default codec", "pure codec")
+  print "%d pages of %d tasks, fields=%s" % (options.pages, PAGE_SIZE, mask)
+  print "%-8s %12s %12s %14s %14s" % columns
+  results = []
+  for label, data in variants:
+    contents = [simplejson.dumps(page, indent=1) for page in data]
+    size = sum([len(content) for content in contents])
+    gzipped = sum([len(zlib.compress(content)) for content in contents])
+    times = [min([Deserialize(contents, codec) for i in range(options.runs)])
+             for codec in (None, "pure")]
+    results.append((size, gzipped) + tuple(times))
+    print "%-8s %12d %12d %12.1fms %12.1fms" % (
+        label, size, gzipped, times[0] * 1000, times[1] * 1000)
+  print "%-8s %11.0f%% %11.0f%% %13.0f%% %13.0f%%" % tuple(
+      ["saved"] + [100.0 * (full - masked) / full
+                   for full, masked in zip(*results)])
+
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -0,0 +1,136 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the JSON codecs of apiclient.model on a page of tasks.
+
+A page of tasks about 1MB long is serialized, deserialized and deserialized
+with lazy items which are then iterated over, with every registered codec and
+with a pure-Python codec standing in for django.utils.simplejson, which has no
+C speedups on App Engine.  The stand-in is the json module with its C scanner
+and encoder switched off:
+
+  python benchmarks/bench_json.py --tasks=2700
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import json
+import json.decoder
+import json.encoder
+import json.scanner
+import os
+import sys
+import time
+import types
+
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apiclient import model
+
+
+class PureDecoder(json.JSONDecoder):
+  """JSONDecoder which decodes in Python only."""
+
+  def __init__(self, *args, **kwargs):
+    json.JSONDecoder.__init__(self, *args, **kwargs)
+    self.parse_string = json.decoder.py_scanstring
+    self.scan_once = json.scanner.py_make_scanner(self)
+
+
+def PureDumps(obj):
+  """Serializes obj with the json module's Python encoder."""
+  c_make_encoder = json.encoder.c_make_encoder
+  json.encoder.c_make_encoder = None
+  try:
+    return json.JSONEncoder().encode(obj)
+  finally:
+    json.encoder.c_make_encoder = c_make_encoder
+
+
+def PureModule():
+  """Returns a JSON module without C speedups, like django's simplejson."""
+  module = types.ModuleType("pure_json")
+  module.decoder = types.ModuleType("pure_json.decoder")
+  module.decoder.c_scanstring = None
+  module.JSONDecoder = PureDecoder
+  module.dumps = PureDumps
+  module.loads = lambda content: PureDecoder().decode(content)
+  return module
+
+
+def Page(count):
+  """Returns a page of count tasks as the Tasks API returns it."""
+  items = []
+  for i in range(count):
+    items.append(
+        '{"kind":"tasks#task","id":"MTA3NjI5NDI0NDU5MDA3MTk2NDI6MDoxNjk%06d",'
+        '"etag":"\\"0Lw-2FUHLN2wKDq9awnz8qLBPos/LTk4NjQ%07d\\"",'
+        '"title":"Pick up dry cleaning \\u00e9 %d",'
+        '"updated":"2011-08-11T21:32:05.000Z",'
+        '"selfLink":"https://www.googleapis.com/tasks/v1/lists/'
+        'MTA3NjI5NDI0NDU5MDA3MTk2NDI6MDow/tasks/'
+        'MTA3NjI5NDI0NDU5MDA3MTk2NDI6MDoxNjk%06d",'
+        '"position":"%020d","notes":"Remember the receipt",'
+        '"status":"needsAction","hidden":false}' % (i, i, i, i, i))
+  return ('{"kind":"tasks#tasks","nextPageToken":"CgwI3OzxmAUQ",'
+          '"items":[%s]}' % ",".join(items))
+
+
+def Measure(function, runs):
+  """Returns the fastest of runs calls of function, in milliseconds."""
+  best = None
+  for i in range(runs):
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best * 1000
+
+
+def main(argv):
+  parser = OptionParser(usage="%prog [options]")
+  parser.add_option("--tasks", dest="tasks", type="int", default=2700,
+                    help="number of tasks of the page")
+  parser.add_option("--runs", dest="runs", type="int", default=5,
+                    help="number of runs, of which the fastest is reported")
+  options, args = parser.parse_args(argv[1:])
+
+  model.register_codec("pure", PureModule())
+  page = Page(options.tasks)
+  data = model.JsonModel().deserialize(page)
+  print "page of %d tasks, %.2fMB" % (options.tasks, len(page) / 1e6)
+  print "%-12s %8s %12s %10s %14s" % ("codec", "speedups", "deserialize",
+                                      "serialize", "lazy+iterate")
+  for name in sorted(model._codecs):
+    codec = model.get_codec(name)
+    eager = model.JsonModel(codec=name)
+    lazy = model.JsonModel(lazy_items=True, codec=name)
+    times = [Measure(lambda: eager.deserialize(page), options.runs),
+             Measure(lambda: eager.serialize(data), options.runs)]
+    if codec.decoder is not None:
+      times.append(Measure(lambda: list(lazy.deserialize(page)["items"]),
+                           options.runs))
+    else:
+      times.append(float("nan"))
+    print "%-12s %8s %10.1fms %8.1fms %12.1fms" % (
+        name, codec.speedups, times[0], times[1], times[2])
+
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -0,0 +1,235 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the time new instances spend importing the handler scripts.
+
+Each handler is imported in a fresh Python process, as on a new instance,
+while the time taken by every module it loads is recorded.  The App Engine
+modules are the stand-ins of appengine_stub, so the times are those of the
+app and the libraries it bundles, which are what changes to the app can make
+slower.  The report lists the cold start time of each handler and the modules
+which cost the most, and the exit status is 1 if a handler took longer than
+--max_seconds:
+
+  python benchmarks/import_profile.py --max_seconds=0.2 tasks worker
+
+bench_coldstart runs the handlers of app.yaml against budgets.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import __builtin__
+import os
+import subprocess
+import sys
+import time
+import types
+
+from optparse import OptionParser
+
+# Directory holding the handler scripts.
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Directory holding the benchmarks and appengine_stub.
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+
+class ImportProfiler(object):
+  """Records how long each module takes to import.
+
+  Attributes:
+    timings: dict from module name to a (cumulative, self) tuple of seconds.
+      The cumulative time includes the modules imported by the module, the
+      self time leaves them out.
+  """
+
+  def __init__(self):
+    self.timings = {}
+    self._nested = []
+    self._original_import = None
+
+  def Install(self):
+    """Starts recording the imports of all modules."""
+    self._original_import = __builtin__.__import__
+    __builtin__.__import__ = self._Import
+
+  def Uninstall(self):
+    """Stops recording imports."""
+    __builtin__.__import__ = self._original_import
+
+  def _Import(self, name, globals=None, locals=None, fromlist=None,
+              level=-1):
+    loaded = len(sys.modules)
+    self._nested.append(0.0)
+    start = time.time()
+    module = None
+    try:
+      module = self._original_import(name, globals, locals, fromlist, level)
+      return module
+    finally:
+      elapsed = time.time() - start
+      nested = self._nested.pop()
+      if self._nested:
+        self._nested[-1] += elapsed
+      if len(sys.modules) > loaded:
+        # only imports which loaded a module are of interest.
+        if module is not None and (fromlist or "." not in name):
+          # resolves implicit relative imports to the full name.
+          name = getattr(module, "__name__", name)
+        if module is not None and fromlist and len(fromlist) == 1:
+          # "from package import module" loads the module without calling
+          # __import__ again, so the time is recorded under the module.
+          submodule = getattr(module, fromlist[0], None)
+          if isinstance(submodule, types.ModuleType):
+            name = submodule.__name__
+        cumulative, own = self.timings.get(name, (0.0, 0.0))
+        self.timings[name] = (cumulative + elapsed, own + elapsed - nested)
+
+
+def Profile(module_name):
+  """Imports a module while recording the time taken by each import.
+
+  Args:
+    module_name: the name of the module to import.
+
+  Returns:
+    A (seconds, timings) tuple of the total time taken and the timings dict
+    of an ImportProfiler.
+  """
+  profiler = ImportProfiler()
+  profiler.Install()
+  start = time.time()
+  try:
+    __import__(module_name)
+  finally:
+    total = time.time() - start
+    profiler.Uninstall()
+  return total, profiler.timings
+
+
+def ColdStart(handler):
+  """Profiles the import of a handler in a new Python process.
+
+  Args:
+    handler: the module name of the handler script, such as "worker".
+
+  Returns:
+    A (seconds, timings) tuple as returned by Profile.
+
+  Raises:
+    RuntimeError: if the handler could not be imported.
+  """
+  command = [sys.executable, os.path.abspath(__file__), "--child", handler]
+  child = subprocess.Popen(command, cwd=APP_ROOT, stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE)
+  output, errors = child.communicate()
+  if child.returncode != 0:
+    raise RuntimeError("Importing %s failed:\n%s" % (handler, errors))
+  lines = output.splitlines()
+  total = float(lines[0])
+  timings = {}
+  for line in lines[1:]:
+    name, cumulative, own = line.split("\t")
+    timings[name] = (float(cumulative), float(own))
+  return total, timings
+
+
+def _PrepareChild():
+  """Sets up a new process to import handlers as App Engine would."""
+  sys.path[0:1] = [APP_ROOT, BENCHMARKS]
+  import appengine_stub
+  appengine_stub.Install()
+  try:
+    import settings
+  except ImportError:
+    # the OAuth client of the app is not used while importing.
+    settings = types.ModuleType("settings")
+    settings.CLIENT_ID = "benchmark"
+    settings.CLIENT_SECRET = "benchmark"
+    sys.modules["settings"] = settings
+
+
+def Report(handler, total, timings, top):
+  """Formats the cold start time of a handler and its costliest modules.
+
+  Args:
+    handler: the module name of the handler script.
+    total: the time taken to import the handler, in seconds.
+    timings: the timings dict of an ImportProfiler.
+    top: the number of modules to list.
+
+  Returns:
+    The report as a string.
+  """
+  lines = ["%s: %.3fs cold start, %d modules" % (handler, total,
+                                                len(timings)),
+           "  cumulative      self  module"]
+  by_cost = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)
+  for name, (cumulative, own) in by_cost[:top]:
+    lines.append("  %9.1fms %7.1fms  %s" % (cumulative * 1000, own * 1000,
+                                            name))
+  return "\n".join(lines)
+
+
+def main(argv):
+  """Profiles the cold start of the handlers named on the command line.
+
+  Args:
+    argv: list of string, the command line arguments
+
+  Returns:
+    The exit status: 1 if a handler exceeded --max_seconds, else 0.
+  """
+  parser = OptionParser(usage="%prog [options] handler...")
+  parser.add_option("--runs", dest="runs", type="int", default=3,
+                    help="number of cold starts of each handler, of which "
+                    "the fastest is reported")
+  parser.add_option("--top", dest="top", type="int", default=15,
+                    help="number of modules listed per handler")
+  parser.add_option("--max_seconds", dest="max_seconds", type="float",
+                    help="cold start time above which the exit status is 1")
+  parser.add_option("--child", dest="child", action="store_true",
+                    help="import a single handler in this process and print "
+                    "its timings; used by the other modes")
+  options, handlers = parser.parse_args(argv[1:])
+  if not handlers:
+    parser.error("expected the module name of at least one handler")
+
+  if options.child:
+    _PrepareChild()
+    total, timings = Profile(handlers[0])
+    print total
+    for name, (cumulative, own) in timings.iteritems():
+      print "%s\t%f\t%f" % (name, cumulative, own)
+    return 0
+
+  status = 0
+  for handler in handlers:
+    best = None
+    for run in range(max(1, options.runs)):
+      result = ColdStart(handler)
+      if best is None or result[0] < best[0]:
+        best = result
+    total, timings = best
+    print Report(handler, total, timings, options.top)
+    if options.max_seconds is not None and total > options.max_seconds:
+      print "%s exceeds the budget of %.3fs" % (handler, options.max_seconds)
+      status = 1
+  return status
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
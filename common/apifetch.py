@@ -0,0 +1,133 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Concurrent Fetcher for Apiary API requests.
+
+This module contains code to issue several Apiary API requests at once and
+hand back their results in the order in which they arrive.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import collections
+
+from apiclient import http
+
+
+class Fetcher(object):
+  """Keeps a bounded number of Apiary API requests in flight at once."""
+
+  def __init__(self, credentials=None, max_parallel=4, deadline=30):
+    """Creates a new Fetcher object.
+
+    Requests are only issued concurrently when credentials are provided, with
+    apiclient.http.HttpRequest.execute_async; otherwise each request is
+    executed with its own http object when its result is needed, so that the
+    Fetcher can be driven by mocks such as apiclient.http.HttpMockSequence.
+
+    Args:
+      credentials: the OAuth2Credentials which authorized the requests, or
+        None to execute requests one at a time.
+      max_parallel: the maximum number of requests in flight at once.  Default
+        is 4.
+      deadline: the urlfetch deadline of each request in seconds.  Default is
+        30.
+    """
+    self.credentials = credentials
+    self.max_parallel = max(1, max_parallel)
+    self.deadline = deadline
+    self._queue = collections.deque()
+    self._running = []
+
+  def Add(self, request, tag):
+    """Queues a request to be fetched.
+
+    It is safe to add requests while iterating over the results of Run.
+
+    Args:
+      request: the apiclient.http.HttpRequest to fetch.
+      tag: an arbitrary value handed back together with the result.
+    """
+    self._queue.append((request, tag))
+
+  def Start(self, request):
+    """Starts fetching a single request.
+
+    Args:
+      request: the apiclient.http.HttpRequest to fetch.
+
+    Returns:
+      A PendingRequest whose GetResult method returns the API data.
+    """
+    return PendingRequest(self._Start(request))
+
+  def Run(self):
+    """Fetches all queued requests.
+
+    Yields:
+      (tag, api_data) tuples, in the order in which the responses arrive.
+
+    Raises:
+      apiclient.errors.HttpError if a response was not a 2xx.
+      client.AccessTokenRefreshError if the credentials were revoked.
+    """
+    while self._queue or self._running:
+      while self._queue and len(self._running) < self.max_parallel:
+        request, tag = self._queue.popleft()
+        self._running.append((self._Start(request), tag))
+      future = http.as_completed([future for future, _ in
+                                  self._running]).next()
+      for i, (running, tag) in enumerate(self._running):
+        if running is future:
+          del self._running[i]
+          break
+      yield tag, future.result()
+
+  def _Start(self, request):
+    """Starts fetching request.
+
+    Args:
+      request: the apiclient.http.HttpRequest to fetch.
+
+    Returns:
+      The apiclient.http.HttpFuture of the request.
+    """
+    if self.credentials is None:
+      return http.HttpFuture(request, request.http)
+    return request.execute_async(deadline=self.deadline)
+
+
+class PendingRequest(object):
+  """A single request started by Fetcher.Start."""
+
+  def __init__(self, future):
+    """Creates a new PendingRequest object.
+
+    Args:
+      future: the apiclient.http.HttpFuture of the request.
+    """
+    self._future = future
+
+  def GetResult(self):
+    """Waits for the request to complete.
+
+    Returns:
+      The deserialized API data.
+
+    Raises:
+      apiclient.errors.HttpError if the response was not a 2xx.
+    """
+    return self._future.result()
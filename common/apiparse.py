@@ -22,11 +22,14 @@ Apiary API and convert it into entities in the datastore.
 
 __author__ = "dwightguth@google.com (Dwight Guth)"
 
+import collections
 import datetime
 import logging
 from google.appengine.api import urlfetch
 from google.appengine.ext import db
 
+import apifetch
+import dates
 import properties
 
 
@@ -36,8 +39,26 @@ class Parser(object):
   _EXCLUDED_FIELDS = ("kind", "etag")
   _RESERVED_WORDS = ("parent")
 
+  # The datastore refuses batch puts of more than this many entities.
+  MAX_BATCH_SIZE = 500
+
+  # Conversion plans by (entity type, model module, date type).  See Plan.
+  _PLANS = {}
+
+  # Partial response masks by (entity type, model module).  See FieldsMask.
+  _MASKS = {}
+
+  # One in this many written entities is encoded to measure its size; the
+  # others are counted at the average size of the entities measured so far.
+  SIZE_SAMPLE_INTERVAL = 20
+
+  # Model properties which the parser sets itself instead of reading them from
+  # the API results.
+  _PARSER_PROPERTIES = ("parent_entity",)
+
   def __init__(self, entity_to_parse, parent_entity, snapshot, method, model,
-               date_type="friendly", index=False, **args):
+               date_type="friendly", index=False, batch_size=0, fetcher=None,
+               prefetch=0, checkpoint=None, partial=False, **args):
     """Creates a new Parser object.
 
     Args:
@@ -53,6 +74,22 @@ class Parser(object):
         "friendly".
       index: False for token-based paging, True for index-based paging.  Default
         is False.
+      batch_size: the number of parsed entities to buffer before writing them
+        with a single batch put.  Buffered entities are also written at the end
+        of every page of results.  0 writes each entity as soon as it has been
+        parsed.  Default is 0.
+      fetcher: the apifetch.Fetcher used to request further pages of results.
+        Default is a Fetcher which executes each request when its result is
+        needed.
+      prefetch: the number of pages of results to request ahead of the page
+        being parsed.  0 requests each page after the previous one has been
+        stored.  Default is 0.
+      checkpoint: a function called with each page of results, the number of
+        entities written for it and their size in bytes, once all of its
+        entities have been written.  Default is None.
+      partial: True to request only the fields which are parsed, by adding
+        the mask returned by FieldsMask to args unless args already has
+        fields.  False requests the full resources.  Default is False.
       args: keyword parameters to pass to the method that invokes the API.
     """
     self.entity_to_parse = entity_to_parse
@@ -62,7 +99,19 @@ class Parser(object):
     self.model = model
     self.date_type = date_type
     self.index = index
+    self.batch_size = min(batch_size, Parser.MAX_BATCH_SIZE)
+    self.fetcher = fetcher or apifetch.Fetcher()
+    self.prefetch = prefetch
+    self.checkpoint = checkpoint
     self.args = args
+    if partial and "fields" not in args:
+      self.args["fields"] = self.FieldsMask(entity_to_parse, model)
+    self.entities_written = 0
+    self.bytes_written = 0
+    self._pending = []
+    self._sizes_seen = 0
+    self._sampled_count = 0
+    self._sampled_bytes = 0
 
   def ParseAndStore(self, api_data):
     """Parses the provided data and stores the resulting entities.
@@ -81,7 +130,10 @@ class Parser(object):
       # top level is a record itself
       if not [item for item in api_data if item != "kind" and item != "etag"]:
         return []
-      return self.ParseItem(api_data, self.entity_to_parse, self.parent_entity)
+      result = self.ParseItem(api_data, self.entity_to_parse,
+                              self.parent_entity)
+      self.Flush()
+      return result
 
     if self.index:
       return self.ParseIndexPaging(api_data)
@@ -101,14 +153,26 @@ class Parser(object):
       The list of entities created by parsing api_data.
     """
     results = []
-    while "nextPageToken" in api_data:
-      results += self.ParsePage(api_data)
-      args = self.args.copy()
-      args["pageToken"] = api_data["nextPageToken"]
-      api_data = self.method(**args).execute()
-    results += self.ParsePage(api_data)
+    for page in self.Pages(api_data):
+      results += self.ParsePage(page)
     return results
 
+  def NextPageRequest(self, api_data):
+    """Builds the request for the page following a page of token-based results.
+
+    Args:
+      api_data: a Python dict returned by the Apiary API.
+
+    Returns:
+      The apiclient.http.HttpRequest for the next page, or None if api_data is
+      the last page.
+    """
+    if "nextPageToken" not in api_data:
+      return None
+    args = self.args.copy()
+    args["pageToken"] = api_data["nextPageToken"]
+    return self.method(**args)
+
   def ParseIndexPaging(self, api_data):
     """Parses the provided data and stores the resulting entities.
 
@@ -122,16 +186,67 @@ class Parser(object):
       The list of entities created by parsing api_data.
     """
     results = []
-    start_index = 0
-    while api_data:
-      next_page = self.ParsePage(api_data)
-      results += next_page
-      start_index += len(next_page)
-      args = self.args.copy()
-      args["start_index"] = start_index
-      api_data = self.method(**args).execute()
+    for page in self.Pages(api_data):
+      results += self.ParsePage(page)
     return results
 
+  def Pages(self, api_data):
+    """Iterates over all pages of results, starting with api_data.
+
+    With prefetching enabled the request for the next page is issued before a
+    page is handed out, so that it is in flight while the caller parses and
+    stores the page.  Since every request depends on the previous response,
+    prefetch pages are buffered ahead of the caller by waiting for responses
+    early.  Without prefetching the next page is only requested once the
+    caller asks for it.
+
+    Args:
+      api_data: a Python dict returned by the Apiary API.
+
+    Yields:
+      Each page of results in order, api_data first.
+    """
+    start_index = 0
+    ready = collections.deque()
+    request = None
+    pending = None
+    while True:
+      if api_data:
+        ready.append(api_data)
+        start_index += len(Parser._Items(api_data))
+        request = self._FollowingRequest(api_data, start_index)
+      api_data = None
+      # a page is handed out with up to prefetch pages requested after it.
+      if (request is not None and pending is None and
+          len(ready) <= self.prefetch):
+        pending = self.fetcher.Start(request)
+        request = None
+      if pending is not None and len(ready) < max(1, self.prefetch):
+        api_data = pending.GetResult()
+        pending = None
+        continue
+      if not ready:
+        return
+      yield ready.popleft()
+
+  def _FollowingRequest(self, api_data, start_index):
+    """Builds the request for the page following a page of results.
+
+    Args:
+      api_data: a Python dict returned by the Apiary API.
+      start_index: the number of results in the pages so far, for index-based
+        paging.
+
+    Returns:
+      The apiclient.http.HttpRequest for the next page, or None if api_data is
+      the last page.
+    """
+    if not self.index:
+      return self.NextPageRequest(api_data)
+    args = self.args.copy()
+    args["start_index"] = start_index
+    return self.method(**args)
+
   def ParsePage(self, api_data):
     """Parses a single page of API data and stores the resulting entities.
 
@@ -141,19 +256,16 @@ class Parser(object):
     Returns:
       The list of entities created from that page of data.
     """
+    written = self.entities_written
+    size = self.bytes_written
     page = []
-    if "items" in api_data:
-      l = api_data["items"]
-    elif "entry" in api_data:
-      l = api_data["entry"]
-    elif isinstance(api_data, list):
-      l = api_data
-    else:
-      # page is empty
-      l = []
-    for item in l:
+    for item in Parser._Items(api_data):
       page.append(self.ParseItem(item, self.entity_to_parse,
                                  self.parent_entity))
+    self.Flush()
+    if self.checkpoint is not None:
+      self.checkpoint(api_data, self.entities_written - written,
+                      self.bytes_written - size)
     return page
 
   def ParseItem(self, item, entity_to_parse, parent_entity):
@@ -170,91 +282,232 @@ class Parser(object):
     Returns:
       The entity created by parsing item.
     """
-    if "id" in item:
-      model_obj = entity_to_parse(parent=self.snapshot,
-                                  key_name=str(item["id"]))
-    else:
-      logging.warning("no id: %s" % item)
-      model_obj = entity_to_parse(parent=self.snapshot)
-    model_obj.put()
+    model_obj = self.NewEntity(item, entity_to_parse)
     if parent_entity:
       model_obj.parent_entity = parent_entity
-    props = model_obj.properties()
+    plan = self.Plan(entity_to_parse)
     for key, value in item.items():
-      if key not in Parser._EXCLUDED_FIELDS:
-        prop_name = Parser.ApiToModel(key)
-
-        if (entity_to_parse, key) in self.model.child_mapping:
-          for item in value:
-            self.ParseItem(item, self.model.child_mapping[entity_to_parse, key],
-                           model_obj)
-        elif (isinstance(props[prop_name], db.StringProperty) or
-              isinstance(props[prop_name], db.TextProperty) or
-              isinstance(props[prop_name], db.BooleanProperty) or
-              isinstance(props[prop_name], db.IntegerProperty)):
-          setattr(model_obj, prop_name, value)
-        elif isinstance(props[prop_name], db.FloatProperty):
-          setattr(model_obj, prop_name, float(value))
-        elif isinstance(props[prop_name], db.LinkProperty):
-          link = db.Link(value)
-          setattr(model_obj, prop_name, link)
-        elif isinstance(props[prop_name], db.PhoneNumberProperty):
-          pn = db.PhoneNumber(value)
-          setattr(model_obj, prop_name, pn)
-        elif isinstance(props[prop_name], db.BlobProperty):
-          blob = db.Blob(urlfetch.fetch(value).content)
-          setattr(model_obj, prop_name, blob)
-        elif isinstance(props[prop_name], db.DateProperty):
-          # The elif clause for DateProperty must come ABOVE the elif clause for
-          # DateTimeProperty because DateProperty is a subclass of
-          # DateTimeProperty. If we ever add a TimeProperty we will need it
-          # to be above DateTimeProperty as well.
-          d = datetime.datetime.strptime(value, "%Y-%m-%dT00:00:00.000Z").date()
-          setattr(model_obj, prop_name, d)
-        elif isinstance(props[prop_name], db.DateTimeProperty):
-          if self.date_type == "friendly":
-            part1, part2 = value.split(".")
-            dt = datetime.datetime.strptime(part1, "%Y-%m-%dT%H:%M:%S")
-            dt = dt.replace(microsecond=int(part2[0:3])*1000)
-          elif self.date_type == "timestamp":
-            part1 = value[:-3]
-            part2 = value[-3:]
-            dt = datetime.datetime.fromtimestamp(long(part1))
-            dt = dt.replace(microsecond=int(part2)*1000)
-          else:
-            raise ValueError("Not a valid date_type: %s" % self.date_type)
-          setattr(model_obj, prop_name, dt)
-        elif isinstance(props[prop_name], db.ReferenceProperty):
-          key_obj = db.Key.from_path(
-              self.snapshot.kind(), self.snapshot.key().id(),
-              props[prop_name].reference_class.kind(), value)
-          setattr(model_obj, prop_name, key_obj)
-        elif isinstance(props[prop_name], db.ListProperty):
-          if props[prop_name].item_type == db.Key:
-            key_objs = []
-            for key_obj in value:
-              key_objs.append(
-                  db.Key.from_path(
-                      self.snapshot.kind(), self.snapshot.key().id(),
-                      self.model.many_many_mapping[entity_to_parse,
-                                                   key].__name__, key_obj))
-            setattr(model_obj, prop_name, key_objs)
-          else:
-            setattr(model_obj, prop_name, value)
-        elif isinstance(props[prop_name], properties.TimeDeltaProperty):
-          milliseconds = long(value)
-          dt = datetime.timedelta(seconds=milliseconds / 1000,
-                                  milliseconds=milliseconds % 1000)
-          setattr(model_obj, prop_name, dt)
-        elif isinstance(props[prop_name], properties.DictProperty):
-          setattr(model_obj, prop_name, value)
-        else:
-          raise ValueError("Could not parse property %s.\n"
-                           "Value: %s" % (key, value))
-
-    model_obj.put()
+      try:
+        step = plan[key]
+      except KeyError:
+        step = plan[key] = self.CompileStep(entity_to_parse, key, value)
+      if step is None:
+        continue
+      prop_name, convert, child_entity = step
+      if child_entity is not None:
+        for child in value:
+          self.ParseItem(child, child_entity, model_obj)
+      else:
+        setattr(model_obj, prop_name, convert(self, value))
+
+    self.Store(model_obj)
     return model_obj
 
+  def Plan(self, entity_to_parse):
+    """Returns the cached conversion plan for a type of entity.
+
+    A plan maps the name of each API field seen so far to the result of
+    CompileStep for it.  Plans are shared by all parsers with the same model
+    and date_type, so that each field is only inspected once per process.
+
+    Args:
+      entity_to_parse: the type of entity being created.
+
+    Returns:
+      The plan dict, which the caller may extend.
+    """
+    plan_key = (entity_to_parse, self.model, self.date_type)
+    try:
+      return Parser._PLANS[plan_key]
+    except KeyError:
+      return Parser._PLANS.setdefault(plan_key, {})
+
+  def CompileStep(self, entity_to_parse, key, value):
+    """Works out how to convert one API field into a model property.
+
+    Args:
+      entity_to_parse: the type of entity being created.
+      key: the name of the field in the API results.
+      value: a value of the field, used in error messages.
+
+    Raises:
+      ValueError: if the field cannot be converted.
+
+    Returns:
+      None if the field is ignored, otherwise a tuple of the property name, a
+      function taking the parser and the API value and returning the property
+      value, and the type of the child entities if the field holds children.
+    """
+    if key in Parser._EXCLUDED_FIELDS:
+      return None
+    prop_name = Parser.ApiToModel(key)
+
+    if (entity_to_parse, key) in self.model.child_mapping:
+      return (prop_name, None, self.model.child_mapping[entity_to_parse, key])
+
+    prop = entity_to_parse.properties()[prop_name]
+    if (isinstance(prop, db.StringProperty) or
+        isinstance(prop, db.TextProperty) or
+        isinstance(prop, db.BooleanProperty) or
+        isinstance(prop, db.IntegerProperty)):
+      convert = _Identity
+    elif isinstance(prop, db.FloatProperty):
+      convert = _ToFloat
+    elif isinstance(prop, db.LinkProperty):
+      convert = _ToLink
+    elif isinstance(prop, db.PhoneNumberProperty):
+      convert = _ToPhoneNumber
+    elif isinstance(prop, db.BlobProperty):
+      convert = _ToBlob
+    elif isinstance(prop, db.DateProperty):
+      # The elif clause for DateProperty must come ABOVE the elif clause for
+      # DateTimeProperty because DateProperty is a subclass of
+      # DateTimeProperty. If we ever add a TimeProperty we will need it
+      # to be above DateTimeProperty as well.
+      convert = _ToDate
+    elif isinstance(prop, db.DateTimeProperty):
+      if self.date_type == "friendly":
+        convert = _FriendlyToDateTime
+      elif self.date_type == "timestamp":
+        convert = _TimestampToDateTime
+      else:
+        raise ValueError("Not a valid date_type: %s" % self.date_type)
+    elif isinstance(prop, db.ReferenceProperty):
+      convert = _KeyConverter(prop.reference_class.kind())
+    elif isinstance(prop, db.ListProperty):
+      if prop.item_type == db.Key:
+        convert = _KeyListConverter(
+            self.model.many_many_mapping[entity_to_parse, key].__name__)
+      else:
+        convert = _Identity
+    elif isinstance(prop, properties.TimeDeltaProperty):
+      convert = _ToTimeDelta
+    elif isinstance(prop, properties.DictProperty):
+      convert = _Identity
+    else:
+      raise ValueError("Could not parse property %s.\n"
+                       "Value: %s" % (key, value))
+    return (prop_name, convert, None)
+
+  @staticmethod
+  def FieldsMask(entity_to_parse, model):
+    """Returns the partial response mask of a page of entities.
+
+    The mask selects the API fields of the properties of entity_to_parse and,
+    through child_mapping, of its child entities, as well as nextPageToken,
+    so that the API leaves out everything ParseItem would ignore.
+
+    Args:
+      entity_to_parse: the type of entity being created.
+      model: a module containing the child_mapping dictionary.
+
+    Returns:
+      A string such as "items(id,title),nextPageToken" for the fields
+      parameter of a list method.
+    """
+    mask_key = (entity_to_parse, model)
+    try:
+      return Parser._MASKS[mask_key]
+    except KeyError:
+      mask = "items(%s),nextPageToken" % Parser._ItemFields(entity_to_parse,
+                                                            model)
+      return Parser._MASKS.setdefault(mask_key, mask)
+
+  @staticmethod
+  def _ItemFields(entity_to_parse, model):
+    """Returns the fields selector of a single item of entity_to_parse."""
+    fields = [Parser.ModelToApi(name) for name in entity_to_parse.properties()
+              if name not in Parser._PARSER_PROPERTIES]
+    for (parent_type, key), child_entity in model.child_mapping.items():
+      if parent_type is entity_to_parse:
+        fields.append("%s(%s)" % (key, Parser._ItemFields(child_entity,
+                                                          model)))
+    # a stable order keeps the request URLs, and so their cache keys, stable.
+    fields.sort()
+    return ",".join(fields)
+
+  def NewEntity(self, item, entity_to_parse):
+    """Creates an unsaved entity with a complete key for a single item.
+
+    The key is complete before the entity is written so that child entities
+    can reference it without an extra datastore round trip.  Items carrying an
+    id use it as key name; other items get an id reserved in advance.
+
+    Args:
+      item: a Python dict representing a single item of data.
+      entity_to_parse: the type of entity being created.
+
+    Returns:
+      The new, unsaved entity.
+    """
+    if "id" in item:
+      return entity_to_parse(parent=self.snapshot, key_name=str(item["id"]))
+    logging.warning("no id: %s" % item)
+    parent_key = self.snapshot.key()
+    start = db.allocate_ids(
+        db.Key.from_path(entity_to_parse.kind(), 1, parent=parent_key), 1)[0]
+    return entity_to_parse(key=db.Key.from_path(entity_to_parse.kind(), start,
+                                                parent=parent_key))
+
+  def Store(self, entity):
+    """Writes an entity, or buffers it if batched writes are enabled.
+
+    Args:
+      entity: the fully populated entity to store.
+    """
+    if not self.batch_size:
+      entity.put()
+      self.entities_written += 1
+      self.bytes_written += self._EstimateSize(entity)
+      return
+    self._pending.append(entity)
+    if len(self._pending) >= self.batch_size:
+      self.Flush()
+
+  def Flush(self):
+    """Writes all buffered entities to the datastore with one batch put."""
+    if self._pending:
+      db.put(self._pending)
+      self.entities_written += len(self._pending)
+      for entity in self._pending:
+        self.bytes_written += self._EstimateSize(entity)
+      self._pending = []
+
+  def _EstimateSize(self, entity):
+    """Returns the size in bytes of a written entity, sampling its encoding.
+
+    Encoding every entity again only to measure it would double the cost of
+    serializing them, so only every SIZE_SAMPLE_INTERVAL-th entity, starting
+    with the first, is measured with EncodedSize.
+
+    Args:
+      entity: the entity which has been written.
+
+    Returns:
+      The size of entity if it was measured, else the average size of the
+      entities measured so far.
+    """
+    self._sizes_seen += 1
+    if self._sizes_seen % Parser.SIZE_SAMPLE_INTERVAL != 1:
+      return self._sampled_bytes / self._sampled_count
+    size = EncodedSize(entity)
+    self._sampled_count += 1
+    self._sampled_bytes += size
+    return size
+
+  @staticmethod
+  def _Items(api_data):
+    """Returns the list of items in a single page of API data."""
+    if "items" in api_data:
+      return api_data["items"]
+    elif "entry" in api_data:
+      return api_data["entry"]
+    elif isinstance(api_data, list):
+      return api_data
+    else:
+      # page is empty
+      return []
+
   @staticmethod
   def ApiToModel(key):
     """Converts an API property name to a Model property name.
@@ -268,3 +521,83 @@ class Parser(object):
     if key in Parser._RESERVED_WORDS:
       return key + "_"
     return key
+
+  @staticmethod
+  def ModelToApi(name):
+    """Converts a Model property name to an API property name.
+
+    Args:
+      name: the name of the property in the datastore model.
+
+    Returns:
+      The name of the same property in the API results.
+    """
+    if name.endswith("_") and name[:-1] in Parser._RESERVED_WORDS:
+      return name[:-1]
+    return name
+
+
+def EncodedSize(entity):
+  """Returns the size in bytes of an entity as stored in the datastore."""
+  return db.model_to_protobuf(entity).ByteSize()
+
+
+def _Identity(parser, value):
+  return value
+
+
+def _ToFloat(parser, value):
+  return float(value)
+
+
+def _ToLink(parser, value):
+  return db.Link(value)
+
+
+def _ToPhoneNumber(parser, value):
+  return db.PhoneNumber(value)
+
+
+def _ToBlob(parser, value):
+  return db.Blob(urlfetch.fetch(value).content)
+
+
+def _ToDate(parser, value):
+  return dates.ParseDate(value)
+
+
+def _FriendlyToDateTime(parser, value):
+  return dates.ParseDateTime(value)
+
+
+def _TimestampToDateTime(parser, value):
+  part1 = value[:-3]
+  part2 = value[-3:]
+  dt = datetime.datetime.fromtimestamp(long(part1))
+  return dt.replace(microsecond=int(part2)*1000)
+
+
+def _ToTimeDelta(parser, value):
+  milliseconds = long(value)
+  return datetime.timedelta(seconds=milliseconds / 1000,
+                            milliseconds=milliseconds % 1000)
+
+
+def _KeyConverter(kind):
+  """Returns a converter from an API id to the key of an entity of kind."""
+
+  def Convert(parser, value):
+    return db.Key.from_path(parser.snapshot.kind(), parser.snapshot.key().id(),
+                            kind, value)
+  return Convert
+
+
+def _KeyListConverter(kind):
+  """Returns a converter from API ids to the keys of entities of kind."""
+
+  def Convert(parser, value):
+    snapshot_kind = parser.snapshot.kind()
+    snapshot_id = parser.snapshot.key().id()
+    return [db.Key.from_path(snapshot_kind, snapshot_id, kind, key_obj)
+            for key_obj in value]
+  return Convert
@@ -22,6 +22,8 @@ upload them to an Apiary API
 
 __author__ = "dwightguth@google.com (Dwight Guth)"
 
+from apiclient import http
+
 from google.appengine.ext import db
 
 PREVIOUS_ARGUMENT = object()
@@ -32,7 +34,10 @@ class Uploader(object):
 
   _RESERVED_WORDS = ("parent_")
 
-  def __init__(self, insert_method, **args):
+  # Conversion plans by entity type.  See Plan.
+  _PLANS = {}
+
+  def __init__(self, insert_method, batch_size=0, **args):
     """Creates a new Uploader object.
 
     If you want each item uploaded to have a query parameter set to the value
@@ -41,9 +46,18 @@ class Uploader(object):
 
     Args:
       insert_method: the method which is called to invoke the API.
+      batch_size: the number of entities uploaded per batch request, or 0 to
+        upload every entity with a request of its own.
       args: keyword parameters to pass to the method that invokes the API.
+
+    Raises:
+      ValueError: if batch_size is used together with PREVIOUS_ARGUMENT,
+        since the parts of a batch request may be executed in any order.
     """
+    if batch_size and PREVIOUS_ARGUMENT in args.values():
+      raise ValueError("PREVIOUS_ARGUMENT cannot be used in batches.")
     self.insert_method = insert_method
+    self.batch_size = batch_size
     self.args = args
     self.previous = None
 
@@ -56,6 +70,8 @@ class Uploader(object):
     Returns:
       The list of API keys assigned by the API to the entities uploaded
     """
+    if self.batch_size:
+      return self.UploadBatches(entities)
     keys = []
 
     for entity in entities:
@@ -66,6 +82,48 @@ class Uploader(object):
       keys.append(ret_id)
     return keys
 
+  def UploadBatches(self, entities):
+    """Uploads the provided entities with batch_size entities per request.
+
+    Args:
+      entities: a Python list of model instances to upload.
+
+    Raises:
+      apiclient.errors.HttpError: if the API rejected any of the entities.
+
+    Returns:
+      The list of API keys assigned by the API to the entities uploaded
+    """
+    keys = []
+
+    for i in range(0, len(entities), self.batch_size):
+      chunk = entities[i:i + self.batch_size]
+      results = {}
+      def Callback(request_id, response, exception):
+        results[request_id] = (response, exception)
+      batch = http.BatchHttpRequest(callback=Callback)
+      for entity in chunk:
+        args = self.args.copy()
+        args["body"] = self.BuildBody(entity)
+        batch.add(self.insert_method(**args))
+      batch.execute()
+
+      uploaded = []
+      error = None
+      for index, entity in enumerate(chunk):
+        response, exception = results[str(index + 1)]
+        if exception is not None:
+          error = error or exception
+          continue
+        entity.id = response["id"]
+        keys.append(entity.id)
+        uploaded.append(entity)
+      # the entities the API accepted are saved even if others failed.
+      db.put(uploaded)
+      if error is not None:
+        raise error
+    return keys
+
   def UploadEntity(self, entity):
     """Uploads the provided entity to the Apiary API.
 
@@ -105,39 +163,67 @@ class Uploader(object):
     """
     result = {}
 
-    for prop_name, prop in entity.properties().items():
+    for prop_name, api_name, convert in Uploader.Plan(type(entity)):
       data = getattr(entity, prop_name)
-      api_name = Uploader.ModelToApi(prop_name)
       if data is None:
         continue
-      if (isinstance(prop, db.StringProperty) or
-          isinstance(prop, db.TextProperty) or
-          isinstance(prop, db.BooleanProperty) or
-          isinstance(prop, db.IntegerProperty) or
-          isinstance(prop, db.FloatProperty)):
-        result[api_name] = data
-      elif isinstance(prop, db.LinkProperty):
-        result[api_name] = str(data)
-      elif isinstance(prop, db.DateProperty):
-        # The elif clause for DateProperty must come ABOVE the elif clause for
-        # DateTimeProperty because DateProperty is a subclass of
-        # DateTimeProperty. If we ever add a TimeProperty we will need it
-        # to be above DateTimeProperty as well.
-        result[api_name] = data.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-      elif isinstance(prop, db.DateTimeProperty):
-        result[api_name] = data.strftime("%Y-%m-%dT%H:%M:%S.")
-        result[api_name] += str(data.microsecond / 1000)
-        result[api_name] += "Z"
-      elif isinstance(prop, db.ReferenceProperty):
-        result[api_name] = data.id
-      elif isinstance(prop, db.ListProperty):
-        prop_value = getattr(entity, prop_name)
-        result[api_name] = [key.name() for key in prop_value]
-      else:
-        raise ValueError("Could not convert property %s to POST data.\n"
-                         "Value: %s" % (prop_name, data))
+      result[api_name] = convert(entity, prop_name, data)
     return result
 
+  @staticmethod
+  def Plan(entity_class):
+    """Returns the cached conversion plan for a type of entity.
+
+    Args:
+      entity_class: the db.Model subclass being uploaded.
+
+    Returns:
+      A list of (property name, API name, converter) tuples, one per property
+      of entity_class.  A converter takes the entity, the property name and the
+      non-None property value and returns the POST data for it.
+    """
+    try:
+      return Uploader._PLANS[entity_class]
+    except KeyError:
+      plan = [(prop_name, Uploader.ModelToApi(prop_name),
+               Uploader.CompileStep(prop))
+              for prop_name, prop in entity_class.properties().items()]
+      return Uploader._PLANS.setdefault(entity_class, plan)
+
+  @staticmethod
+  def CompileStep(prop):
+    """Works out how to convert one model property into POST data.
+
+    Args:
+      prop: the db.Property to convert.
+
+    Returns:
+      A converter as described in Plan.  Converters for properties which cannot
+      be converted raise a ValueError.
+    """
+    if (isinstance(prop, db.StringProperty) or
+        isinstance(prop, db.TextProperty) or
+        isinstance(prop, db.BooleanProperty) or
+        isinstance(prop, db.IntegerProperty) or
+        isinstance(prop, db.FloatProperty)):
+      return _Identity
+    elif isinstance(prop, db.LinkProperty):
+      return _FromLink
+    elif isinstance(prop, db.DateProperty):
+      # The elif clause for DateProperty must come ABOVE the elif clause for
+      # DateTimeProperty because DateProperty is a subclass of
+      # DateTimeProperty. If we ever add a TimeProperty we will need it
+      # to be above DateTimeProperty as well.
+      return _FromDate
+    elif isinstance(prop, db.DateTimeProperty):
+      return _FromDateTime
+    elif isinstance(prop, db.ReferenceProperty):
+      return _FromReference
+    elif isinstance(prop, db.ListProperty):
+      return _FromKeyList
+    else:
+      return _Unsupported
+
   @staticmethod
   def ModelToApi(prop_name):
     """Converts a Model property name to an API property name.
@@ -151,3 +237,35 @@ class Uploader(object):
     if prop_name in Uploader._RESERVED_WORDS:
       return prop_name[:-1]
     return prop_name
+
+
+def _Identity(entity, prop_name, data):
+  return data
+
+
+def _FromLink(entity, prop_name, data):
+  return str(data)
+
+
+def _FromDate(entity, prop_name, data):
+  return data.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _FromDateTime(entity, prop_name, data):
+  result = data.strftime("%Y-%m-%dT%H:%M:%S.")
+  result += str(data.microsecond / 1000)
+  result += "Z"
+  return result
+
+
+def _FromReference(entity, prop_name, data):
+  return data.id
+
+
+def _FromKeyList(entity, prop_name, data):
+  return [key.name() for key in data]
+
+
+def _Unsupported(entity, prop_name, data):
+  raise ValueError("Could not convert property %s to POST data.\n"
+                   "Value: %s" % (prop_name, data))
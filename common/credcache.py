@@ -0,0 +1,99 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of the users whose OAuth2 credentials were recently found valid.
+
+The only reliable way to know that credentials have not been revoked is to
+use them.  Once they have been used successfully the result is remembered in
+instance memory and in memcache, until the access token expires or at most for
+VALIDITY_TTL seconds.  Workers invalidate the entry of a user as soon as a
+refresh of the credentials fails, although other instances may keep trusting
+the credentials until their copy of the entry expires.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import datetime
+import time
+
+from google.appengine.api import memcache
+
+# Maximum number of seconds credentials are trusted without using them.
+VALIDITY_TTL = 300
+
+# Maximum number of users remembered in instance memory before it is reset.
+_MAX_ENTRIES = 1000
+
+_NAMESPACE = "credcache"
+
+# Time until which the credentials of each user id are trusted.
+_valid_until = {}
+
+
+def IsValid(user_id):
+  """Returns whether the credentials of a user were recently found valid.
+
+  Args:
+    user_id: the user id of the owner of the credentials.
+
+  Returns:
+    True if the credentials were validated less than VALIDITY_TTL seconds ago
+    and their access token has not expired since.
+  """
+  now = time.time()
+  if _valid_until.get(user_id, 0) > now:
+    return True
+  valid_until = memcache.get(user_id, namespace=_NAMESPACE)
+  if valid_until is None or valid_until <= now:
+    return False
+  _Remember(user_id, valid_until)
+  return True
+
+
+def MarkValid(user_id, credentials):
+  """Records that the credentials of a user have just been used successfully.
+
+  Args:
+    user_id: the user id of the owner of the credentials.
+    credentials: the OAuth2Credentials which were used.
+  """
+  ttl = VALIDITY_TTL
+  if credentials.token_expiry is not None:
+    # oauth2client sets token_expiry from the local clock, not UTC.
+    remaining = credentials.token_expiry - datetime.datetime.now()
+    ttl = min(ttl, remaining.days * 86400 + remaining.seconds)
+  if ttl <= 0:
+    return
+  valid_until = time.time() + ttl
+  _Remember(user_id, valid_until)
+  memcache.set(user_id, valid_until, time=ttl, namespace=_NAMESPACE)
+
+
+def Invalidate(user_id):
+  """Forgets that the credentials of a user were found valid.
+
+  Args:
+    user_id: the user id of the owner of the credentials.
+  """
+  _valid_until.pop(user_id, None)
+  memcache.delete(user_id, namespace=_NAMESPACE)
+
+
+def _Remember(user_id, valid_until):
+  """Stores valid_until in instance memory, resetting it when it is full."""
+  if len(_valid_until) >= _MAX_ENTRIES:
+    _valid_until.clear()
+  _valid_until[user_id] = valid_until
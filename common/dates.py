@@ -0,0 +1,144 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fast parsing of the date formats used by the Tasks API and Outlook.
+
+datetime.strptime is slow, so the exact formats produced by the Tasks API and
+by Outlook CSV exports are parsed by slicing.  Anything else falls back to
+strptime.  Results are memoized because the same dates occur many times.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import datetime
+
+# Maximum number of strings remembered per format before the memo is reset.
+_MEMO_SIZE = 4096
+
+_datetime_memo = {}
+_date_memo = {}
+_outlook_memo = {}
+
+
+def ParseDateTime(value):
+  """Parses an RFC 3339 timestamp such as "2011-08-11T21:32:05.000Z".
+
+  Args:
+    value: the string to parse.
+
+  Raises:
+    ValueError: if value is not a valid timestamp.
+
+  Returns:
+    A naive datetime.datetime in UTC with millisecond precision.
+  """
+  try:
+    return _datetime_memo[value]
+  except KeyError:
+    pass
+  if (len(value) == 24 and value[4] == "-" and value[7] == "-" and
+      value[10] == "T" and value[13] == ":" and value[16] == ":" and
+      value[19] == "." and value[23] == "Z" and
+      (value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] +
+       value[17:19] + value[20:23]).isdigit()):
+    try:
+      result = datetime.datetime(int(value[0:4]), int(value[5:7]),
+                                 int(value[8:10]), int(value[11:13]),
+                                 int(value[14:16]), int(value[17:19]),
+                                 int(value[20:23]) * 1000)
+    except ValueError:
+      result = _StrptimeDateTime(value)
+  else:
+    result = _StrptimeDateTime(value)
+  return _Remember(_datetime_memo, value, result)
+
+
+def ParseDate(value):
+  """Parses an RFC 3339 date at midnight such as "2011-08-11T00:00:00.000Z".
+
+  Args:
+    value: the string to parse.
+
+  Raises:
+    ValueError: if value is not a valid date.
+
+  Returns:
+    A datetime.date.
+  """
+  try:
+    return _date_memo[value]
+  except KeyError:
+    pass
+  if (len(value) == 24 and value[4] == "-" and value[7] == "-" and
+      value[10:] == "T00:00:00.000Z" and
+      (value[0:4] + value[5:7] + value[8:10]).isdigit()):
+    try:
+      result = datetime.date(int(value[0:4]), int(value[5:7]),
+                             int(value[8:10]))
+    except ValueError:
+      result = _StrptimeDate(value)
+  else:
+    result = _StrptimeDate(value)
+  return _Remember(_date_memo, value, result)
+
+
+def ParseOutlookDate(value):
+  """Parses a date from an Outlook CSV export such as "8/11/2011".
+
+  Args:
+    value: the string to parse, in month/day/year order.
+
+  Raises:
+    ValueError: if value is not a valid date.
+
+  Returns:
+    A datetime.datetime at midnight.
+  """
+  try:
+    return _outlook_memo[value]
+  except KeyError:
+    pass
+  parts = value.split("/")
+  if len(parts) == 3 and len(parts[2]) == 4 and "".join(parts).isdigit():
+    try:
+      result = datetime.datetime(int(parts[2]), int(parts[0]), int(parts[1]))
+    except ValueError:
+      result = datetime.datetime.strptime(value, "%m/%d/%Y")
+  else:
+    result = datetime.datetime.strptime(value, "%m/%d/%Y")
+  return _Remember(_outlook_memo, value, result)
+
+
+def _StrptimeDateTime(value):
+  """Parses an RFC 3339 timestamp of unusual shape with strptime."""
+  part1, part2 = value.split(".")
+  dt = datetime.datetime.strptime(part1, "%Y-%m-%dT%H:%M:%S")
+  if not part2[0:3].isdigit():
+    raise ValueError("time data %r has no milliseconds" % value)
+  return dt.replace(microsecond=int(part2[0:3])*1000)
+
+
+def _StrptimeDate(value):
+  """Parses an RFC 3339 date of unusual shape with strptime."""
+  return datetime.datetime.strptime(value, "%Y-%m-%dT00:00:00.000Z").date()
+
+
+def _Remember(memo, value, result):
+  """Stores result in memo, resetting memo when it is full."""
+  if len(memo) >= _MEMO_SIZE:
+    memo.clear()
+  memo[value] = result
+  return result
@@ -0,0 +1,54 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Deferred imports of modules which only some requests need.
+
+A handler script is imported again by every new instance, so each module it
+imports adds to the latency of the first request of the instance.  Modules
+which only serve a few of the requests of a handler, such as the parsers of
+uploaded files, are bound to a LazyModule instead and only imported when
+their code first runs:
+
+  icalparse = lazyimport.LazyModule("icalparse")
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import sys
+
+
+class LazyModule(object):
+  """Stands in for a module until one of its attributes is used."""
+
+  def __init__(self, name):
+    """Creates a new LazyModule object.
+
+    Args:
+      name: the full dotted name of the module, as for an import statement.
+    """
+    self._name = name
+    self._module = None
+
+  def __getattr__(self, attr):
+    # only called for attributes which the LazyModule itself does not have.
+    module = self._module
+    if module is None:
+      __import__(self._name)
+      module = self._module = sys.modules[self._name]
+    return getattr(module, attr)
+
+  def __repr__(self):
+    return "<lazy module %r>" % self._name
@@ -0,0 +1,54 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of Tasks API responses shared by the handlers of an instance.
+
+The Tasks API sends an ETag with every response, so a cached response is
+revalidated with If-None-Match and only downloaded again when it changed.
+Responses are kept per user in instance memory and in memcache.  Only
+requests made through httplib2 use the cache; requests sent with
+asynchronous urlfetch calls bypass it.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import logging
+
+from google.appengine.api import memcache
+
+import httplib2
+
+# Maximum number of bytes of responses kept in instance memory.
+CACHE_BYTES = 4 * 1024 * 1024
+
+_cache = httplib2.MemoryCache(max_bytes=CACHE_BYTES, memcache=memcache)
+
+
+def Http(user):
+  """Creates an httplib2.Http object caching the responses for a user.
+
+  Args:
+    user: the users.User on whose behalf requests are made.
+
+  Returns:
+    The new httplib2.Http object.
+  """
+  return httplib2.Http(cache=_cache.view(user.user_id()))
+
+
+def LogStats():
+  """Logs the counters of the cache, including the bytes it saved."""
+  logging.info("Response cache: %r", _cache.stats())
@@ -19,9 +19,9 @@
 __author__ = "dwightguth@google.com (Dwight Guth)"
 
 import csv
-import datetime
 import StringIO
 
+from common import dates
 import model
 
 
@@ -72,10 +72,9 @@ class Parser(object):
     if item["Notes"]:
       task.notes = item["Notes"]
     if item["Due Date"]:
-      task.due = datetime.datetime.strptime(item["Due Date"], "%m/%d/%Y").date()
+      task.due = dates.ParseOutlookDate(item["Due Date"]).date()
     if item["Date Completed"]:
-      task.completed = datetime.datetime.strptime(item["Date Completed"],
-                                                  "%m/%d/%Y")
+      task.completed = dates.ParseOutlookDate(item["Date Completed"])
     if item["Status"]:
       if item["Status"] == "Complete":
         task.status = "completed"
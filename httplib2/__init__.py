@@ -30,8 +30,6 @@ import email
 import email.Utils
 import email.Message
 import email.FeedParser
-import StringIO
-import gzip
 import zlib
 import httplib
 import urlparse
@@ -42,6 +40,7 @@ import calendar
 import time
 import random
 import errno
+import threading
 # remove depracated warning in python2.6
 try:
     from hashlib import sha1 as _sha, md5 as _md5
@@ -80,7 +79,8 @@ def has_timeout(timeout): # python 2.6
         return (timeout is not None and timeout is not socket._GLOBAL_DEFAULT_TIMEOUT)
     return (timeout is not None)
 
-__all__ = ['Http', 'Response', 'ProxyInfo', 'HttpLib2Error',
+__all__ = ['Http', 'Response', 'ProxyInfo', 'ConnectionPool', 'MemoryCache',
+  'HttpLib2Error',
   'RedirectMissingLocation', 'RedirectLimit', 'FailedToDecompressContent',
   'UnimplementedDigestAuthOptionError', 'UnimplementedHmacDigestAuthOptionError',
   'debuglevel', 'ProxiesUnavailableError']
@@ -346,20 +346,56 @@ def _entry_disposition(response_headers, request_headers):
             retval = "FRESH"
     return retval
 
-def _decompressContent(response, new_content):
+# Number of bytes read from the socket at a time while inflating a response.
+READ_CHUNK_SIZE = 64 * 1024
+
+def _decompressor(encoding):
+    """Return a zlib decompressobj for a content-encoding, or None."""
+    if encoding == 'gzip':
+        # 16 makes zlib expect and skip a gzip header and trailer.
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    return None
+
+def _readContent(response):
+    """Read the body of an httplib response, inflating it as it arrives.
+
+    Returns a (content, inflated) tuple, so that the compressed body never
+    has to be held in full next to the inflated one.
+    """
+    encoding = response.getheader('content-encoding', None)
+    try:
+        decompressor = _decompressor(encoding)
+    except zlib.error:
+        decompressor = None
+    if decompressor is None:
+        return response.read(), False
+    chunks = []
+    try:
+        while True:
+            data = response.read(READ_CHUNK_SIZE)
+            if not data:
+                break
+            chunks.append(decompressor.decompress(data))
+        chunks.append(decompressor.flush())
+    except zlib.error:
+        raise FailedToDecompressContent(_("Content purported to be compressed with %s but failed to decompress.") % encoding, Response(response), "")
+    return "".join(chunks), True
+
+def _decompressContent(response, new_content, inflated=False):
     content = new_content
     try:
         encoding = response.get('content-encoding', None)
         if encoding in ['gzip', 'deflate']:
-            if encoding == 'gzip':
-                content = gzip.GzipFile(fileobj=StringIO.StringIO(new_content)).read()
-            if encoding == 'deflate':
-                content = zlib.decompress(content)
+            if not inflated:
+                decompressor = _decompressor(encoding)
+                content = decompressor.decompress(new_content) + decompressor.flush()
             response['content-length'] = str(len(content))
             # Record the historical presence of the encoding in a way the won't interfere.
             response['-content-encoding'] = response['content-encoding']
             del response['content-encoding']
-    except IOError:
+    except (IOError, zlib.error):
         content = ""
         raise FailedToDecompressContent(_("Content purported to be compressed with %s but failed to decompress.") % response.get('content-encoding'), response, content)
     return content
@@ -401,6 +437,11 @@ def _updateCache(request_headers, response_headers, content, cache, cachekey):
 
             cache.set(cachekey, text)
 
+def _recordSaved(cache, content):
+    record = getattr(cache, 'record_saved', None)
+    if record is not None:
+        record(len(content))
+
 def _cnonce():
     dig = _md5("%s:%s" % (time.ctime(), ["0123456789"[random.randrange(0, 9)] for i in range(20)])).hexdigest()
     return dig[:16]
@@ -676,6 +717,156 @@ class FileCache(object):
         if os.path.exists(cacheFullPath):
             os.remove(cacheFullPath)
 
+class _LRUStore(object):
+    """The memory and counters shared by a MemoryCache and its views."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Map key to [value, last use], where last use orders the entries.
+        self.entries = {}
+        self.bytes = 0
+        self.tick = 0
+        self.counters = {'hits': 0, 'memcache_hits': 0, 'misses': 0,
+                         'evictions': 0, 'saved_responses': 0, 'saved_bytes': 0}
+
+    def get(self, key):
+        # Must be called with the lock held.
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.tick += 1
+        entry[1] = self.tick
+        return entry[0]
+
+    def put(self, key, value):
+        # Must be called with the lock held.
+        self.pop(key)
+        if len(value) > self.max_bytes:
+            return
+        self.tick += 1
+        self.entries[key] = [value, self.tick]
+        self.bytes += len(value)
+        if self.bytes > self.max_bytes:
+            by_age = [(entry[1], k) for k, entry in self.entries.iteritems()]
+            by_age.sort()
+            for last_use, k in by_age:
+                if self.bytes <= self.max_bytes:
+                    break
+                self.pop(k)
+                self.counters['evictions'] += 1
+
+    def pop(self, key):
+        # Must be called with the lock held.
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0])
+
+class MemoryCache(object):
+    """A thread-safe LRU cache of responses held in memory.
+
+    At most max_bytes of cached responses are kept; the least recently used
+    ones are dropped to make room.  If a memcache module such as
+    google.appengine.api.memcache is given, every response is also written
+    to memcache, which serves the responses dropped from memory or cached by
+    another process.
+
+    Responses to authenticated requests for the same URL differ between
+    users, so such requests must each use a view() of the cache for their
+    user.  All views share the memory, the limit and the counters of the
+    cache they were created from.
+
+    stats() reports hits, misses, and the responses and bytes which were
+    served from the cache without downloading their body again, either
+    because they were fresh or because the server answered 304 Not Modified
+    to the If-None-Match or If-Modified-Since headers of a revalidation.
+    """
+    def __init__(self, max_bytes=4 * 1024 * 1024, memcache=None, memcache_ttl=3600):
+        self.memcache = memcache
+        self.memcache_ttl = memcache_ttl
+        self._store = _LRUStore(max_bytes)
+        self._namespace = ''
+
+    def view(self, namespace):
+        """Return a cache sharing this one's memory under its own keys."""
+        view = copy.copy(self)
+        view._namespace = self._namespace + namespace + '\0'
+        return view
+
+    def get(self, key):
+        key = self._namespace + key
+        store = self._store
+        store.lock.acquire()
+        try:
+            value = store.get(key)
+            if value is not None:
+                store.counters['hits'] += 1
+                return value
+        finally:
+            store.lock.release()
+        if self.memcache is not None:
+            value = self.memcache.get(self._memcache_key(key))
+        store.lock.acquire()
+        try:
+            if value is None:
+                store.counters['misses'] += 1
+            else:
+                store.counters['memcache_hits'] += 1
+                store.put(key, value)
+        finally:
+            store.lock.release()
+        return value
+
+    def set(self, key, value):
+        key = self._namespace + key
+        store = self._store
+        store.lock.acquire()
+        try:
+            store.put(key, value)
+        finally:
+            store.lock.release()
+        if self.memcache is not None:
+            try:
+                self.memcache.set(self._memcache_key(key), value, time=self.memcache_ttl)
+            except ValueError:
+                # too large for memcache.
+                pass
+
+    def delete(self, key):
+        key = self._namespace + key
+        store = self._store
+        store.lock.acquire()
+        try:
+            store.pop(key)
+        finally:
+            store.lock.release()
+        if self.memcache is not None:
+            self.memcache.delete(self._memcache_key(key))
+
+    def record_saved(self, size):
+        """Count a response whose body of size bytes came from the cache."""
+        store = self._store
+        store.lock.acquire()
+        try:
+            store.counters['saved_responses'] += 1
+            store.counters['saved_bytes'] += size
+        finally:
+            store.lock.release()
+
+    def stats(self):
+        """Return a dict of the counters of the cache and all its views."""
+        store = self._store
+        store.lock.acquire()
+        try:
+            stats = dict(store.counters)
+            stats['entries'] = len(store.entries)
+            stats['bytes'] = store.bytes
+            return stats
+        finally:
+            store.lock.release()
+
+    def _memcache_key(self, key):
+        return 'httplib2:' + _md5(key).hexdigest()
+
 class Credentials(object):
     def __init__(self):
         self.credentials = []
@@ -815,6 +1006,112 @@ class HTTPSConnectionWithTimeout(httplib.HTTPSConnection):
 
 
 
+class ConnectionPool(object):
+    """A thread-safe pool of keep-alive connections.
+
+    Connections are checked out for the duration of a request and checked
+    back in afterwards, so one pool can serve several threads, each with its
+    own Http object or sharing one.  Idle connections are kept per scheme and
+    authority, most recently used first, and are closed once they have been
+    idle for max_idle seconds.  At most max_per_host idle connections are
+    kept per authority and max_size in total; connections checked out beyond
+    that are closed when they are checked in.  Connections whose socket was
+    closed, for example after an error or a "Connection: close" response, are
+    discarded.
+    """
+    def __init__(self, max_size=16, max_per_host=4, max_idle=60):
+        self.max_size = max_size
+        self.max_per_host = max_per_host
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        # Map conn_key to a list of (connection, time checked in), most
+        # recently used last.
+        self._idle = {}
+        self._idle_count = 0
+        self._checkouts = 0
+        self._reused = 0
+        self._evicted = 0
+
+    def checkout(self, conn_key, factory):
+        """Return an idle connection for conn_key, or factory() if none."""
+        self._lock.acquire()
+        try:
+            self._checkouts += 1
+            self._evict_idle(time.time())
+            idle = self._idle.get(conn_key)
+            while idle:
+                conn, last_used = idle.pop()
+                self._idle_count -= 1
+                if conn.sock is not None:
+                    self._reused += 1
+                    return conn
+                self._evicted += 1
+        finally:
+            self._lock.release()
+        return factory()
+
+    def checkin(self, conn_key, conn):
+        """Return a connection to the pool after a request completed."""
+        if conn.sock is None:
+            return
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._evict_idle(now)
+            idle = self._idle.setdefault(conn_key, [])
+            if len(idle) >= self.max_per_host or self._idle_count >= self.max_size:
+                self._evicted += 1
+                conn.close()
+                return
+            idle.append((conn, now))
+            self._idle_count += 1
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Close all idle connections."""
+        self._lock.acquire()
+        try:
+            for idle in self._idle.values():
+                for conn, last_used in idle:
+                    conn.close()
+            self._idle = {}
+            self._idle_count = 0
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Return a dict of counters describing how well the pool works.
+
+        'reuse_rate' is the fraction of checkouts served by an open idle
+        connection, each of which avoided a TCP (and TLS) handshake.
+        """
+        self._lock.acquire()
+        try:
+            checkouts = self._checkouts
+            return {
+                'checkouts': checkouts,
+                'handshakes_avoided': self._reused,
+                'reuse_rate': checkouts and float(self._reused) / checkouts or 0.0,
+                'evicted': self._evicted,
+                'idle': self._idle_count,
+            }
+        finally:
+            self._lock.release()
+
+    def _evict_idle(self, now):
+        # Must be called with the lock held.
+        deadline = now - self.max_idle
+        for conn_key, idle in self._idle.items():
+            while idle and idle[0][1] < deadline:
+                conn, last_used = idle.pop(0)
+                conn.close()
+                self._idle_count -= 1
+                self._evicted += 1
+            if not idle:
+                del self._idle[conn_key]
+
+
 class Http(object):
     """An HTTP client that handles:
 - all methods
@@ -828,10 +1125,15 @@ class Http(object):
 
 and more.
     """
-    def __init__(self, cache=None, timeout=None, proxy_info=None):
+    def __init__(self, cache=None, timeout=None, proxy_info=None, pool=None):
         """
         The value of proxy_info is a ProxyInfo instance.
 
+        If 'pool' is a ConnectionPool then connections are checked out of
+        it for each request instead of being kept by this object, which
+        then may be shared by several threads as long as its cache is
+        thread-safe too.
+
         If 'cache' is a string then it is used as a directory name for
         a disk cache. Otherwise it must be an object that supports the
         same interface as FileCache.
@@ -844,6 +1146,7 @@ and more.
         self.proxy_info = proxy_info
         # Map domain name to an httplib connection
         self.connections = {}
+        self.pool = pool
         # The location of the cache, for now a directory
         # where cached responses are held.
         if cache and isinstance(cache, str):
@@ -947,13 +1250,14 @@ and more.
                     raise
             else:
                 content = ""
+                inflated = False
                 if method == "HEAD":
                     response.close()
                 else:
-                    content = response.read()
+                    content, inflated = _readContent(response)
                 response = Response(response)
                 if method != "HEAD":
-                    content = _decompressContent(response, content)
+                    content = _decompressContent(response, content, inflated)
             break
         return (response, content)
 
@@ -1029,6 +1333,18 @@ and more.
     def _normalize_headers(self, headers):
         return _normalize_headers(headers)
 
+    def _new_connection(self, scheme, authority, connection_type):
+        if not connection_type:
+            connection_type = (scheme == 'https') and HTTPSConnectionWithTimeout or HTTPConnectionWithTimeout
+        certs = list(self.certificates.iter(authority))
+        if scheme == 'https' and certs:
+            conn = connection_type(authority, key_file=certs[0][0],
+                cert_file=certs[0][1], timeout=self.timeout, proxy_info=self.proxy_info)
+        else:
+            conn = connection_type(authority, timeout=self.timeout, proxy_info=self.proxy_info)
+        conn.set_debuglevel(debuglevel)
+        return conn
+
 # Need to catch and rebrand some exceptions
 # Then need to optionally turn all exceptions into status codes
 # including all socket.* and httplib.* exceptions.
@@ -1055,6 +1371,7 @@ The return value is a tuple of (response, content), the first
 being and instance of the 'Response' class, the second being
 a string that contains the response entity body.
         """
+        conn = None
         try:
             if headers is None:
                 headers = {}
@@ -1073,18 +1390,13 @@ a string that contains the response entity body.
                 authority = domain_port[0]
 
             conn_key = scheme+":"+authority
-            if conn_key in self.connections:
+            if self.pool is not None:
+                conn = self.pool.checkout(conn_key,
+                    lambda: self._new_connection(scheme, authority, connection_type))
+            elif conn_key in self.connections:
                 conn = self.connections[conn_key]
             else:
-                if not connection_type:
-                    connection_type = (scheme == 'https') and HTTPSConnectionWithTimeout or HTTPConnectionWithTimeout
-                certs = list(self.certificates.iter(authority))
-                if scheme == 'https' and certs:
-                    conn = self.connections[conn_key] = connection_type(authority, key_file=certs[0][0],
-                        cert_file=certs[0][1], timeout=self.timeout, proxy_info=self.proxy_info)
-                else:
-                    conn = self.connections[conn_key] = connection_type(authority, timeout=self.timeout, proxy_info=self.proxy_info)
-                conn.set_debuglevel(debuglevel)
+                conn = self.connections[conn_key] = self._new_connection(scheme, authority, connection_type)
 
             if 'range' not in headers and 'accept-encoding' not in headers:
                 headers['accept-encoding'] = 'gzip, deflate'
@@ -1159,6 +1471,7 @@ a string that contains the response entity body.
                         response = Response(info)
                         if cached_value:
                             response.fromcache = True
+                            _recordSaved(self.cache, content)
                         return (response, content)
 
                     if entry_disposition == "STALE":
@@ -1186,6 +1499,7 @@ a string that contains the response entity body.
                     response = merged_response
                     response.status = 200
                     response.fromcache = True
+                    _recordSaved(self.cache, content)
 
                 elif response.status == 200:
                     content = new_content
@@ -1201,6 +1515,9 @@ a string that contains the response entity body.
                 else:
                     (response, content) = self._request(conn, authority, uri, request_uri, method, body, headers, redirections, cachekey)
         except Exception, e:
+            if self.pool is not None and conn is not None:
+                # the connection may be in the middle of a response.
+                conn.close()
             if self.force_exception_to_status_code:
                 if isinstance(e, HttpLib2ErrorWithResponse):
                     response = e.response
@@ -1225,7 +1542,9 @@ a string that contains the response entity body.
                     response.reason = "Bad Request"
             else:
                 raise
-
+        finally:
+            if self.pool is not None and conn is not None:
+                self.pool.checkin(conn_key, conn)
 
         return (response, content)
 
@@ -31,8 +31,60 @@ class Snapshot(db.Model):
   user = db.UserProperty()
   type = db.StringProperty(choices=("import", "export"))
   timestamp = db.DateTimeProperty(auto_now_add=True)
-  status = db.StringProperty(choices=("building", "completed", "error"))
+  status = db.StringProperty(choices=("building", "completed", "error",
+                                      "deleting"))
   errorMessage = db.StringProperty()
+  # "packed" snapshots store their tasks with packedstore instead of as Task
+  # entities.
+  storage = db.StringProperty(choices=("entities", "packed"),
+                              default="entities")
+  # Totals of a completed snapshot, so that listing snapshots does not need to
+  # read their contents.  byteSize is the size of the tasks stored under the
+  # snapshot itself, which leaves out the tasks of its bases.
+  tasklistCount = db.IntegerProperty()
+  taskCount = db.IntegerProperty()
+  byteSize = db.IntegerProperty()
+  # An incremental snapshot only stores the tasks changed since baseSnapshot.
+  # deltaDepth is the number of snapshots in its chain of bases.
+  baseSnapshot = db.SelfReferenceProperty(collection_name="deltas")
+  deltaDepth = db.IntegerProperty(default=0)
+  # Progress of a snapshot being built, so that a retried task resumes from it:
+  # the index of the first tasklist whose tasks are not all stored, the page
+  # token of its first page not stored, and the number of tasks stored so far.
+  checkpointTasklist = db.IntegerProperty()
+  checkpointPageToken = db.StringProperty()
+  checkpointTasks = db.IntegerProperty(default=0)
+
+
+class SnapshotShard(db.Model):
+  """One shard of the completion counter of a fanned-out Snapshot.
+
+  The key name is "<snapshot id>-<shard number>".  The shards are root entities
+  so that tasks finishing at the same time do not contend for one entity group.
+  taskCount and byteSize are the totals of the tasks stored for tasklists.
+  """
+  tasklists = db.StringListProperty()
+  taskCount = db.IntegerProperty(default=0)
+  byteSize = db.IntegerProperty(default=0)
+
+
+class PackedTaskList(db.Model):
+  """Describes the packed tasks of one tasklist of a packed Snapshot.
+
+  The key name is the id of the tasklist.  See packedstore for the format.
+  """
+  version = db.IntegerProperty()
+  count = db.IntegerProperty()
+  chunks = db.IntegerProperty()
+  size = db.IntegerProperty()
+
+
+class PackedChunk(db.Model):
+  """A piece of the packed tasks of a tasklist of a packed Snapshot.
+
+  The key name is "<tasklist id>-<position of the chunk in the stream>".
+  """
+  data = db.BlobProperty()
 
 
 class TaskList(db.Model):
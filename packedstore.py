@@ -0,0 +1,264 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Packed storage of the tasks of a snapshot.
+
+A packed snapshot stores the tasks of each tasklist as one zlib compressed
+stream instead of one Task entity per task.  The stream is a header line
+holding {"version": FORMAT_VERSION} followed by one line per task holding the
+task as returned by the Tasks API, all encoded as JSON.  The stream is split
+into PackedChunk entities small enough for the datastore and described by a
+PackedTaskList entity, so that a tasklist is written, read or deleted with a
+few datastore operations whatever its number of tasks.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import zlib
+
+from apiclient.anyjson import simplejson
+
+from google.appengine.ext import db
+
+from common import apiparse
+import model
+
+# Version of the layout of the stream written by Writer.
+FORMAT_VERSION = 1
+
+# Maximum number of compressed bytes stored in one PackedChunk entity.
+CHUNK_SIZE = 900 * 1024
+
+
+class Writer(object):
+  """Packs the tasks of one tasklist of a snapshot."""
+
+  def __init__(self, snapshot, tasklist):
+    """Creates a new Writer object.
+
+    Args:
+      snapshot: the Snapshot entity the tasks are stored under.
+      tasklist: the TaskList entity whose tasks are packed.
+    """
+    self.snapshot = snapshot
+    self.tasklist = tasklist
+    self.count = 0
+    self._compressor = zlib.compressobj()
+    self._data = self._compressor.compress(
+        simplejson.dumps({"version": FORMAT_VERSION}) + "\n")
+    self._chunks = []
+
+  def Add(self, record):
+    """Appends a task to the stream.
+
+    Args:
+      record: a Python dict representing a single task, as returned by the
+        Tasks API.
+    """
+    line = simplejson.dumps(record, separators=(",", ":")) + "\n"
+    self._data += self._compressor.compress(line)
+    self.count += 1
+    self._Split()
+
+  def _Split(self):
+    """Moves every full chunk of the compressed data into self._chunks."""
+    while len(self._data) >= CHUNK_SIZE:
+      self._chunks.append(self._data[:CHUNK_SIZE])
+      self._data = self._data[CHUNK_SIZE:]
+
+  def Close(self):
+    """Writes the stream to the datastore.
+
+    Chunks left over from an earlier attempt to pack the same tasklist are
+    ignored by readers because the header only counts the chunks written now.
+
+    Returns:
+      The PackedTaskList entity describing the stream.
+    """
+    # the compressor holds back most of its output until it is flushed.
+    self._data += self._compressor.flush()
+    self._Split()
+    self._chunks.append(self._data)
+    self._data = ""
+    size = 0
+    tasklist_id = self.tasklist.key().name()
+    for i, data in enumerate(self._chunks):
+      # each chunk is put on its own since a batch put is limited in size.
+      model.PackedChunk(key=_ChunkKey(self.snapshot.key(), tasklist_id, i),
+                        data=db.Blob(data)).put()
+      size += len(data)
+    header = model.PackedTaskList(parent=self.snapshot, key_name=tasklist_id,
+                                  version=FORMAT_VERSION, count=self.count,
+                                  chunks=len(self._chunks), size=size)
+    header.put()
+    return header
+
+
+class Packer(apiparse.Parser):
+  """Parser which packs pages of tasks instead of storing Task entities.
+
+  Only token-based paging is supported.  The stream is written once the last
+  page has been parsed, so the checkpoint function is only called then.
+  """
+
+  def __init__(self, snapshot, parent_entity, method, **args):
+    """Creates a new Packer object.
+
+    Args:
+      snapshot: the Snapshot entity the tasks are stored under.
+      parent_entity: the TaskList entity whose tasks are packed.  It is not
+        called tasklist since args holds the tasklist parameter of the
+        requests.
+      method: the method which is called to invoke the API.
+      args: keyword parameters as for apiparse.Parser.
+    """
+    apiparse.Parser.__init__(self, model.Task, parent_entity, snapshot, method,
+                             model, **args)
+    self.writer = Writer(snapshot, parent_entity)
+
+  def ParseAndStore(self, api_data):
+    """Packs all pages of tasks, starting with api_data.
+
+    Args:
+      api_data: a Python dict returned by the Tasks API.
+
+    Returns:
+      An empty list, since no entities are created.
+    """
+    for page in self.Pages(api_data):
+      self.ParsePage(page)
+    return []
+
+  def ParsePage(self, api_data):
+    """Packs a single page of tasks, writing the stream after the last page.
+
+    Args:
+      api_data: a Python dict returned by the Tasks API.
+
+    Returns:
+      An empty list, since no entities are created.
+    """
+    for item in apiparse.Parser._Items(api_data):
+      self.writer.Add(item)
+    if "nextPageToken" not in api_data:
+      header = self.writer.Close()
+      self.entities_written += header.count
+      self.bytes_written += header.size
+      if self.checkpoint is not None:
+        self.checkpoint(api_data, header.count, header.size)
+    return []
+
+
+class _Unpacker(apiparse.Parser):
+  """Parser which converts packed tasks into unsaved Task entities."""
+
+  def __init__(self, snapshot, tasklist):
+    apiparse.Parser.__init__(self, model.Task, tasklist, snapshot, None, model)
+    self.entities = []
+
+  def Store(self, entity):
+    self.entities.append(entity)
+
+
+def LoadHeaders(snapshot):
+  """Returns the PackedTaskList entities of a snapshot keyed by tasklist id."""
+  headers = {}
+  for header in model.PackedTaskList.gql("WHERE ANCESTOR IS :id",
+                                         id=snapshot.key()):
+    headers[header.key().name()] = header
+  return headers
+
+
+def ReadRecords(header):
+  """Reads the tasks of a packed tasklist.
+
+  The chunks are fetched one at a time and decompressed as the records are
+  consumed, so that at most one chunk of the stream is held in memory.
+
+  Args:
+    header: the PackedTaskList entity of the tasklist.
+
+  Raises:
+    ValueError: if the stream is incomplete or has an unknown version.
+
+  Yields:
+    A Python dict for each task, as returned by the Tasks API.
+  """
+  lines = _Lines(_Chunks(header))
+  try:
+    version = simplejson.loads(lines.next())["version"]
+  except StopIteration:
+    raise ValueError("Packed tasklist %s is empty." % header.key().name())
+  if version != FORMAT_VERSION:
+    raise ValueError("Unknown packed format version: %s" % version)
+  for line in lines:
+    yield simplejson.loads(line)
+
+
+def LoadTasks(snapshot, tasklist, header):
+  """Returns the tasks of a packed tasklist as unsaved Task entities.
+
+  Args:
+    snapshot: the Snapshot entity the tasks are stored under.
+    tasklist: the TaskList entity of the tasklist.
+    header: the PackedTaskList entity of the tasklist.
+
+  Returns:
+    A list of Task entities, in the order they were packed.
+  """
+  unpacker = _Unpacker(snapshot, tasklist)
+  for record in ReadRecords(header):
+    unpacker.ParseItem(record, model.Task, tasklist)
+  return unpacker.entities
+
+
+def Delete(snapshot):
+  """Deletes the packed tasks of a snapshot."""
+  for kind in (model.PackedTaskList, model.PackedChunk):
+    keys = db.Query(kind, keys_only=True).ancestor(snapshot).fetch(1000)
+    while keys:
+      db.delete(keys)
+      keys = db.Query(kind, keys_only=True).ancestor(snapshot).fetch(1000)
+
+
+def _ChunkKey(snapshot_key, tasklist_id, sequence):
+  """Returns the key of a chunk of the stream of a tasklist."""
+  return db.Key.from_path(model.PackedChunk.kind(),
+                          "%s-%d" % (tasklist_id, sequence),
+                          parent=snapshot_key)
+
+
+def _Chunks(header):
+  """Fetches the chunks of the stream of a tasklist as they are needed."""
+  for i in range(header.chunks):
+    yield db.get(_ChunkKey(header.parent_key(), header.key().name(), i))
+
+
+def _Lines(chunks):
+  """Decompresses a stream chunk by chunk and yields its lines."""
+  decompressor = zlib.decompressobj()
+  buffered = ""
+  for chunk in chunks:
+    if chunk is None:
+      raise ValueError("A chunk of a packed tasklist is missing.")
+    buffered += decompressor.decompress(chunk.data)
+    lines = buffered.split("\n")
+    buffered = lines.pop()
+    for line in lines:
+      yield line
+  buffered += decompressor.flush()
+  if buffered:
+    yield buffered
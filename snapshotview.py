@@ -0,0 +1,226 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Logical view of the tasks in a snapshot.
+
+An incremental snapshot only stores the tasks which changed since its base
+snapshot, and a packed snapshot stores its tasks in compressed streams.  This
+module merges a snapshot with its chain of bases or unpacks it so that the
+templates see every task of the snapshot, however it was stored.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+from google.appengine.ext import db
+
+from common import apiparse
+import model
+import packedstore
+
+
+class TaskListView(object):
+  """A tasklist of a snapshot together with all of its tasks."""
+
+  def __init__(self, tasklist):
+    """Creates a new TaskListView object.
+
+    Args:
+      tasklist: the TaskList entity of the snapshot.
+    """
+    self.tasklist = tasklist
+    self.tasks = TaskCollection()
+
+  def __getattr__(self, name):
+    return getattr(self.tasklist, name)
+
+
+class TaskView(object):
+  """A task of a snapshot, linked to its parent and children in the view."""
+
+  def __init__(self, task):
+    """Creates a new TaskView object.
+
+    Args:
+      task: the Task entity holding the latest version of the task.
+    """
+    self.task = task
+    self.parent_ = None
+    self.children = []
+
+  def __getattr__(self, name):
+    return getattr(self.task, name)
+
+
+class TaskCollection(object):
+  """The tasks of a TaskListView.
+
+  Supports iteration and count() like the tasks query of a TaskList entity.
+  """
+
+  def __init__(self):
+    self._tasks = []
+
+  def __iter__(self):
+    return iter(self._tasks)
+
+  def __len__(self):
+    return len(self._tasks)
+
+  def count(self):
+    return len(self._tasks)
+
+  def append(self, task):
+    self._tasks.append(task)
+
+
+def LoadTaskLists(snapshot):
+  """Loads the logical contents of a snapshot.
+
+  Args:
+    snapshot: the Snapshot entity to load.
+
+  Returns:
+    A list of TaskListView objects, one per tasklist in the snapshot.
+  """
+  views = []
+  views_by_id = {}
+  for tasklist in model.TaskList.gql("WHERE ANCESTOR IS :id",
+                                     id=snapshot.key()):
+    view = TaskListView(tasklist)
+    views.append(view)
+    views_by_id[tasklist.key().name()] = view
+
+  if snapshot.storage == "packed":
+    latest = _PackedTasks(snapshot, views)
+  else:
+    latest = _LatestTasks(snapshot)
+
+  task_views = {}
+  for name, task in sorted(latest.items()):
+    tasklist_key = model.Task.parent_entity.get_value_for_datastore(task)
+    if tasklist_key is None or tasklist_key.name() not in views_by_id:
+      continue
+    task_view = TaskView(task)
+    task_views[name] = task_view
+    views_by_id[tasklist_key.name()].tasks.append(task_view)
+
+  for task_view in task_views.itervalues():
+    parent_key = model.Task.parent_.get_value_for_datastore(task_view.task)
+    if parent_key is not None and parent_key.name() in task_views:
+      task_view.parent_ = task_views[parent_key.name()]
+      task_view.parent_.children.append(task_view)
+  return views
+
+
+def CountTasks(snapshot):
+  """Counts the tasks of a snapshot without loading them.
+
+  Packed snapshots are counted from their headers, other snapshots with keys
+  only queries over their chain of bases.
+
+  Args:
+    snapshot: the Snapshot entity to count.
+
+  Returns:
+    The number of tasks which LoadTaskLists would return.
+  """
+  if snapshot.storage == "packed":
+    return sum([header.count for header in
+                packedstore.LoadHeaders(snapshot).itervalues()])
+  names = set()
+  for snapshot in reversed(_Chain(snapshot)):
+    query = db.Query(model.Task, keys_only=True).ancestor(snapshot)
+    names.update([_Name(key) for key in query])
+    query = db.Query(model.Task, keys_only=True).ancestor(snapshot)
+    names.difference_update([_Name(key) for key in
+                             query.filter("deleted =", True)])
+  return len(names)
+
+
+def Measure(snapshot):
+  """Computes the totals of a snapshot stored before Snapshot had them.
+
+  Args:
+    snapshot: the Snapshot entity to measure.
+
+  Returns:
+    A (task count, tasklist count, byte size) tuple for the taskCount,
+    tasklistCount and byteSize properties of snapshot.
+  """
+  tasklist_count = db.Query(model.TaskList,
+                            keys_only=True).ancestor(snapshot).count(None)
+  if snapshot.storage == "packed":
+    byte_size = sum([header.size for header in
+                     packedstore.LoadHeaders(snapshot).itervalues()])
+  else:
+    byte_size = sum([apiparse.EncodedSize(task) for task in
+                     model.Task.gql("WHERE ANCESTOR IS :id",
+                                    id=snapshot.key())])
+  return CountTasks(snapshot), tasklist_count, byte_size
+
+
+def _PackedTasks(snapshot, views):
+  """Returns the tasks of a packed snapshot.
+
+  Args:
+    snapshot: the Snapshot entity to load.
+    views: the TaskListView objects of the snapshot.
+
+  Returns:
+    A dict from task id to an unsaved Task entity.
+  """
+  headers = packedstore.LoadHeaders(snapshot)
+  tasks = {}
+  for view in views:
+    header = headers.get(view.tasklist.key().name())
+    if header is None:
+      continue
+    for task in packedstore.LoadTasks(snapshot, view.tasklist, header):
+      tasks[task.key().name()] = task
+  return tasks
+
+
+def _LatestTasks(snapshot):
+  """Returns the latest version of every task which has not been deleted.
+
+  Args:
+    snapshot: the Snapshot entity to load.
+
+  Returns:
+    A dict from task key name to the Task entity holding its latest version.
+  """
+  tasks = {}
+  for snapshot in reversed(_Chain(snapshot)):
+    for task in model.Task.gql("WHERE ANCESTOR IS :id", id=snapshot.key()):
+      tasks[_Name(task.key())] = task
+  for name, task in tasks.items():
+    if task.deleted:
+      del tasks[name]
+  return tasks
+
+
+def _Chain(snapshot):
+  """Returns snapshot followed by its chain of bases."""
+  chain = []
+  while snapshot is not None:
+    chain.append(snapshot)
+    snapshot = snapshot.baseSnapshot
+  return chain
+
+
+def _Name(key):
+  """Returns the name identifying a task across a chain of snapshots."""
+  return key.name() or str(key)
@@ -23,7 +23,6 @@ import os
 import pickle
 import urllib
 
-from apiclient import discovery
 from apiclient.oauth2client import appengine
 from apiclient.oauth2client import client
 
@@ -35,10 +34,19 @@ from google.appengine.ext import webapp
 from google.appengine.ext.webapp import template
 from google.appengine.ext.webapp import util
 
-import httplib2
-
+from common import credcache
+from common import lazyimport
+from common import responsecache
 import model
 import settings
+import snapshotview
+
+# discovery is only needed when credentials have to be checked against the API.
+discovery = lazyimport.LazyModule("apiclient.discovery")
+
+# Whether the Tasks API is built from the bundled discovery document, as in
+# worker.OFFLINE_DISCOVERY.
+OFFLINE_DISCOVERY = getattr(settings, "OFFLINE_DISCOVERY", False)
 
 
 def _RedirectForOAuth(self, user):
@@ -59,22 +67,26 @@ def _RedirectForOAuth(self, user):
 
 def _GetCredentials():
   user = users.get_current_user()
-  credentials = appengine.StorageByKeyName(
+  credentials = appengine.CachedStorageByKeyName(
       model.Credentials, user.user_id(), "credentials").get()
 
   # so it turns out that the method that checks if the credentials are okay
   # doesn't give the correct answer unless you try to refresh it.  So we do that
   # here in order to make sure that the credentials are valid before being
   # passed to a worker.  Obviously if the user revokes the credentials after
-  # this point we will continue to get an error, but we can't stop that.
+  # this point we will continue to get an error, but we can't stop that.  The
+  # result is cached for a few minutes so that not every page view pays for it.
 
-  if credentials and not credentials.invalid:
+  if (credentials and not credentials.invalid and
+      not credcache.IsValid(user.user_id())):
     try:
-      http = httplib2.Http()
+      http = responsecache.Http(user)
       http = credentials.authorize(http)
-      service = discovery.build("tasks", "v1", http)
+      service = discovery.build("tasks", "v1", http,
+                                offline=OFFLINE_DISCOVERY)
       tasklists = service.tasklists()
       tasklists_list = tasklists.list().execute()
+      credcache.MarkValid(user.user_id(), credentials)
     except:
       credentials = None
 
@@ -124,26 +136,15 @@ class ListHandler(webapp.RequestHandler):
       _RedirectForOAuth(self, user)
     else:
       path = os.path.join(os.path.dirname(__file__), "snapshots.html")
-      snapshots = model.Snapshot.gql("WHERE user = :user and type = 'export'",
-                                     user=user)
+      snapshots = list(model.Snapshot.gql("WHERE user = :user "
+                                          "and type = 'export'", user=user))
 
-      counts = []
       refresh = False
-
       for snapshot in snapshots:
-        tasklists = model.TaskList.gql("WHERE ANCESTOR IS :id",
-                                       id=snapshot.key())
-        task_count = 0
-        tasklist_count = 0
         if snapshot.status == "building":
           refresh = True
-        for tasklist in tasklists:
-          task_count += tasklist.tasks.count()
-          tasklist_count += 1
-
-        counts.append((snapshot, task_count, tasklist_count))
 
-      template_values = {"snapshots": counts,
+      template_values = {"snapshots": snapshots,
                          "msg": self.request.get("msg"),
                          "refresh": refresh,
                          "logout_url": users.create_logout_url("/snapshots")}
@@ -207,6 +208,10 @@ class DeleteHandler(webapp.RequestHandler):
         self.redirect(url + "?msg=DELETE_BUILDING")
         return
 
+      # hides the snapshot and stops it from becoming the base of a new
+      # incremental snapshot.
+      snapshot.status = "deleting"
+      snapshot.put()
       taskqueue.add(url="/worker/delete",
                     params={"id": snapshot.key().id()})
       self.redirect(url + "?msg=SNAPSHOT_DELETING")
@@ -235,9 +240,7 @@ class DownloadHandler(webapp.RequestHandler):
                                     "AND __key__ = KEY('Snapshot', :key)",
                                     user=user,
                                     key=int(self.request.get("id"))).get()
-      tasklist_entities = model.TaskList.gql("WHERE ANCESTOR IS :id",
-                                             id=snapshot.key())
-      template_values = {"tasklists": list(tasklist_entities),
+      template_values = {"tasklists": snapshotview.LoadTaskLists(snapshot),
                          "now": snapshot.timestamp}
 
       if self.request.get("format") == "ics":
@@ -381,10 +384,7 @@ class SendMailHandler(webapp.RequestHandler):
                                     "AND __key__ = KEY('Snapshot', :key)",
                                     user=user,
                                     key=int(self.request.get("id"))).get()
-      tasklist_entities = model.TaskList.gql("WHERE ANCESTOR IS :id",
-                                             id=snapshot.key())
-
-      template_values = {"tasklists": list(tasklist_entities),
+      template_values = {"tasklists": snapshotview.LoadTaskLists(snapshot),
                          "now": snapshot.timestamp}
 
       email_body = self.GenerateEmailBody(template_values)
@@ -418,7 +418,8 @@ class OAuthHandler(webapp.RequestHandler):
       except client.FlowExchangeError, e:
         credentials = None
         error = True
-      appengine.StorageByKeyName(
+      credcache.Invalidate(user.user_id())
+      appengine.CachedStorageByKeyName(
           model.Credentials, user.user_id(), "credentials").put(credentials)
       if error:
         self.redirect("/?msg=ACCOUNT_ERROR")
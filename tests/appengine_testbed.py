@@ -0,0 +1,84 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs tests of the app against the service stubs of the App Engine SDK.
+
+Importing this module puts the SDK and the app on sys.path, so it has to be
+imported before the modules of the app.  The SDK is looked for in the
+directory named by the APPENGINE_SDK environment variable:
+
+  APPENGINE_SDK=$HOME/google_appengine python tests/test_packedstore.py
+
+unittest.SkipTest is raised if the SDK is not found.
+"""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import sys
+import types
+import unittest
+
+SDK = os.environ.get("APPENGINE_SDK", "/usr/local/google_appengine")
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if not os.path.exists(os.path.join(SDK, "dev_appserver.py")):
+  raise unittest.SkipTest("App Engine SDK not found in %s; set APPENGINE_SDK."
+                          % SDK)
+
+sys.path.insert(0, SDK)
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, APP_ROOT)
+
+# appengine_config only selects the Django version of the production runtime,
+# with a module which newer SDKs do not have.
+sys.modules.setdefault("appengine_config", None)
+
+try:
+  import settings
+except ImportError:
+  # the OAuth client of the app is never used by the tests.
+  settings = types.ModuleType("settings")
+  settings.CLIENT_ID = "test"
+  settings.CLIENT_SECRET = "test"
+  sys.modules["settings"] = settings
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import testbed
+
+
+class TestCase(unittest.TestCase):
+  """Runs each test with fresh datastore, memcache and task queue stubs.
+
+  The datastore is strongly consistent, so that queries see every write at
+  once as they would within an entity group.
+  """
+
+  def setUp(self):
+    self.testbed = testbed.Testbed()
+    self.testbed.activate()
+    self.testbed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    self.testbed.init_memcache_stub()
+    self.testbed.init_taskqueue_stub(root_path=APP_ROOT)
+    self.testbed.init_user_stub()
+    self.taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+
+  def tearDown(self):
+    self.testbed.deactivate()
@@ -0,0 +1,79 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for common.apifetch, driven by HttpMockSequence."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apiclient import errors
+from apiclient import http
+from apiclient import model
+from common import apifetch
+
+
+def _Request(mock, uri):
+  """Returns an HttpRequest for uri which is answered by mock."""
+  return http.HttpRequest(mock, model.JsonModel().response, uri)
+
+
+class FetcherTest(unittest.TestCase):
+
+  def testRunYieldsEveryResultWithItsTag(self):
+    mock = http.HttpMockSequence([
+        ({"status": "200"}, '{"items": [1]}'),
+        ({"status": "200"}, '{"items": [2]}'),
+        ({"status": "200"}, '{"items": [3]}'),
+        ])
+    fetcher = apifetch.Fetcher(max_parallel=2)
+    for tag in ("a", "b", "c"):
+      fetcher.Add(_Request(mock, "http://example.com/" + tag), tag)
+    self.assertEqual([("a", {"items": [1]}), ("b", {"items": [2]}),
+                      ("c", {"items": [3]})], list(fetcher.Run()))
+
+  def testAddWhileRunning(self):
+    mock = http.HttpMockSequence([
+        ({"status": "200"}, '{"nextPageToken": "t"}'),
+        ({"status": "200"}, '{}'),
+        ])
+    fetcher = apifetch.Fetcher()
+    fetcher.Add(_Request(mock, "http://example.com/1"), 1)
+    results = []
+    for tag, api_data in fetcher.Run():
+      results.append(tag)
+      if "nextPageToken" in api_data:
+        fetcher.Add(_Request(mock, "http://example.com/2"), 2)
+    self.assertEqual([1, 2], results)
+
+  def testStart(self):
+    mock = http.HttpMockSequence([({"status": "200"}, '{"id": "x"}')])
+    pending = apifetch.Fetcher().Start(_Request(mock, "http://example.com/"))
+    self.assertEqual({"id": "x"}, pending.GetResult())
+
+  def testErrorsPropagate(self):
+    mock = http.HttpMockSequence([({"status": "404"}, "Not found")])
+    fetcher = apifetch.Fetcher()
+    fetcher.Add(_Request(mock, "http://example.com/"), None)
+    self.assertRaises(errors.HttpError, list, fetcher.Run())
+
+
+if __name__ == "__main__":
+  unittest.main()
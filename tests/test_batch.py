@@ -0,0 +1,193 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for apiclient.http.BatchHttpRequest against a fake batch endpoint."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import email.parser
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2
+
+from apiclient import errors
+from apiclient import http
+from apiclient import model
+
+
+class FakeBatchEndpoint(object):
+  """Answers batch requests the way the /batch endpoint of the APIs does.
+
+  Attributes:
+    answers: dict from the path of a request to a list of (status, content)
+      or (status, content, headers) tuples, of which the first is used and
+      removed on each request.
+    batches: list of the lists of paths sent in each batch request.
+  """
+
+  def __init__(self, answers, status="200"):
+    self.answers = answers
+    self.status = status
+    self.batches = []
+
+  def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+    if self.status != "200":
+      return httplib2.Response({"status": self.status}), "Unavailable"
+    parser = email.parser.FeedParser()
+    parser.feed("content-type: %s\r\n\r\n" % headers["content-type"])
+    parser.feed(body)
+    paths = []
+    parts = []
+    for part in parser.close().get_payload():
+      path = part.get_payload().split(" ")[1]
+      paths.append(path)
+      answer = self.answers[path].pop(0)
+      status, content = answer[:2]
+      headers = "".join(["%s: %s\r\n" % header
+                         for header in answer[2:] and answer[2].items()])
+      parts.append("--batch_boundary\r\n"
+                   "Content-Type: application/http\r\n"
+                   "Content-ID: <response-%s\r\n\r\n"
+                   "HTTP/1.1 %d Status\r\n"
+                   "Content-Type: application/json\r\n%s\r\n"
+                   "%s\r\n" % (part["Content-ID"][1:], status, headers,
+                                content))
+    self.batches.append(paths)
+    resp = httplib2.Response({
+        "status": "200",
+        "content-type": "multipart/mixed; boundary=batch_boundary"})
+    return resp, "".join(parts) + "--batch_boundary--\r\n"
+
+
+def _Request(endpoint, path, method="GET"):
+  """Returns an HttpRequest for path which is sent through endpoint."""
+  return http.HttpRequest(endpoint, model.JsonModel().response,
+                          "https://www.googleapis.com" + path, method=method)
+
+
+class BatchHttpRequestTest(unittest.TestCase):
+
+  def setUp(self):
+    self.results = []
+    self.sleeps = []
+    self.policy = http.RetryPolicy(jitter=0, sleep=self.sleeps.append)
+
+  def Callback(self, request_id, response, exception):
+    self.results.append((request_id, response, exception))
+
+  def testResponsesReachCallbacksInOrder(self):
+    endpoint = FakeBatchEndpoint({"/a": [(200, '{"id": "a"}')],
+                                  "/b": [(200, '{"id": "b"}')]})
+    batch = http.BatchHttpRequest(callback=self.Callback)
+    batch.add(_Request(endpoint, "/a"))
+    batch.add(_Request(endpoint, "/b"), request_id="second")
+    batch.execute()
+    self.assertEqual([("1", {"id": "a"}, None), ("second", {"id": "b"}, None)],
+                     self.results)
+    self.assertEqual([["/a", "/b"]], endpoint.batches)
+
+  def testFailedPartIsReportedToItsCallback(self):
+    endpoint = FakeBatchEndpoint({"/a": [(404, "{}")],
+                                  "/b": [(200, '{"id": "b"}')]})
+    own = []
+    batch = http.BatchHttpRequest(callback=self.Callback)
+    batch.add(_Request(endpoint, "/a"),
+              callback=lambda *args: own.append(args))
+    batch.add(_Request(endpoint, "/b"))
+    batch.execute()
+    self.assertEqual(1, len(own))
+    self.assertEqual(None, own[0][1])
+    self.assertTrue(isinstance(own[0][2], errors.HttpError))
+    self.assertEqual([("2", {"id": "b"}, None)], self.results)
+
+  def testServerErrorsAreSentAgain(self):
+    endpoint = FakeBatchEndpoint({"/a": [(503, "{}"), (200, '{"id": "a"}')],
+                                  "/b": [(200, '{"id": "b"}')]})
+    batch = http.BatchHttpRequest(callback=self.Callback,
+                                  retry_policy=self.policy)
+    batch.add(_Request(endpoint, "/a"))
+    batch.add(_Request(endpoint, "/b"))
+    batch.execute()
+    self.assertEqual([["/a", "/b"], ["/a"]], endpoint.batches)
+    self.assertEqual([("1", {"id": "a"}, None), ("2", {"id": "b"}, None)],
+                     self.results)
+
+  def testRetriesWaitWithBackoff(self):
+    endpoint = FakeBatchEndpoint({"/a": [(503, "{}"), (503, "{}"),
+                                         (200, '{"id": "a"}')],
+                                  "/b": [(500, "{}"), (200, '{"id": "b"}')]})
+    batch = http.BatchHttpRequest(callback=self.Callback,
+                                  retry_policy=self.policy)
+    batch.add(_Request(endpoint, "/a"))
+    batch.add(_Request(endpoint, "/b"))
+    batch.execute()
+    # one wait per batch request, however many parts it sends again.
+    self.assertEqual([0.5, 1.0], self.sleeps)
+    self.assertEqual([["/a", "/b"], ["/a", "/b"], ["/a"]], endpoint.batches)
+    self.assertEqual(2, self.policy.counters["status_503"])
+
+  def testRetryAfterOfAPartIsHonoured(self):
+    endpoint = FakeBatchEndpoint({
+        "/a": [(503, "{}"), (200, '{"id": "a"}')],
+        "/b": [(429, "{}", {"Retry-After": "7"}), (200, '{"id": "b"}')]})
+    batch = http.BatchHttpRequest(callback=self.Callback,
+                                  retry_policy=self.policy)
+    batch.add(_Request(endpoint, "/a"))
+    batch.add(_Request(endpoint, "/b", method="POST"))
+    batch.execute()
+    self.assertEqual([7], self.sleeps)
+    self.assertEqual([("1", {"id": "a"}, None), ("2", {"id": "b"}, None)],
+                     self.results)
+
+  def testPolicyOfTheRequestsBoundsRetries(self):
+    policy = http.RetryPolicy(budget=1, sleep=self.sleeps.append)
+    endpoint = FakeBatchEndpoint({"/a": [(503, "{}"), (503, "{}")],
+                                  "/b": [(503, "{}")]})
+    batch = http.BatchHttpRequest(callback=self.Callback)
+    for path in ("/a", "/b"):
+      request = _Request(endpoint, path)
+      request.retry_policy = policy
+      batch.add(request)
+    batch.execute()
+    self.assertEqual(1, len(self.sleeps))
+    self.assertEqual(2, policy.counters["budget_exhausted"])
+    self.assertEqual([["/a", "/b"], ["/a"]], endpoint.batches)
+    self.assertEqual(["1", "2"], [result[0] for result in self.results])
+    self.assertTrue(isinstance(self.results[0][2], errors.HttpError))
+
+  def testPostIsNotSentAgainOnServerErrors(self):
+    endpoint = FakeBatchEndpoint({"/a": [(503, "{}")]})
+    batch = http.BatchHttpRequest(callback=self.Callback,
+                                  retry_policy=self.policy)
+    batch.add(_Request(endpoint, "/a", method="POST"))
+    batch.execute()
+    self.assertEqual([], self.sleeps)
+    self.assertEqual([["/a"]], endpoint.batches)
+
+  def testFailedBatchRaises(self):
+    endpoint = FakeBatchEndpoint({}, status="503")
+    batch = http.BatchHttpRequest(callback=self.Callback)
+    batch.add(_Request(endpoint, "/a"))
+    self.assertRaises(errors.HttpError, batch.execute)
+    self.assertEqual([], self.results)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,212 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for resuming a snapshot from its checkpoint after a crash."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import appengine_testbed
+
+import model
+import packedstore
+import worker
+from common import apiparse
+
+# The pages of the tasks of each tasklist: list1 has three pages, whose page
+# tokens are "p2" and "p3".
+PAGES = {"list0": 2, "list1": 3, "list2": 1, "list3": 2}
+TASKS_PER_PAGE = 3
+
+
+class _Crash(Exception):
+  pass
+
+
+class _FakeRequest(object):
+  """Stands in for the HttpRequest of a page of tasks."""
+
+  def __init__(self, tasks, args):
+    self.tasks = tasks
+    self.args = args
+    self.http = None
+
+  def execute(self, http=None):
+    return self.tasks.Page(self.args)
+
+
+class _FakeTasks(object):
+  """Stands in for the tasks resource, crashing on one page.
+
+  Every task has the same encoded size, so that the sampled sizes counted by
+  the parsers are exact.
+  """
+
+  def __init__(self, crash_at=None):
+    self.crash_at = crash_at
+    self.fetched = []
+
+  def tasks(self):
+    return self
+
+  def list(self, **args):
+    return _FakeRequest(self, args)
+
+  def Page(self, args):
+    tasklist = args["tasklist"]
+    page = int(args.get("pageToken", "p1")[1:])
+    if (tasklist, page) == self.crash_at:
+      raise _Crash()
+    self.fetched.append((tasklist, page))
+    items = []
+    for i in range(TASKS_PER_PAGE):
+      task_id = "%s-%d-%d" % (tasklist, page, i)
+      items.append({"kind": "tasks#task", "id": task_id,
+                    "title": "Task " + task_id, "status": "needsAction"})
+    result = {"items": items}
+    if page < PAGES[tasklist]:
+      result["nextPageToken"] = "p%d" % (page + 1)
+    return result
+
+
+class CheckpointTest(appengine_testbed.TestCase):
+
+  def setUp(self):
+    appengine_testbed.TestCase.setUp(self)
+    self.saved = (worker.PREFETCH_PAGES, worker.FIRST_PAGE_BATCH_SIZE)
+    worker.PREFETCH_PAGES = 0
+    worker.FIRST_PAGE_BATCH_SIZE = 1
+    self.snapshot = model.Snapshot(type="export", status="building",
+                                   checkpointTasklist=0, checkpointTasks=0,
+                                   byteSize=0)
+    self.snapshot.put()
+    self.tasklists = []
+    for tasklist_id in sorted(PAGES):
+      self.tasklists.append(model.TaskList(parent=self.snapshot,
+                                           key_name=tasklist_id,
+                                           id=tasklist_id))
+      self.tasklists[-1].put()
+
+  def tearDown(self):
+    worker.PREFETCH_PAGES, worker.FIRST_PAGE_BATCH_SIZE = self.saved
+    appengine_testbed.TestCase.tearDown(self)
+
+  def Store(self, method, service):
+    """Stores the tasks from the checkpoint of the stored snapshot."""
+    snapshot = model.Snapshot.get(self.snapshot.key())
+    method(worker.SnapshotWorker(), service, None, snapshot, self.tasklists,
+           {})
+    return model.Snapshot.get(self.snapshot.key())
+
+  def TaskSize(self):
+    task = model.Task.all().ancestor(self.snapshot).get()
+    return apiparse.EncodedSize(task)
+
+  def Stored(self, tasklist_ids):
+    """Returns the number of tasks of tasklist_ids."""
+    return sum([PAGES[tasklist_id] for tasklist_id in tasklist_ids]) * (
+        TASKS_PER_PAGE)
+
+  def AssertComplete(self, snapshot):
+    total = self.Stored(PAGES)
+    self.assertEqual(total, model.Task.all().ancestor(self.snapshot).count())
+    self.assertEqual(len(PAGES), snapshot.checkpointTasklist)
+    self.assertEqual(None, snapshot.checkpointPageToken)
+    self.assertEqual(total, snapshot.checkpointTasks)
+    self.assertEqual(total * self.TaskSize(), snapshot.byteSize)
+
+  def testStoreTasksResumesFromPageToken(self):
+    method = worker.SnapshotWorker.StoreTasks
+    self.assertRaises(_Crash, self.Store, method, _FakeTasks(("list1", 3)))
+    snapshot = model.Snapshot.get(self.snapshot.key())
+    self.assertEqual(1, snapshot.checkpointTasklist)
+    self.assertEqual("p3", snapshot.checkpointPageToken)
+    stored = self.Stored(["list0"]) + 2 * TASKS_PER_PAGE
+    self.assertEqual(stored, snapshot.checkpointTasks)
+    self.assertEqual(stored * self.TaskSize(), snapshot.byteSize)
+
+    service = _FakeTasks()
+    self.AssertComplete(self.Store(method, service))
+    # only the pages after the checkpoint are fetched again.
+    self.assertEqual([("list1", 3), ("list2", 1), ("list3", 1),
+                      ("list3", 2)], sorted(service.fetched))
+
+  def testStoreTasksConcurrentlyResumesFromTasklist(self):
+    method = worker.SnapshotWorker.StoreTasksConcurrently
+    self.assertRaises(_Crash, self.Store, method, _FakeTasks(("list1", 3)))
+    snapshot = model.Snapshot.get(self.snapshot.key())
+    index = snapshot.checkpointTasklist
+    self.assertTrue(index <= 1)
+    self.assertEqual(None, snapshot.checkpointPageToken)
+    stored = self.Stored(sorted(PAGES)[:index])
+    self.assertEqual(stored, snapshot.checkpointTasks)
+    self.assertEqual(stored * self.TaskSize(), snapshot.byteSize)
+
+    service = _FakeTasks()
+    self.AssertComplete(self.Store(method, service))
+    self.assertEqual(sorted(PAGES)[index:],
+                     sorted(set([tasklist for tasklist, page in
+                                 service.fetched])))
+
+  def testPackedSnapshot(self):
+    self.snapshot.storage = "packed"
+    self.snapshot.put()
+    snapshot = self.Store(worker.SnapshotWorker.StoreTasks, _FakeTasks())
+    headers = packedstore.LoadHeaders(snapshot)
+    self.assertEqual(sorted(PAGES), sorted(headers))
+    for tasklist_id, header in headers.items():
+      self.assertEqual(self.Stored([tasklist_id]), header.count)
+    self.assertEqual(self.Stored(PAGES), snapshot.checkpointTasks)
+    self.assertEqual(sum([header.size for header in headers.values()]),
+                     snapshot.byteSize)
+
+  def testCrashBeforeAnyPageKeepsCheckpoint(self):
+    for method in (worker.SnapshotWorker.StoreTasks,
+                   worker.SnapshotWorker.StoreTasksConcurrently):
+      self.assertRaises(_Crash, self.Store, method, _FakeTasks(("list0", 1)))
+      snapshot = model.Snapshot.get(self.snapshot.key())
+      self.assertEqual(0, snapshot.checkpointTasklist)
+      self.assertEqual(0, snapshot.checkpointTasks)
+      self.assertEqual(0, snapshot.byteSize)
+
+
+class CheckpointerTest(appengine_testbed.TestCase):
+
+  def testRecordsEachPage(self):
+    snapshot = model.Snapshot(type="export", status="building",
+                              checkpointTasklist=2, checkpointTasks=5,
+                              byteSize=50)
+    snapshot.put()
+    checkpoint = worker._Checkpointer(snapshot, 2)
+    checkpoint({"items": [], "nextPageToken": "p2"}, 3, 30)
+    stored = model.Snapshot.get(snapshot.key())
+    self.assertEqual((2, "p2", 8, 80),
+                     (stored.checkpointTasklist, stored.checkpointPageToken,
+                      stored.checkpointTasks, stored.byteSize))
+    checkpoint({"items": []}, 1, 10)
+    stored = model.Snapshot.get(snapshot.key())
+    self.assertEqual((3, None, 9, 90),
+                     (stored.checkpointTasklist, stored.checkpointPageToken,
+                      stored.checkpointTasks, stored.byteSize))
+
+
+if __name__ == "__main__":
+  unittest.main()
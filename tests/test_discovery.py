@@ -0,0 +1,95 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the compiled modules of apiclient.discovery."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import re
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apiclient import discovery
+from apiclient.ext import compiler
+
+
+def _Document(revision):
+  """Returns the bundled Tasks document as served with a revision."""
+  document = discovery._read_contrib("tasks", "v1.json")
+  return document.replace('"id": "tasks:v1",',
+                          '"id": "tasks:v1",\n "revision": "%s",' % revision)
+
+
+def _Reformat(document):
+  """Returns document with other whitespace, as another server may send it."""
+  return re.sub(r"\n\s*", " ", document)
+
+
+def _Compile(document):
+  """Returns the module apiclient.ext.compiler generates for document."""
+  module = types.ModuleType("compiled")
+  exec compiler.compile_document(document) in module.__dict__
+  return module
+
+
+class FingerprintTest(unittest.TestCase):
+
+  def testRevisionIgnoresFormatting(self):
+    document = _Document("20110810")
+    self.assertEqual("tasks:v1@20110810", discovery.fingerprint(document))
+    self.assertEqual(discovery.fingerprint(document),
+                     discovery.fingerprint(_Reformat(document)))
+    self.assertNotEqual(discovery.fingerprint(document),
+                        discovery.fingerprint(_Document("20110811")))
+
+  def testNestedFieldsAreIgnored(self):
+    document = '{"id": "a:v1", "schemas": {"Task": {"etag": "x"}}}'
+    self.assertEqual(32, len(discovery.fingerprint(document)))
+
+  def testEtagWithoutRevision(self):
+    self.assertEqual('a:v1@\\"x/y\\"', discovery.fingerprint(
+        '{"etag": "\\"x/y\\"", "id": "a:v1", "schemas": {}}'))
+
+  def testDocumentWithoutRevisionIsHashed(self):
+    document = discovery._read_contrib("tasks", "v1.json")
+    self.assertNotEqual(discovery.fingerprint(document),
+                        discovery.fingerprint(_Reformat(document)))
+
+
+class CompiledModuleTest(unittest.TestCase):
+
+  def setUp(self):
+    discovery._services.clear()
+
+  def testUsedForTheSameRevision(self):
+    compiled = _Compile(_Document("20110810"))
+    service = discovery._parse_service(_Reformat(_Document("20110810")), None,
+                                       compiled)
+    self.assertTrue(service[0] is compiled.SERVICE)
+
+  def testNotUsedForAnotherRevision(self):
+    compiled = _Compile(_Document("20110810"))
+    service = discovery._parse_service(_Document("20110811"), None, compiled)
+    self.assertFalse(service[0] is compiled.SERVICE)
+    self.assertEqual("20110811", service[0]["revision"])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the fan-out of snapshots and their sharded completion counter."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import appengine_testbed
+
+import model
+import worker
+
+
+def _Snapshot(tasklist_count):
+  """Stores a snapshot being built with tasklist_count tasklists."""
+  snapshot = model.Snapshot(type="export", status="building",
+                            tasklistCount=tasklist_count)
+  snapshot.put()
+  return snapshot
+
+
+class FanOutTest(appengine_testbed.TestCase):
+
+  def testOneTaskPerTasklist(self):
+    snapshot = _Snapshot(0)
+    tasklists = [model.TaskList(parent=snapshot, key_name="list%d" % i,
+                                id="list%d" % i)
+                 for i in range(worker.MAX_TASKS_PER_ADD + 5)]
+    worker.SnapshotWorker().FanOut(snapshot, tasklists, {"list3": "2011-08"})
+    tasks = self.taskqueue.get_filtered_tasks(url="/worker/snapshot/tasklist")
+    self.assertEqual(len(tasklists), len(tasks))
+    params = [task.extract_params() for task in tasks]
+    self.assertEqual(sorted([tasklist.id for tasklist in tasklists]),
+                     sorted([param["tasklist"] for param in params]))
+    for param in params:
+      self.assertEqual(str(snapshot.key().id()), param["id"])
+      if param["tasklist"] == "list3":
+        self.assertEqual("2011-08", param["updatedMin"])
+      else:
+        self.assertFalse("updatedMin" in param)
+
+
+class RecordCompletionTest(appengine_testbed.TestCase):
+
+  def Record(self, snapshot, order):
+    """Records the tasklists named by order, checking the status after each.
+
+    The tasklist "listN" has N tasks of 10 bytes each.
+    """
+    for tasklist_id in order:
+      self.assertEqual("building", model.Snapshot.get(snapshot.key()).status)
+      index = int(tasklist_id[len("list"):])
+      worker._RecordCompletion(snapshot, tasklist_id, index, index * 10)
+    return model.Snapshot.get(snapshot.key())
+
+  def testCompletesWhenLastTasklistIsRecorded(self):
+    tasklist_ids = ["list%d" % i for i in range(50)]
+    for seed in range(5):
+      snapshot = _Snapshot(len(tasklist_ids))
+      order = list(tasklist_ids)
+      random.Random(seed).shuffle(order)
+      completed = self.Record(snapshot, order)
+      self.assertEqual("completed", completed.status)
+      self.assertEqual(sum(range(50)), completed.taskCount)
+      self.assertEqual(sum(range(50)) * 10, completed.byteSize)
+
+  def testRecordingTwiceHasNoEffect(self):
+    snapshot = _Snapshot(3)
+    # a retried tasklist task records its tasklist again.
+    completed = self.Record(snapshot, ["list1", "list1", "list2", "list2"])
+    self.assertEqual("building", completed.status)
+    completed = self.Record(snapshot, ["list2", "list4"])
+    self.assertEqual("completed", completed.status)
+    self.assertEqual(7, completed.taskCount)
+    self.assertEqual(70, completed.byteSize)
+
+  def testFailedSnapshotIsNotCompleted(self):
+    snapshot = _Snapshot(2)
+    worker._RecordCompletion(snapshot, "list1", 1, 10)
+    failed = model.Snapshot.get(snapshot.key())
+    failed.status = "error"
+    failed.put()
+    worker._RecordCompletion(snapshot, "list2", 2, 20)
+    self.assertEqual("error", model.Snapshot.get(snapshot.key()).status)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the lazily decoded items of apiclient.model.JsonModel."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2
+
+from apiclient import model
+
+# Items whose strings hold brackets, commas and escaped quotes.
+TRICKY_ITEMS = ('[{"title": "a ] b", "notes": "x, \\"[y\\"] {"},'
+                ' {"links": [{"a": 1}, {"b": [2, 3]}]}, "}", [], {}]')
+
+
+class _CountingDecoder(object):
+  """Decoder which counts the elements it decodes."""
+
+  def __init__(self, decoder):
+    self.decoder = decoder
+    self.calls = 0
+
+  def raw_decode(self, content, idx=0):
+    self.calls += 1
+    return self.decoder.raw_decode(content, idx=idx)
+
+
+def _Deserialize(content):
+  """Deserializes content with lazy items, as a response would be."""
+  jsonmodel = model.JsonModel(lazy_items=True)
+  return jsonmodel.response(httplib2.Response({"status": "200"}), content)
+
+
+class LazyItemsTest(unittest.TestCase):
+
+  def testScanArrayIgnoresBracketsInStrings(self):
+    content = '{"items": %s, "nextPageToken": "t]"}' % TRICKY_ITEMS
+    start = len('{"items": ')
+    self.assertEqual((start + len(TRICKY_ITEMS), 5),
+                     model._scan_array(content, start))
+    body = _Deserialize(content)
+    self.assertEqual("t]", body["nextPageToken"])
+    self.assertEqual(model.get_codec().loads(TRICKY_ITEMS),
+                     list(body["items"]))
+
+  def testScanArrayRejectsUnterminatedArrays(self):
+    self.assertRaises(ValueError, model._scan_array, '[{"a": "]"}', 0)
+    self.assertRaises(ValueError, model._scan_array, '[1, 2', 0)
+
+  def testLenIsKnownAfterDeserializing(self):
+    body = _Deserialize('{"items": %s}' % TRICKY_ITEMS)
+    self.assertEqual(5, body["items"]._len)
+    self.assertEqual(5, len(body["items"]))
+
+  def testLenCountsWithoutDecoding(self):
+    decoder = _CountingDecoder(model.get_codec().decoder)
+    items = model.LazyItems(TRICKY_ITEMS, 0, len(TRICKY_ITEMS), decoder)
+    self.assertEqual(5, len(items))
+    self.assertEqual(0, decoder.calls)
+    self.assertEqual(5, len(list(items)))
+    self.assertEqual(5, decoder.calls)
+
+  def testEmptyItems(self):
+    items = _Deserialize('{"items": [ ]}')["items"]
+    self.assertEqual(0, len(items))
+    self.assertEqual([], list(items))
+    self.assertFalse(items)
+
+
+if __name__ == "__main__":
+  unittest.main()
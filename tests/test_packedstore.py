@@ -0,0 +1,116 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the packed storage of the tasks of a snapshot."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import appengine_testbed
+
+from google.appengine.ext import db
+
+import model
+import packedstore
+
+
+def _Records(count, seed=0):
+  """Returns count tasks whose notes do not compress."""
+  rand = random.Random(seed)
+  return [{"kind": "tasks#task", "id": "task%d" % i, "title": "Task %d" % i,
+           "notes": "%032x" % rand.getrandbits(128), "status": "needsAction"}
+          for i in range(count)]
+
+
+class PackedStoreTest(appengine_testbed.TestCase):
+
+  def setUp(self):
+    appengine_testbed.TestCase.setUp(self)
+    self.chunk_size = packedstore.CHUNK_SIZE
+    packedstore.CHUNK_SIZE = 256
+    self.snapshot = model.Snapshot(type="export", status="building",
+                                   storage="packed")
+    self.snapshot.put()
+    self.tasklist = model.TaskList(parent=self.snapshot, key_name="list",
+                                   id="list")
+    self.tasklist.put()
+
+  def tearDown(self):
+    packedstore.CHUNK_SIZE = self.chunk_size
+    appengine_testbed.TestCase.tearDown(self)
+
+  def Write(self, records):
+    writer = packedstore.Writer(self.snapshot, self.tasklist)
+    for record in records:
+      writer.Add(record)
+    return writer.Close()
+
+  def Read(self):
+    header = packedstore.LoadHeaders(self.snapshot)["list"]
+    return list(packedstore.ReadRecords(header))
+
+  def ChunkCount(self):
+    return model.PackedChunk.all().ancestor(self.snapshot).count()
+
+  def testRoundTripOverManyChunks(self):
+    records = _Records(100)
+    header = self.Write(records)
+    self.assertTrue(header.chunks > 3)
+    self.assertEqual(header.chunks, self.ChunkCount())
+    self.assertEqual(100, header.count)
+    self.assertEqual(sum([len(chunk.data) for chunk in
+                          model.PackedChunk.all().ancestor(self.snapshot)]),
+                     header.size)
+    self.assertEqual(records, self.Read())
+    tasks = packedstore.LoadTasks(self.snapshot, self.tasklist, header)
+    self.assertEqual([record["notes"] for record in records],
+                     [task.notes for task in tasks])
+
+  def testRewriteWithFewerChunksIgnoresStaleChunks(self):
+    self.Write(_Records(100))
+    stale = self.ChunkCount()
+    records = _Records(10, seed=1)
+    header = self.Write(records)
+    self.assertTrue(header.chunks < stale)
+    self.assertEqual(stale, self.ChunkCount())
+    self.assertEqual(records, self.Read())
+
+  def testMissingChunkIsAnError(self):
+    header = self.Write(_Records(100))
+    db.delete(packedstore._ChunkKey(self.snapshot.key(), "list", 1))
+    self.assertRaises(ValueError, list, packedstore.ReadRecords(header))
+
+  def testPackerRequestsWholeTasks(self):
+    # the stream keeps the tasks as the API returns them.
+    packer = packedstore.Packer(self.snapshot, self.tasklist, None,
+                                tasklist="list")
+    self.assertEqual({"tasklist": "list"}, packer.args)
+
+  def testDeleteRemovesEveryChunk(self):
+    self.Write(_Records(100))
+    packedstore.Delete(self.snapshot)
+    self.assertEqual(0, self.ChunkCount())
+    self.assertEqual({}, packedstore.LoadHeaders(self.snapshot))
+
+
+if __name__ == "__main__":
+  unittest.main()
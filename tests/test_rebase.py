@@ -0,0 +1,121 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the rebase of the deltas of a deleted snapshot."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import appengine_testbed
+
+from google.appengine.ext import db
+
+import model
+import worker
+from common import apiparse
+
+
+def _Store(snapshot, tasks):
+  """Stores tasks, a dict of titles by id, in a tasklist under snapshot."""
+  tasklist = model.TaskList(parent=snapshot, key_name="list", id="list")
+  entities = [tasklist]
+  for task_id, title in sorted(tasks.items()):
+    entities.append(model.Task(parent=snapshot, key_name=task_id, id=task_id,
+                               title=title, parent_entity=tasklist))
+  db.put(entities)
+  return sum([apiparse.EncodedSize(entity) for entity in entities[1:]])
+
+
+class _Crash(Exception):
+  pass
+
+
+class RebaseTest(appengine_testbed.TestCase):
+
+  def setUp(self):
+    appengine_testbed.TestCase.setUp(self)
+    self.snapshot = model.Snapshot(type="export", status="completed")
+    self.snapshot.put()
+    _Store(self.snapshot, {"a": "base a", "b": "base b", "c": "base c",
+                           "d": "base d"})
+    self.delta = model.Snapshot(type="export", status="completed",
+                                baseSnapshot=self.snapshot, deltaDepth=1)
+    self.delta.put()
+    self.delta.byteSize = _Store(self.delta, {"b": "delta b"})
+    self.delta.put()
+
+  def Tasks(self):
+    """Returns the titles by id of the tasks stored under the delta."""
+    return dict([(task.id, task.title) for task in
+                 model.Task.all().ancestor(self.delta)])
+
+  def ExpectedSize(self):
+    return sum([apiparse.EncodedSize(task) for task in
+                model.Task.all().ancestor(self.delta)])
+
+  def testCopiesTasksNotOverridden(self):
+    worker.DeleteWorker().Rebase(self.delta, self.snapshot)
+    self.assertEqual({"a": "base a", "b": "delta b", "c": "base c",
+                      "d": "base d"}, self.Tasks())
+    delta = model.Snapshot.get(self.delta.key())
+    self.assertEqual(None, delta.baseSnapshot)
+    self.assertEqual(0, delta.deltaDepth)
+    self.assertEqual(self.ExpectedSize(), delta.byteSize)
+    for task in model.Task.all().ancestor(self.delta):
+      self.assertEqual(self.delta.key(),
+                       model.Task.parent_entity.get_value_for_datastore(
+                           task).parent())
+
+  def testRetryAfterPartialCopyCountsEveryCopyOnce(self):
+    store_copies = worker._StoreCopies
+    calls = []
+    def CrashOnSecondBatch(*args):
+      calls.append(args)
+      if len(calls) == 2:
+        raise _Crash()
+      store_copies(*args)
+    old_batch_size = worker.PUT_BATCH_SIZE
+    worker.PUT_BATCH_SIZE = 1
+    worker._StoreCopies = CrashOnSecondBatch
+    try:
+      self.assertRaises(_Crash, worker.DeleteWorker().Rebase,
+                        model.Snapshot.get(self.delta.key()), self.snapshot)
+      self.assertEqual(2, len(self.Tasks()))
+      # the task queue retries the delete with the delta as stored.
+      worker.DeleteWorker().Rebase(model.Snapshot.get(self.delta.key()),
+                                   self.snapshot)
+    finally:
+      worker._StoreCopies = store_copies
+      worker.PUT_BATCH_SIZE = old_batch_size
+    self.assertEqual(4, len(self.Tasks()))
+    delta = model.Snapshot.get(self.delta.key())
+    self.assertEqual(self.ExpectedSize(), delta.byteSize)
+    self.assertEqual(None, delta.baseSnapshot)
+
+  def testUnknownSizeStaysUnknown(self):
+    self.delta.byteSize = None
+    self.delta.put()
+    worker.DeleteWorker().Rebase(self.delta, self.snapshot)
+    self.assertEqual(None, model.Snapshot.get(self.delta.key()).byteSize)
+
+
+if __name__ == "__main__":
+  unittest.main()
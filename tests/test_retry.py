@@ -0,0 +1,72 @@
+#!/usr/bin/python2.5
+#
+# Copyright 2011 Google Inc.  All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the retries of apiclient.http.HttpRequest by RetryPolicy."""
+
+__author__ = "dwightguth@google.com (Dwight Guth)"
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apiclient import errors
+from apiclient import http
+from apiclient import model
+
+RATE_LIMITED = '{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'
+
+
+def _Request(mock, method):
+  """Returns an HttpRequest answered by mock, retried without waiting."""
+  return http.HttpRequest(mock, model.JsonModel().response,
+                          "http://example.com/", method=method,
+                          retry_policy=http.RetryPolicy(sleep=lambda s: None))
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+  def testGetIsRetriedOnServerErrors(self):
+    mock = http.HttpMockSequence([({"status": "503"}, "{}"),
+                                  ({"status": "200"}, '{"id": "x"}')])
+    self.assertEqual({"id": "x"}, _Request(mock, "GET").execute())
+
+  def testPostIsNotRetriedOnServerErrors(self):
+    mock = http.HttpMockSequence([({"status": "503"}, "{}"),
+                                  ({"status": "200"}, '{"id": "x"}')])
+    self.assertRaises(errors.HttpError, _Request(mock, "POST").execute)
+
+  def testPostIsNotRetriedOnTransportErrors(self):
+    class FailingHttp(object):
+      calls = 0
+      def request(self, *args, **kwargs):
+        self.calls += 1
+        raise http.TRANSIENT_ERRORS[0]("connection reset")
+    failing = FailingHttp()
+    self.assertRaises(http.TRANSIENT_ERRORS[0],
+                      _Request(failing, "POST").execute)
+    self.assertEqual(1, failing.calls)
+
+  def testPostIsRetriedOnRateLimits(self):
+    mock = http.HttpMockSequence([({"status": "429"}, "{}"),
+                                  ({"status": "403"}, RATE_LIMITED),
+                                  ({"status": "200"}, '{"id": "x"}')])
+    self.assertEqual({"id": "x"}, _Request(mock, "POST").execute())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -18,23 +18,105 @@
 
 __author__ = "dwightguth@google.com (Dwight Guth)"
 
+import itertools
 import logging
+import zlib
 
 from apiclient import discovery
+from apiclient import errors
+from apiclient import http as apihttp
+from apiclient import model as apimodel
+from apiclient import ratelimit
 from apiclient.oauth2client import appengine
 from apiclient.oauth2client import client
 
 from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import taskqueue
+from google.appengine.api import urlfetch_errors
+from google.appengine.ext import db
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp import util
 
-import httplib2
-
+from common import apifetch
 from common import apiparse
 from common import apiupload
-import csvparse
-import icalparse
+from common import credcache
+from common import lazyimport
+from common import responsecache
 import model
+import packedstore
+import settings
+import snapshotview
+
+# the parsers of uploaded files, and vobject and dateutil with them, are only
+# needed by ImportWorker.
+csvparse = lazyimport.LazyModule("csvparse")
+icalparse = lazyimport.LazyModule("icalparse")
+
+# Number of parsed entities written per datastore batch put during snapshots.
+PUT_BATCH_SIZE = 100
+
+# Maximum number of tasklists whose tasks are fetched at the same time.  1
+# fetches the tasklists one after another.
+MAX_CONCURRENT_TASKLISTS = 4
+
+# Number of pages of tasks requested ahead of the page being stored.
+PREFETCH_PAGES = 1
+
+# Maximum number of first pages of tasks fetched in one batch request, so that
+# a snapshot which is not fanned out needs one round trip for the first pages
+# of all of its tasklists.  0 fetches every page on its own.  Fanned-out
+# snapshots fetch each tasklist in its own task and never batch.
+FIRST_PAGE_BATCH_SIZE = 50
+
+# Snapshots with at least this many tasklists are split into one task queue task
+# per tasklist.
+FAN_OUT_MIN_TASKLISTS = 10
+
+# Number of shards of the completion counter of a fanned-out snapshot.
+COMPLETION_SHARDS = 20
+
+# The task queue accepts at most this many tasks in a single add call.
+MAX_TASKS_PER_ADD = 100
+
+# Whether snapshots only store the tasks changed since the previous snapshot.
+INCREMENTAL_SNAPSHOTS = True
+
+# Maximum number of snapshots in the chain of bases of an incremental snapshot.
+MAX_DELTA_CHAIN = 8
+
+# How new snapshots store their tasks: "entities" for one Task entity per task,
+# "packed" for one compressed stream per tasklist.  Packed snapshots are never
+# incremental.  Deployments switch to packed storage by setting
+# SNAPSHOT_STORAGE = "packed" in the settings module.
+SNAPSHOT_STORAGE = getattr(settings, "SNAPSHOT_STORAGE", "entities")
+if SNAPSHOT_STORAGE not in ("entities", "packed"):
+  raise ValueError("Unknown SNAPSHOT_STORAGE in settings: %r" %
+                   SNAPSHOT_STORAGE)
+
+# Number of snapshots whose totals are computed by one /worker/backfill task.
+BACKFILL_BATCH_SIZE = 20
+
+# Number of times the Tasks API requests of one worker task may be retried in
+# total after transient errors, before the error fails the task.
+API_RETRY_BUDGET = 50
+
+# Whether the Tasks API is built from the discovery document bundled with
+# apiclient instead of the one served by the discovery service.  Building
+# offline saves fetching the document, but pins the app to the bundled
+# revision of the API, so deployments opt in by setting
+# OFFLINE_DISCOVERY = True in the settings module.
+OFFLINE_DISCOVERY = getattr(settings, "OFFLINE_DISCOVERY", False)
+
+# Tasks API requests per second allowed for each user and for the whole app,
+# across all instances.  Requests are paced to stay under these rates, which
+# are halved for a while whenever the API reports a rate limit exceeded.
+USER_API_RATE = 5
+PROJECT_API_RATE = 50
+
+# Number of times a snapshot task is retried after a transient error before
+# the snapshot is marked as failed.
+MAX_TASK_RETRIES = 5
 
 
 def urlfetch_timeout_hook(service, call, request, response):
@@ -54,6 +136,14 @@ class DeleteWorker(webapp.RequestHandler):
     snapshot = model.Snapshot.gql("WHERE __key__ = KEY('Snapshot', :key)",
                                   key=int(self.request.get("id"))).get()
 
+    for delta in snapshot.deltas:
+      if delta.status == "building":
+        # the task queue retries once the delta is done building.
+        self.error(503)
+        return
+      if delta.status != "deleting":
+        self.Rebase(delta, snapshot)
+
     task_entities = model.Task.gql("WHERE ANCESTOR IS :id",
                                    id=snapshot.key())
 
@@ -66,8 +156,44 @@ class DeleteWorker(webapp.RequestHandler):
     for ent in tasklist_entities:
       ent.delete()
 
+    packedstore.Delete(snapshot)
+    db.delete(_ShardKeys(snapshot))
     snapshot.delete()
 
+  def Rebase(self, delta, snapshot):
+    """Makes a delta over snapshot independent of it.
+
+    Every task of snapshot which delta does not override is copied into delta,
+    and delta takes over the base of snapshot.  The size of each batch of
+    copies is added to the byteSize of delta in the transaction storing them,
+    so a retried task, which finds the copies stored so far under delta and
+    skips them like overridden tasks, does not lose or repeat their size.
+
+    Args:
+      delta: a Snapshot entity whose baseSnapshot is snapshot.
+      snapshot: the Snapshot entity about to be deleted.
+    """
+    overridden = set([key.name() for key in
+                      db.Query(model.Task, keys_only=True).ancestor(delta)])
+    copies = []
+    copied_bytes = 0
+    for task in model.Task.gql("WHERE ANCESTOR IS :id", id=snapshot.key()):
+      if task.key().name() in overridden:
+        continue
+      copies.append(_CopyEntity(task, snapshot, delta))
+      copied_bytes += apiparse.EncodedSize(copies[-1])
+      if len(copies) >= PUT_BATCH_SIZE:
+        db.run_in_transaction(_StoreCopies, delta.key(), copies, copied_bytes)
+        copies = []
+        copied_bytes = 0
+    if copies:
+      db.run_in_transaction(_StoreCopies, delta.key(), copies, copied_bytes)
+    delta = model.Snapshot.get(delta.key())
+    delta.baseSnapshot = snapshot.baseSnapshot
+    delta.deltaDepth = snapshot.deltaDepth
+    delta.put()
+    _UpdateDeltaDepths(delta)
+
 
 class SnapshotWorker(webapp.RequestHandler):
   """Handler for /worker/snapshot."""
@@ -76,50 +202,562 @@ class SnapshotWorker(webapp.RequestHandler):
     """Handles POST requests for /worker/snapshot."""
     snapshot = model.Snapshot.gql("WHERE __key__ = KEY('Snapshot', :key)",
                                   key=int(self.request.get("id"))).get()
+    if snapshot is None or snapshot.status != "building":
+      # a previous attempt of this task already finished the snapshot.
+      return
     user = snapshot.user
-    credentials = appengine.StorageByKeyName(
-        model.Credentials, user.user_id(), "credentials").get()
+    storage = appengine.CachedStorageByKeyName(
+        model.Credentials, user.user_id(), "credentials")
+    credentials = storage.get()
 
     if credentials is None or credentials.invalid == True:
       snapshot.status = "error"
       snapshot.errorMessage = "Must be logged in to create snapshot."
       snapshot.put()
     else:
+      retry_policy = apihttp.RetryPolicy(budget=API_RETRY_BUDGET)
+      rate_limiter = _RateLimiter(user)
       try:
-        http = httplib2.Http()
+        http = responsecache.Http(user)
         http = credentials.authorize(http)
-        service = discovery.build("tasks", "v1", http)
+        service = discovery.build(
+            "tasks", "v1", http, model=apimodel.JsonModel(lazy_items=True),
+            requestBuilder=apihttp.request_builder(retry_policy, rate_limiter),
+            offline=OFFLINE_DISCOVERY)
         tasklists = service.tasklists()
-        tasklists_list = tasklists.list().execute()
-
         parser = apiparse.Parser(model.TaskList, None, snapshot, tasklists.list,
-                                 model)
+                                 model, batch_size=PUT_BATCH_SIZE, partial=True)
+        tasklists_list = tasklists.list(**parser.args).execute()
         tasklist_entities = parser.ParseAndStore(tasklists_list)
+        # checkpoints refer to tasklists by index, so a retry must see the
+        # tasklists in the same order.
+        tasklist_entities.sort(key=lambda tasklist: tasklist.id)
+        snapshot.tasklistCount = len(tasklist_entities)
+        if snapshot.checkpointTasklist is None:
+          snapshot.storage = SNAPSHOT_STORAGE
+        updated_min = self.ChooseBase(snapshot, tasklist_entities)
+        if snapshot.checkpointTasklist is None:
+          snapshot.checkpointTasklist = 0
+          snapshot.checkpointTasks = 0
+          snapshot.byteSize = 0
+        snapshot.put()
 
-        for tasklist in tasklist_entities:
-          tasks = service.tasks()
-          tasks_list = tasks.list(tasklist=tasklist.id,
-                                  showHidden=True).execute()
-          parser = apiparse.Parser(model.Task,
-                                   tasklist,
-                                   snapshot,
-                                   tasks.list,
-                                   model,
-                                   tasklist=tasklist.id,
-                                   showHidden=True)
-          parser.ParseAndStore(tasks_list)
+        if len(tasklist_entities) >= FAN_OUT_MIN_TASKLISTS:
+          # the snapshot is completed by the last SnapshotTasklistWorker.
+          self.FanOut(snapshot, tasklist_entities, updated_min)
+          return
+        elif MAX_CONCURRENT_TASKLISTS > 1:
+          self.StoreTasksConcurrently(service, credentials, snapshot,
+                                      tasklist_entities, updated_min)
+        else:
+          self.StoreTasks(service, credentials, snapshot, tasklist_entities,
+                          updated_min)
+        snapshot.taskCount = _TaskCount(snapshot, snapshot.checkpointTasks)
         snapshot.status = "completed"
         snapshot.put()
       except client.AccessTokenRefreshError, e:
+        credcache.Invalidate(user.user_id())
+        storage.invalidate()
+        snapshot.status = "error"
+        snapshot.errorMessage = "OAuth credentials were revoked."
+        logging.info(e, exc_info=True)
+        snapshot.put()
+      except Exception, e:
+        if _ShouldRetry(self.request, e):
+          # the task queue retries the task, which resumes from the checkpoint.
+          logging.warning(e, exc_info=True)
+          self.error(500)
+          return
+        snapshot.status = "error"
+        snapshot.errorMessage = "Snapshot creation process failed unexpectedly."
+        logging.error(e, exc_info=True)
+        snapshot.put()
+      finally:
+        logging.info("Tasks API retries: %r", retry_policy.counters)
+        logging.info("Tasks API pacing: %r", rate_limiter.counters)
+        responsecache.LogStats()
+
+  def ChooseBase(self, snapshot, tasklist_entities):
+    """Chooses the snapshot a new snapshot is stored as a delta over.
+
+    The base is the user's most recent completed export stored as entities.
+    Packed snapshots have no base.  No base is used either if the chain of
+    bases would grow beyond MAX_DELTA_CHAIN or if a tasklist of the base has
+    been deleted since, because the API does not report the tasks of deleted
+    tasklists as deleted.  If a base is chosen it is saved as the baseSnapshot
+    of snapshot.
+
+    Args:
+      snapshot: the snapshot entity being built.
+      tasklist_entities: the TaskList entities stored in snapshot.
+
+    Returns:
+      A dict from the id of each tasklist which only needs its changes to be
+      fetched to the value of the updatedMin parameter to fetch them with.
+    """
+    if snapshot.checkpointTasklist is not None:
+      # a retry keeps the base chosen by the first attempt.
+      base = snapshot.baseSnapshot
+      if base is None:
+        return {}
+      base_ids = set([key.name() for key in
+                      db.Query(model.TaskList, keys_only=True).ancestor(base)])
+      return _UpdatedMin(base, base_ids)
+    if not INCREMENTAL_SNAPSHOTS or snapshot.storage == "packed":
+      return {}
+    base = None
+    for candidate in model.Snapshot.gql("WHERE user = :user "
+                                        "AND type = 'export' "
+                                        "AND status = 'completed'",
+                                        user=snapshot.user):
+      if candidate.storage == "packed":
+        continue
+      if base is None or candidate.timestamp > base.timestamp:
+        base = candidate
+    if base is None or base.deltaDepth + 1 > MAX_DELTA_CHAIN:
+      return {}
+
+    base_ids = set([key.name() for key in
+                    db.Query(model.TaskList, keys_only=True).ancestor(base)])
+    if not base_ids.issubset([tasklist.id for tasklist in tasklist_entities]):
+      return {}
+
+    snapshot.baseSnapshot = base
+    snapshot.deltaDepth = base.deltaDepth + 1
+    return _UpdatedMin(base, base_ids)
+
+  def StoreTasks(self, service, credentials, snapshot, tasklist_entities,
+                 updated_min):
+    """Fetches and stores the tasks of one tasklist after another.
+
+    Progress is checkpointed onto the snapshot after every page, and storing
+    starts from the checkpoint of a previous attempt.  The first pages of all
+    tasklists are fetched up front with batch requests, so only the further
+    pages of large tasklists cost a round trip each.
+
+    Args:
+      service: the Tasks API service object.
+      credentials: the credentials used to authorize service.
+      snapshot: the snapshot entity the tasks are stored under.
+      tasklist_entities: the TaskList entities whose tasks should be stored.
+      updated_min: the dict returned by ChooseBase.
+    """
+    tasks = service.tasks()
+    fetcher = apifetch.Fetcher(credentials)
+    parsers = []
+    requests = []
+    for index in range(snapshot.checkpointTasklist, len(tasklist_entities)):
+      tasklist = tasklist_entities[index]
+      parser = _TasksParser(snapshot, tasklist, tasks, fetcher,
+                            PREFETCH_PAGES, updated_min.get(tasklist.id))
+      parser.checkpoint = _Checkpointer(snapshot, index)
+      args = parser.args.copy()
+      if index == snapshot.checkpointTasklist and snapshot.checkpointPageToken:
+        args["pageToken"] = snapshot.checkpointPageToken
+      parsers.append(parser)
+      requests.append(tasks.list(**args))
+
+    if FIRST_PAGE_BATCH_SIZE > 1 and len(requests) > 1:
+      first_pages = _ExecuteBatches(requests, FIRST_PAGE_BATCH_SIZE)
+    else:
+      first_pages = [request.execute() for request in requests]
+    for parser, tasks_list in zip(parsers, first_pages):
+      parser.ParseAndStore(tasks_list)
+
+  def StoreTasksConcurrently(self, service, credentials, snapshot,
+                             tasklist_entities, updated_min):
+    """Fetches and stores the tasks of several tasklists at the same time.
+
+    The first pages of all tasklists are fetched up front with batch
+    requests.  Further pages are requested for up to MAX_CONCURRENT_TASKLISTS
+    tasklists at once and each page is stored as soon as it arrives.
+
+    Args:
+      service: the Tasks API service object.
+      credentials: the credentials used to authorize service.
+      snapshot: the snapshot entity the tasks are stored under.
+      tasklist_entities: the TaskList entities whose tasks should be stored.
+      updated_min: the dict returned by ChooseBase.
+    """
+    tasks = service.tasks()
+    fetcher = apifetch.Fetcher(credentials, MAX_CONCURRENT_TASKLISTS)
+    start = snapshot.checkpointTasklist
+    tags = []
+    requests = []
+    for index in range(start, len(tasklist_entities)):
+      tasklist = tasklist_entities[index]
+      parser = _TasksParser(snapshot, tasklist, tasks, fetcher, 0,
+                            updated_min.get(tasklist.id))
+      tags.append((index, parser))
+      requests.append(tasks.list(**parser.args))
+
+    if FIRST_PAGE_BATCH_SIZE > 1 and len(requests) > 1:
+      first_pages = zip(tags, _ExecuteBatches(requests, FIRST_PAGE_BATCH_SIZE))
+    else:
+      first_pages = []
+      for tag, request in zip(tags, requests):
+        fetcher.Add(request, tag)
+
+    # the checkpoint is the first tasklist not yet completely stored, since
+    # the tasklists after it may complete in any order.
+    done = {}
+    for (index, parser), tasks_list in itertools.chain(first_pages,
+                                                       fetcher.Run()):
+      parser.ParsePage(tasks_list)
+      next_page = parser.NextPageRequest(tasks_list)
+      if next_page is not None:
+        fetcher.Add(next_page, (index, parser))
+        continue
+      done[index] = (parser.entities_written, parser.bytes_written)
+      if index == snapshot.checkpointTasklist:
+        while snapshot.checkpointTasklist in done:
+          written, size = done.pop(snapshot.checkpointTasklist)
+          snapshot.checkpointTasks += written
+          snapshot.byteSize += size
+          snapshot.checkpointTasklist += 1
+        snapshot.put()
+
+  def FanOut(self, snapshot, tasklist_entities, updated_min):
+    """Enqueues one /worker/snapshot/tasklist task per tasklist.
+
+    Args:
+      snapshot: the snapshot entity the tasks are stored under.
+      tasklist_entities: the TaskList entities whose tasks should be stored.
+      updated_min: the dict returned by ChooseBase.
+    """
+    queue = taskqueue.Queue()
+    tasks = []
+    for tasklist in tasklist_entities:
+      params = {"id": snapshot.key().id(), "tasklist": tasklist.id}
+      if tasklist.id in updated_min:
+        params["updatedMin"] = updated_min[tasklist.id]
+      tasks.append(taskqueue.Task(url="/worker/snapshot/tasklist",
+                                  params=params))
+    for i in range(0, len(tasks), MAX_TASKS_PER_ADD):
+      queue.add(tasks[i:i + MAX_TASKS_PER_ADD])
+
+
+class SnapshotTasklistWorker(webapp.RequestHandler):
+  """Handler for /worker/snapshot/tasklist."""
+
+  def post(self):
+    """Handles POST requests for /worker/snapshot/tasklist.
+
+    This handler takes the following query parameters:
+      id: the internal id serving as key for the snapshot being built.
+      tasklist: the id of the tasklist whose tasks should be stored.
+      updatedMin: if present, only the tasks changed since this time are
+        stored.
+    """
+    snapshot = model.Snapshot.gql("WHERE __key__ = KEY('Snapshot', :key)",
+                                  key=int(self.request.get("id"))).get()
+    if snapshot is None or snapshot.status != "building":
+      # another tasklist of the snapshot failed or the snapshot was deleted.
+      return
+    user = snapshot.user
+    storage = appengine.CachedStorageByKeyName(
+        model.Credentials, user.user_id(), "credentials")
+    credentials = storage.get()
+
+    if credentials is None or credentials.invalid == True:
+      snapshot.status = "error"
+      snapshot.errorMessage = "Must be logged in to create snapshot."
+      snapshot.put()
+    else:
+      retry_policy = apihttp.RetryPolicy(budget=API_RETRY_BUDGET)
+      rate_limiter = _RateLimiter(user)
+      try:
+        http = responsecache.Http(user)
+        http = credentials.authorize(http)
+        service = discovery.build(
+            "tasks", "v1", http, model=apimodel.JsonModel(lazy_items=True),
+            requestBuilder=apihttp.request_builder(retry_policy, rate_limiter),
+            offline=OFFLINE_DISCOVERY)
+        tasklist = model.TaskList.get_by_key_name(self.request.get("tasklist"),
+                                                  parent=snapshot)
+        tasks = service.tasks()
+        parser = _TasksParser(snapshot, tasklist, tasks,
+                              apifetch.Fetcher(credentials), PREFETCH_PAGES,
+                              self.request.get("updatedMin"))
+        parser.ParseAndStore(tasks.list(**parser.args).execute())
+        _RecordCompletion(snapshot, tasklist.id, parser.entities_written,
+                          parser.bytes_written)
+      except client.AccessTokenRefreshError, e:
+        credcache.Invalidate(user.user_id())
+        storage.invalidate()
         snapshot.status = "error"
         snapshot.errorMessage = "OAuth credentials were revoked."
         logging.info(e, exc_info=True)
         snapshot.put()
       except Exception, e:
+        if _ShouldRetry(self.request, e):
+          # the task queue retries the task, which stores the whole tasklist
+          # again.  Its tasks are stored under the same keys and the tasklist
+          # is only counted by _RecordCompletion once it is complete.
+          logging.warning(e, exc_info=True)
+          self.error(500)
+          return
         snapshot.status = "error"
         snapshot.errorMessage = "Snapshot creation process failed unexpectedly."
         logging.error(e, exc_info=True)
         snapshot.put()
+      finally:
+        logging.info("Tasks API retries: %r", retry_policy.counters)
+        logging.info("Tasks API pacing: %r", rate_limiter.counters)
+        responsecache.LogStats()
+
+
+def _UpdateDeltaDepths(snapshot):
+  """Recomputes the deltaDepth of every delta stored over snapshot.
+
+  Args:
+    snapshot: a Snapshot entity whose deltaDepth has just changed.
+  """
+  bases = [snapshot]
+  while bases:
+    base = bases.pop()
+    deltas = list(base.deltas)
+    for delta in deltas:
+      delta.deltaDepth = base.deltaDepth + 1
+    if deltas:
+      db.put(deltas)
+    bases.extend(deltas)
+
+
+def _TasksParser(snapshot, tasklist, tasks, fetcher, prefetch, updated_min):
+  """Creates the Parser which stores the tasks of a tasklist.
+
+  Args:
+    snapshot: the snapshot entity the tasks are stored under.
+    tasklist: the TaskList entity whose tasks should be stored.
+    tasks: the tasks resource of the Tasks API service object.
+    fetcher: the apifetch.Fetcher used to request further pages.
+    prefetch: the number of pages to request ahead.
+    updated_min: if not empty, only the tasks changed since this RFC 3339
+      timestamp are stored, including tasks which have been deleted.
+
+  Returns:
+    The new apiparse.Parser, which is a packedstore.Packer if the snapshot is
+    packed.  Its args are the arguments of the tasks.list request for the
+    first page.
+  """
+  args = {"tasklist": tasklist.id, "showHidden": True}
+  if updated_min:
+    args["updatedMin"] = updated_min
+    args["showDeleted"] = True
+  if snapshot.storage == "packed":
+    # the stream keeps the tasks whole, so no fields are left out.
+    return packedstore.Packer(snapshot, tasklist, tasks.list, fetcher=fetcher,
+                              prefetch=prefetch, **args)
+  return apiparse.Parser(model.Task, tasklist, snapshot, tasks.list, model,
+                         batch_size=PUT_BATCH_SIZE, fetcher=fetcher,
+                         prefetch=prefetch, partial=True, **args)
+
+
+def _UpdatedMin(base, base_ids):
+  """Returns the updatedMin parameters of a snapshot stored over base.
+
+  Args:
+    base: the Snapshot entity the snapshot is stored as a delta over.
+    base_ids: the ids of the tasklists stored in base.
+
+  Returns:
+    A dict from each of base_ids to the RFC 3339 timestamp of base.
+  """
+  updated_min = base.timestamp.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+  return dict([(tasklist_id, updated_min) for tasklist_id in base_ids])
+
+
+def _Checkpointer(snapshot, index):
+  """Creates the checkpoint function of the Parser of a tasklist.
+
+  Args:
+    snapshot: the snapshot entity being built.
+    index: the index of the tasklist in the sorted tasklists of snapshot.
+
+  Returns:
+    A function which records on snapshot that a page of the tasklist has been
+    stored.
+  """
+  def Checkpoint(api_data, written, size):
+    if "nextPageToken" in api_data:
+      snapshot.checkpointTasklist = index
+      snapshot.checkpointPageToken = api_data["nextPageToken"]
+    else:
+      snapshot.checkpointTasklist = index + 1
+      snapshot.checkpointPageToken = None
+    snapshot.checkpointTasks += written
+    snapshot.byteSize += size
+    snapshot.put()
+  return Checkpoint
+
+
+def _RateLimiter(user):
+  """Creates the RateLimiter pacing the Tasks API requests made for a user."""
+  return ratelimit.RateLimiter([
+      ratelimit.bucket("user:" + user.user_id(), USER_API_RATE),
+      ratelimit.bucket("project", PROJECT_API_RATE)])
+
+
+def _ExecuteBatches(requests, batch_size):
+  """Executes requests with batch requests of at most batch_size parts.
+
+  Args:
+    requests: a list of apiclient.http.HttpRequest objects.
+    batch_size: the maximum number of requests sent in one batch request.
+
+  Raises:
+    apiclient.errors.HttpError: if any of the requests failed.
+
+  Returns:
+    The list of the deserialized responses, in the order of requests.
+  """
+  results = {}
+  def Callback(request_id, response, exception):
+    if exception is not None:
+      raise exception
+    results[int(request_id)] = response
+
+  for start in range(0, len(requests), batch_size):
+    batch = apihttp.BatchHttpRequest(callback=Callback)
+    for index in range(start, min(start + batch_size, len(requests))):
+      batch.add(requests[index], request_id=str(index))
+    batch.execute()
+  return [results[index] for index in range(len(requests))]
+
+
+def _TaskCount(snapshot, stored):
+  """Returns the number of tasks of a snapshot which has been stored.
+
+  Args:
+    snapshot: the snapshot entity being built.
+    stored: the number of tasks stored under the snapshot itself.
+
+  Returns:
+    stored, or the number of tasks of the whole chain of bases for an
+    incremental snapshot.
+  """
+  if model.Snapshot.baseSnapshot.get_value_for_datastore(snapshot) is None:
+    return stored
+  return snapshotview.CountTasks(snapshot)
+
+
+def _ShouldRetry(request, e):
+  """Decides whether a failed snapshot task should be retried.
+
+  Args:
+    request: the webapp.Request of the task.
+    e: the exception which made the task fail.
+
+  Returns:
+    True if e is a transient error and the task has retries left.
+  """
+  retries = int(request.headers.get("X-AppEngine-TaskRetryCount", 0))
+  if retries >= MAX_TASK_RETRIES:
+    return False
+  if isinstance(e, errors.HttpError):
+    return e.resp.status >= 500
+  return isinstance(e, (urlfetch_errors.Error, db.Timeout, db.InternalError))
+
+
+def _StoreCopies(snapshot_key, copies, copied_bytes):
+  """Stores copies under a snapshot and adds their size to its byteSize.
+
+  Must run in a transaction, which the copies are part of since they are
+  stored under the snapshot.
+
+  Args:
+    snapshot_key: the key of the Snapshot entity the copies are stored under.
+    copies: the unsaved copies made by _CopyEntity.
+    copied_bytes: the size of the copies as reported by apiparse.EncodedSize.
+  """
+  snapshot = db.get(snapshot_key)
+  if snapshot.byteSize is not None:
+    snapshot.byteSize += copied_bytes
+  db.put(copies + [snapshot])
+
+
+def _CopyEntity(entity, old_snapshot, new_snapshot):
+  """Copies an entity from one snapshot into another.
+
+  Keys of entities in old_snapshot held by the entity are replaced with the
+  keys of the entities with the same path in new_snapshot.
+
+  Args:
+    entity: the entity to copy.
+    old_snapshot: the Snapshot entity the entity is stored under.
+    new_snapshot: the Snapshot entity to store the copy under.
+
+  Returns:
+    The unsaved copy.
+  """
+  values = {}
+  for prop_name, prop in entity.properties().items():
+    value = prop.get_value_for_datastore(entity)
+    if (isinstance(value, db.Key) and value.parent() is not None and
+        value.parent() == old_snapshot.key()):
+      value = db.Key.from_path(value.kind(), value.id_or_name(),
+                               parent=new_snapshot.key())
+    values[prop_name] = value
+  return type(entity)(parent=new_snapshot, key_name=entity.key().name(),
+                      **values)
+
+
+def _ShardKeys(snapshot):
+  """Returns the keys of all completion counter shards of a snapshot."""
+  return [db.Key.from_path(model.SnapshotShard.kind(),
+                           "%d-%d" % (snapshot.key().id(), i))
+          for i in range(COMPLETION_SHARDS)]
+
+
+def _RecordCompletion(snapshot, tasklist_id, task_count, byte_size):
+  """Records that a tasklist of a fanned-out snapshot has been stored.
+
+  The tasklist is added to one shard of the completion counter.  Recording the
+  same tasklist twice, for example when a task is retried, has no effect.  Once
+  every tasklist has been recorded the snapshot is marked as completed.
+
+  Args:
+    snapshot: the snapshot entity being built.
+    tasklist_id: the id of the tasklist whose tasks have been stored.
+    task_count: the number of tasks stored for the tasklist.
+    byte_size: the size in bytes of the tasks stored for the tasklist.
+  """
+  shard_key = _ShardKeys(snapshot)[zlib.crc32(tasklist_id) % COMPLETION_SHARDS]
+
+  def AddToShard():
+    shard = model.SnapshotShard.get(shard_key)
+    if shard is None:
+      shard = model.SnapshotShard(key=shard_key)
+    if tasklist_id not in shard.tasklists:
+      shard.tasklists.append(tasklist_id)
+      shard.taskCount += task_count
+      shard.byteSize += byte_size
+      shard.put()
+
+  db.run_in_transaction(AddToShard)
+
+  done = 0
+  stored = 0
+  size = 0
+  for shard in db.get(_ShardKeys(snapshot)):
+    if shard is not None:
+      done += len(shard.tasklists)
+      stored += shard.taskCount
+      size += shard.byteSize
+  if done < snapshot.tasklistCount:
+    return
+  total = _TaskCount(snapshot, stored)
+
+  def Complete():
+    current = model.Snapshot.get(snapshot.key())
+    if current.status == "building":
+      current.status = "completed"
+      current.taskCount = total
+      current.byteSize = size
+      current.put()
+
+  db.run_in_transaction(Complete)
 
 
 class ImportWorker(webapp.RequestHandler):
@@ -132,18 +770,24 @@ class ImportWorker(webapp.RequestHandler):
     snapshot = model.Snapshot.gql("WHERE __key__ = KEY('Snapshot', :key)",
                                   key=int(self.request.get("id"))).get()
     user = snapshot.user
-    credentials = appengine.StorageByKeyName(
-        model.Credentials, user.user_id(), "credentials").get()
+    storage = appengine.CachedStorageByKeyName(
+        model.Credentials, user.user_id(), "credentials")
+    credentials = storage.get()
 
     if credentials is None or credentials.invalid == True:
       snapshot.status = "error"
       snapshot.errorMessage = "Must be logged in to create snapshot."
       snapshot.put()
     else:
+      retry_policy = apihttp.RetryPolicy(budget=API_RETRY_BUDGET)
+      rate_limiter = _RateLimiter(user)
       try:
-        http = httplib2.Http()
+        http = responsecache.Http(user)
         http = credentials.authorize(http)
-        service = discovery.build("tasks", "v1", http)
+        service = discovery.build(
+            "tasks", "v1", http,
+            requestBuilder=apihttp.request_builder(retry_policy, rate_limiter),
+            offline=OFFLINE_DISCOVERY)
 
         tasklist = model.TaskList(parent=snapshot)
         tasklist.title = self.request.get("name")
@@ -180,9 +824,15 @@ class ImportWorker(webapp.RequestHandler):
         uploader = apiupload.Uploader(tasks.insert, tasklist=tasklist_id,
                                       previous=apiupload.PREVIOUS_ARGUMENT)
         uploader.Upload(tasks_list)
+        snapshot.tasklistCount = 1
+        snapshot.taskCount = len(tasks_list)
+        snapshot.byteSize = sum([apiparse.EncodedSize(task)
+                                 for task in tasks_list])
         snapshot.status = "completed"
         snapshot.put()
       except client.AccessTokenRefreshError, e:
+        credcache.Invalidate(user.user_id())
+        storage.invalidate()
         snapshot.status = "error"
         snapshot.errorMessage = "OAuth credentials were revoked."
         logging.info(e, exc_info=True)
@@ -192,6 +842,42 @@ class ImportWorker(webapp.RequestHandler):
         snapshot.errorMessage = "Snapshot creation process failed unexpectedly."
         logging.error(e, exc_info=True)
         snapshot.put()
+      finally:
+        logging.info("Tasks API retries: %r", retry_policy.counters)
+        logging.info("Tasks API pacing: %r", rate_limiter.counters)
+        responsecache.LogStats()
+
+
+class BackfillWorker(webapp.RequestHandler):
+  """Handler for /worker/backfill."""
+
+  def get(self):
+    """Handles GET requests for /worker/backfill by starting the backfill."""
+    taskqueue.add(url="/worker/backfill")
+    self.response.out.write("Backfill started.")
+
+  def post(self):
+    """Handles POST requests for /worker/backfill.
+
+    Computes the totals of completed snapshots stored before Snapshot had
+    them, BACKFILL_BATCH_SIZE snapshots per task.
+
+    This handler takes the following query parameters:
+      cursor: if present, the query cursor to continue the backfill from.
+    """
+    query = model.Snapshot.all()
+    if self.request.get("cursor"):
+      query.with_cursor(self.request.get("cursor"))
+    snapshots = query.fetch(BACKFILL_BATCH_SIZE)
+    for snapshot in snapshots:
+      if snapshot.status != "completed" or snapshot.taskCount is not None:
+        continue
+      (snapshot.taskCount, snapshot.tasklistCount,
+       snapshot.byteSize) = snapshotview.Measure(snapshot)
+      snapshot.put()
+    if len(snapshots) == BACKFILL_BATCH_SIZE:
+      taskqueue.add(url="/worker/backfill",
+                    params={"cursor": query.cursor()})
 
 
 def main():
@@ -199,9 +885,11 @@ def main():
       'urlfetch_timeout_hook', urlfetch_timeout_hook, 'urlfetch')
   application = webapp.WSGIApplication(
       [
+          ("/worker/backfill", BackfillWorker),
           ("/worker/delete", DeleteWorker),
           ("/worker/import", ImportWorker),
           ("/worker/snapshot", SnapshotWorker),
+          ("/worker/snapshot/tasklist", SnapshotTasklistWorker),
       ])
   util.run_wsgi_app(application)
 